@@ -13,10 +13,20 @@ from rich.panel import Panel
 import humanize
 from datetime import datetime
 from utils import PcapGenerator
+from metrics import MetricsExporter
+from status_screen import StatusScreen
+from timeline import TimelineWriter
+from crash_buckets import CrashBuckets
+from auto_extras import AutoExtras
+import splitters
+from state_model import StateModel
+from prefix_cache import PrefixCache
+from scheduler import SeedScheduler
 from enum import Enum, auto
 import time
 import utils
 import signal
+import resource
 from line_profiler import LineProfiler,profile
 import random
 import copy,os
@@ -44,7 +54,9 @@ class Stats:
         self.last_hang_time = 0
 
         self.total_crashes = 0
-        self.unique_crashs = 0
+        self.unique_crashes = 0
+        self.last_crash_time = 0
+        self.last_crash_execs = 0
 
         self.unique_favors = 0
         self.queue_len = 0
@@ -52,10 +64,16 @@ class Stats:
         self.favor_paths = 0
         self.total_exec = 0
         self.stage_name = 0
+        self.stage_finds = {}   # stage_name -> 新路径数
+        self.stage_cycles = {}  # stage_name -> 执行次数
 
         self.queued_with_cov = 0
         self.current_queued_with_cov = 0
 
+        self.last_path_time = 0
+        self.max_depth = 0
+        self.variable_paths = 0
+
 
         self.queue_cycle = 0
 
@@ -85,6 +103,10 @@ class TestCase:
         self.trace_mini_hash = 0 # for favor path selection
 
         self.handicap = 0
+        self.fuzz_level = 0   # 被选中做 havoc 的次数（功率调度用）
+        self.passed_det = 0   # 是否所有消息都已做过确定性阶段
+        self.det_done = set() # 已做过确定性阶段的消息下标
+        self.state_first = {} # 状态 id -> 第一次到达该状态的消息下标（见 StateModel）
 
 
 
@@ -112,8 +134,9 @@ class Mutator:
         self._rng = random.Random(12138)
         
         
-        self.extras = extras or []      # 用户指定的 extras
-        self.a_extras = []  # 自动检测的 extras
+        self.extras = extras or utils.ExtrasStore()      # 用户指定的 extras
+        self.a_extras = utils.ExtrasStore()  # 自动检测的 extras
+        self.used_extras = []  # 本轮变异用到的 extras，产生新路径时累加 hit
         
         self.INTERESTING_8 = [-128, -1, 0, 1, 16, 32, 64, 100, 127]
         self.INTERESTING_16 = [-32768, -129, 128, 255, 256, 512, 1000, 1024, 4096, 32767]
@@ -149,9 +172,12 @@ class Mutator:
             20: self.duplicate_region
         }
         msg = messages[msg_idx]
-        # 根据 AFL 的概率分布选择变异方法
-        choice = random.randint(0, 15 + 2 + (4 if self.region_level_mutation else 0))
-        choice = 0
+        # 根据 AFL 的概率分布选择变异方法：有 extras（用户或自动字典）时才加入 15 / 16 两种 extras 变异，
+        # 按消息的变异（17 ~ 20）只在 region_level_mutation 打开时参与
+        n = 15 + (2 if self.extras or self.a_extras else 0)
+        choice = random.randrange(n + (4 if self.region_level_mutation else 0))
+        if choice >= n:
+            choice += 17 - n
         # print(msg)
         if choice in mutation_funcs:
             if choice <= 16:
@@ -174,6 +200,8 @@ class Mutator:
 
     def flip_single_bit(self, msg: bytearray) -> None:
         """翻转单个比特位"""
+        if not msg:
+            return
 
         bit_pos = random.randint(0, len(msg) * 8 - 1)
         byte_pos = bit_pos // 8
@@ -369,8 +397,8 @@ class Mutator:
         if len(data) >= max_size:  # 超过最大限制则不操作
             return
 
-        # 决定是克隆(75%)还是插入新块(25%)
-        actually_clone = self._rng.random() < 0.75
+        # 决定是克隆(75%)还是插入新块(25%)，空消息只能插入
+        actually_clone = len(data) > 0 and self._rng.random() < 0.75
 
         if actually_clone:
             # 克隆现有数据块
@@ -430,23 +458,27 @@ class Mutator:
                         else data[self._rng.randint(0, len(data) - 1)])
             data[copy_to:copy_to+copy_len] = bytes([fill_byte] * copy_len)
 
+    def _pick_extras(self) -> utils.ExtrasStore:
+        """ 决定使用哪个 extras 列表 """
+        if not self.extras:
+            return self.a_extras
+        if self.a_extras and self._rng.random() < 0.5:
+            return self.a_extras
+        return self.extras
+
     def overwrite_with_extra(self, msg: bytearray) -> None:
         """ 用 extras 中的某个条目覆盖 msg 中的部分内容 """
         if not self.extras and not self.a_extras:
             return  # 没有 extras 可用
 
-        # 决定使用哪个 extras 列表
-        use_a_extras = not self.extras or (self.a_extras and self._rng.random() < 0.5)
-
-        extra_list = self.a_extras if use_a_extras else self.extras
-        extra = self._rng.choice(extra_list)
-        extra_len = extra.len
-
-        if extra_len > len(msg):
-            return  # extra 太长，无法插入
+        # 只在能放进 msg 的条目中抽取
+        extra = self._pick_extras().choose(self._rng, len(msg))
+        if extra is None:
+            return
 
-        insert_at = self._rng.randint(0, len(msg) - extra_len)
-        msg[insert_at:insert_at + extra_len] = extra.data
+        insert_at = self._rng.randint(0, len(msg) - extra.len)
+        msg[insert_at:insert_at + extra.len] = extra.data
+        self.used_extras.append(extra)
 
     def insert_with_extra(self, msg: bytearray) -> None:
         """ 向 msg 中插入 extras 中的某个条目 """
@@ -454,18 +486,13 @@ class Mutator:
         if not self.extras and not self.a_extras:
             return  # 没有 extras 可用
 
-        # 决定使用哪个 extras 列表
-        use_a_extras = not self.extras or (self.a_extras and self._rng.random() < 0.5)
-
-        extra_list = self.a_extras if use_a_extras else self.extras
-        extra = self._rng.choice(extra_list)
-        extra_len = extra.len
-
-        if len(msg) + extra_len >= MAX_FILE:
+        extra = self._pick_extras().choose(self._rng, MAX_FILE - 1 - len(msg))
+        if extra is None:
             return  # 超出最大长度限制
 
         insert_at = self._rng.randint(0, len(msg))
         msg[insert_at:insert_at] = extra.data  # 插入操作
+        self.used_extras.append(extra)
 
     def overwrite_with_region(self,messages:List[bytearray], msg_idx:int)->None:
         while True:
@@ -529,6 +556,8 @@ class Fuzzer():
         
         self.exec_tmout = pyafl.get_exec_tmout()
         self.hang_tmout = 1000
+        # udp:// 上每个数据报是一条消息，部分协议（DNS）的切分方式不同
+        self.datagram = self.config['use_net'].startswith("udp://")
 
         # 初始化test_cases列表
         self.init_test_cases: List[TestCase] = []
@@ -537,6 +566,11 @@ class Fuzzer():
 
         self.init_out_dir()
         self.mutator = Mutator(extras = utils.load_extras_file(self.config['extra']) if 'extra' in self.config else None)
+        # 自动字典，从上次运行保存的 output_dir/auto_extras 开始
+        self.auto_extras = AutoExtras(os.path.join(self.config['output_dir'],'auto_extras'), self.mutator.extras)
+        self.refresh_auto_extras()
+        self.last_responses = []
+        self.last_from_snapshot = False  # 上一次执行是否由前缀快照完成
         
         self.running = True
         signal.signal(signal.SIGINT, self.handle_interrupt)
@@ -562,6 +596,22 @@ class Fuzzer():
         self.HAVOC_MIN = 16 # min havoc times
         self.HAVOC_CYCLES_INIT = 1024
 
+        # AFLFast 功率调度（"schedule": "fast" / "coe" / "explore" / "exploit"），未配置时沿用 AFL 默认能量
+        self.schedule = self.config.get('schedule', '').lower() or None
+        self.POWER_BETA = 1
+        self.MAX_FACTOR = self.POWER_BETA * 32
+        # coe 用到的队列平均执行次数，同 AFLFast 每轮队列只计算一次
+        self.fuzz_mu = 0
+        self.fuzz_mu_cycle = -1
+
+        # trim 参数，与 config.h 一致
+        self.TRIM_MIN_BYTES = 4
+        self.TRIM_START_STEPS = 16
+        self.TRIM_END_STEPS = 1024
+
+        # 效应器图中有效字节超过该比例时不再跳过，与 config.h 一致
+        self.EFF_MAX_PERC = 90
+
         self.total_cal_us = 0
         self.cal_cycles = 0
         self.total_bitmap_size = 0
@@ -574,8 +624,43 @@ class Fuzzer():
         self.lcg = DynamicLCG()
         # 是否启用splice 变异
         self.splice = False
+
+        # 基于响应码的协议状态模型，"state_aware": "True" 时按状态选择种子和变异窗口
+        self.state_aware = self.config.get('state_aware') == "True"
+        self.state_model = StateModel()
+        self.target_state = None
+
+        # 按权重选择种子（"scheduler": "weighted"），不配置时按队列顺序轮转
+        self.scheduler = SeedScheduler() if self.config.get('scheduler') == "weighted" else None
+
+        # 会话前缀快照（"prefix_cache": "<快照个数>"，需要 AFL_PRELOAD=libprefixfork.so）；
+        # desock:// 目标没有可以重连的端口，不支持快照
+        prefix_cache = int(self.config.get('prefix_cache', 0))
+        if self.config['dumb_mode'] == "True" or self.config['use_net'].startswith("desock://"):
+            prefix_cache = 0
+        self.prefix_cache = PrefixCache(prefix_cache)
+        self.prefix = None
+
+        # 一次发出整个会话（"batch_send": "True"）：UDP 用 sendmmsg，TCP 用 writev，
+        # 此时所有响应合并为一条，不再区分是哪条消息的响应
+        self.batch_send = self.config.get('batch_send') == "True"
         # self.splice = True
 
+        # fuzzer_stats / plot_data 的刷新间隔（秒），与 config.h 一致
+        self.STATS_UPDATE_SEC = 60
+        self.PLOT_UPDATE_SEC = 5
+
+        self.start_time = time.time()
+        self.last_stats_time = 0
+        self.last_plot_time = 0
+        self.last_plot_exec = 0
+        self.last_eps = 0.0
+
+        # 可选的 Prometheus 指标服务，例如 "tcp://127.0.0.1/9100" 或 "unix:///tmp/pyafl.sock"
+        self.metrics_exporter = MetricsExporter(self, self.config['metrics']) if 'metrics' in self.config else None
+        # 可选的实时状态界面，在独立线程中渲染
+        self.status_screen = StatusScreen(self) if self.config.get('status_screen') == "True" else None
+
 
     def init_out_dir(self):
         out_parent_dir = self.config['output_dir']
@@ -591,6 +676,19 @@ class Fuzzer():
         os.makedirs(self.queue_dir,exist_ok=True)
         os.makedirs(self.origin_queue_dir,exist_ok=True)
 
+        # AFL 兼容的统计文件，供 afl-whatsup / afl-plot 读取
+        self.stats_file_path = os.path.join(out_parent_dir,'fuzzer_stats')
+        self.plot_file = open(os.path.join(out_parent_dir,'plot_data'),'w')
+        self.plot_file.write("# unix_time, cycles_done, cur_path, paths_total, "
+                             "pending_total, pending_favs, map_size, unique_crashes, "
+                             "unique_hangs, max_depth, execs_per_sec\n")
+        self.plot_file.flush()
+
+        # 边覆盖时间线，用 timeline.py 离线生成覆盖率曲线
+        self.timeline = TimelineWriter(os.path.join(out_parent_dir,'edge_timeline'), pyafl.map_size())
+        # 崩溃分桶索引
+        self.crash_buckets = CrashBuckets(os.path.join(out_parent_dir,'crash_index.json'))
+
 
         
     def __get_test_cases_from_dir(self) -> None:
@@ -613,14 +711,8 @@ class Fuzzer():
             with open(file_path, 'rb') as f:
                 file_content = f.read()
             
-            # 根据协议类型提取消息
-            if self.config['protocol'] == "TLS":
-                messages = utils.extract_requests_tls(file_content)
-                ### for test
-                # messages = [bytes(100) for _ in range(5)] 
-            else:
-                # 其他协议的处理可以在这里扩展
-                messages = [bytearray(file_content)]  # 默认整个文件作为一个消息
+            # 根据协议类型提取消息（未知协议整个文件作为一个消息）
+            messages = splitters.split_messages(self.config['protocol'], file_content, self.datagram)
             
             # 保存到test_cases列表
             self.init_test_cases.append(TestCase(file_path,messages))
@@ -734,7 +826,7 @@ class Fuzzer():
         msg_table.add_column("内容预览", style="dim")
         
         for i, msg in enumerate(case.messages, 1):
-            msg_type = "TLS" if self.config['protocol'] == "TLS" else "RAW"
+            msg_type = self.config['protocol'] if self.config['protocol'] in splitters.SPLITTERS else "RAW"
             preview = msg[:16].hex(' ') + ("..." if len(msg) > 16 else "")
             msg_table.add_row(
                 str(i),
@@ -786,20 +878,32 @@ class Fuzzer():
 
 
 
-    def run_target_fast(self, messages, timeout):
+    def run_target_fast(self, messages, timeout, prefix=None):
 
         self.stats.total_exec += 1
 
+        # 从快照执行时 trace 只含前缀之后的部分，与完整会话的 trace_hash32 不同
+        self.last_from_snapshot = False
+        if prefix is not None:
+            result = self.prefix_cache.run(prefix, messages, timeout)
+            if result is not None:
+                fault, self.last_responses = result
+                self.last_from_snapshot = True
+                return fault
+
         response = []
 
         pyafl.pre_run_target(timeout)
         response.append(pyafl.get_response_buff())
     
-        for msg in messages:
-            pyafl.run_target(bytes(msg))
+        if self.batch_send:
+            pyafl.run_target_batch(messages)
             response.append(pyafl.get_response_buff())
+        else:
+            response.extend(pyafl.run_session(messages))
 
         fault = pyafl.post_run_target(timeout)
+        self.last_responses = response
 
         return fault
 
@@ -833,6 +937,8 @@ class Fuzzer():
         first_trace = None
         fault = FaultCode.NONE
 
+        # 同 afl-fuzz，校准结束后恢复阶段名，新用例仍记在发现它的阶段上
+        old_stage_name = self.stats.stage_name
         self.stats.stage_name = "calibration"
 
         start_time_us = utils.get_cur_time_us()
@@ -844,24 +950,42 @@ class Fuzzer():
 
             if not i and not pyafl.trace_bytes_count():
                 fault = FaultCode.NOINST
+                self.stats.stage_name = old_stage_name
                 return fault
 
             cksum = pyafl.trace_hash32()
 
+            # 重新校准（如 trim 之后）时 first_trace 还是上一个校准的用例的，
+            # 同 AFL，先换成这个用例本次第一轮执行的 trace 再比较
+            if not i and not first_run:
+                pyafl.save_first_trace()
+
             if test_case.cksum != cksum:
 
                 # 如果test_case.cksum有值且和这次运行不相等，说明两次运行代码覆盖不一致
                 if test_case.cksum:
+                    # 记录发生变化的 bitmap 字节，用于计算 stability
+                    pyafl.update_var_bytes()
+                    if not test_case.var_behavior:
+                        self.stats.variable_paths += 1
                     test_case.var_behavior = 1
 
                 
                 # 说明是第一次运行
                 else:
                     test_case.cksum = cksum
+                    pyafl.save_first_trace()
 
   
         stop_time_us = utils.get_cur_time_us()
 
+        if not first_run:
+            # 去掉这个用例上一次校准计入平均值的部分
+            self.total_cal_us -= test_case.exec_us * stage_max
+            self.cal_cycles -= stage_max
+            self.total_bitmap_size -= test_case.bitmap_size
+            self.total_bitmap_entries -= 1
+
         self.total_cal_us += stop_time_us - start_time_us
         self.cal_cycles += stage_max
 
@@ -879,11 +1003,238 @@ class Fuzzer():
         self.total_bitmap_size += test_case.bitmap_size
         self.total_bitmap_entries += 1
 
-
+        self.stats.stage_name = old_stage_name
 
         return fault
 
 
+    def _trim_run(self, messages, cksum):
+        """trim 阶段执行一次，返回 trace 是否不变"""
+        fault = self.run_target_fast(messages, self.exec_tmout)
+        self.stats.stage_cycles["trim"] = self.stats.stage_cycles.get("trim", 0) + 1
+        return fault == FaultCode.NONE.value and pyafl.trace_hash32() == cksum
+
+    def trim_case(self, test_case:TestCase):
+        """
+        每个用例只做一次的 trim 阶段：
+        先尝试整条删除消息，再在每条消息内按 2 的幂大小的块删除字节（同 AFL trim_case），
+        只有 trace_hash32 不变时才保留修改。
+        """
+        test_case.trim_done = 1
+        self.stats.stage_name = "trim"
+
+        messages = test_case.messages
+        fault = self.run_target_fast(messages, self.exec_tmout)
+        if fault != FaultCode.NONE.value:
+            return
+        cksum = pyafl.trace_hash32()
+        changed = False
+
+        # 1. 整条删除消息，从后往前，至少保留一条
+        idx = len(messages) - 1
+        while idx >= 0 and len(messages) > 1:
+            candidate = messages[:idx] + messages[idx + 1:]
+            if self._trim_run(candidate, cksum):
+                messages = candidate
+                changed = True
+            idx -= 1
+
+        # 2. 消息内按块删除字节
+        for idx in range(len(messages)):
+            msg = messages[idx]
+            len_p2 = 1 << max(len(msg) - 1, 0).bit_length()
+            remove_len = max(len_p2 // self.TRIM_START_STEPS, self.TRIM_MIN_BYTES)
+
+            while remove_len >= max(len_p2 // self.TRIM_END_STEPS, self.TRIM_MIN_BYTES):
+                remove_pos = remove_len
+                while remove_pos < len(msg):
+                    trim_avail = min(remove_len, len(msg) - remove_pos)
+                    candidate_msg = msg[:remove_pos] + msg[remove_pos + trim_avail:]
+                    candidate = messages[:idx] + [candidate_msg] + messages[idx + 1:]
+                    if self._trim_run(candidate, cksum):
+                        msg = candidate_msg
+                        messages = candidate
+                        len_p2 = 1 << max(len(msg) - 1, 0).bit_length()
+                        changed = True
+                    else:
+                        remove_pos += remove_len
+                remove_len >>= 1
+
+        if not changed:
+            return
+
+        test_case.messages = messages
+        test_case.messages_len = len(messages)
+        # 旧消息上建立的前缀快照不再对应这个用例
+        self.prefix_cache.drop(test_case)
+        # 单次执行的耗时波动大，重新校准得到平均的 exec_us 再参与 top_rated 比较
+        self.calibrate_case(test_case, test_case.handicap)
+        # 消息下标变了，按校准时的状态序列重新索引
+        self.state_model.add(test_case, pyafl.state_seq())
+        # 只改写 queue 中的 .raw 文件，输入目录里的种子保持原样
+        if test_case.file_path and os.path.dirname(test_case.file_path) == self.queue_dir:
+            self.save_interesting_test_case(messages, test_case.file_path)
+            test_case.file_len = os.path.getsize(test_case.file_path)
+
+        # 执行更快的用例可能成为新的 top_rated
+        self.cull_queue(test_case)
+        if self.scheduler:
+            self.update_weight(test_case)
+
+    def deterministic_stage(self, test_case:TestCase, start:int, end:int):
+        """
+        确定性阶段（同 afl-fuzz fuzz_one 的 bitflip / arith / interesting），只作用于消息窗口 [start, end)，
+        每条消息只做一次（test_case.det_done）。
+        """
+        todo = [idx for idx in range(start, end) if idx not in test_case.det_done]
+        test_case.det_done.update(todo)
+        if len(test_case.det_done) >= len(test_case.messages):
+            test_case.passed_det = 1
+
+        todo = [idx for idx in todo if test_case.messages[idx]]
+        if not todo:
+            return
+        if self.run_target_fast(test_case.messages, self.exec_tmout) != FaultCode.NONE.value:
+            return
+        orig_cksum = pyafl.trace_hash32()
+
+        messages = copy.deepcopy(test_case.messages)
+        for idx in todo:
+            if not self.running:
+                return
+            eff = self._det_walking_byte(messages, idx, orig_cksum)
+            self._det_bitflip(messages, idx, eff)
+            self._det_arith(messages, idx, eff)
+            self._det_interest(messages, idx, eff)
+
+    def _det_walking_byte(self, messages, idx, orig_cksum):
+        """
+        逐字节取反（flip8），同时建立效应器图：取反后覆盖率不变的字节在之后的阶段中跳过。
+        这一遍还顺带收集自动字典：覆盖率以相同方式变化、且不同于原始覆盖的连续字节视为一个 token。
+        """
+        msg = messages[idx]
+        self.stats.stage_name = "flip8"
+
+        eff = bytearray(len(msg))
+        eff[0] = eff[-1] = 1
+        prev_cksum = orig_cksum
+        collect = bytearray()
+
+        for pos in range(len(msg)):
+            msg[pos] ^= 0xFF
+            self.common_fuzz_stuff(messages)
+            cksum = pyafl.trace_hash32()
+            msg[pos] ^= 0xFF
+
+            if cksum != orig_cksum:
+                eff[pos] = 1
+            if cksum != prev_cksum:
+                self.auto_extras.maybe_add(collect)
+                collect = bytearray()
+                prev_cksum = cksum
+            if cksum != orig_cksum:
+                collect.append(msg[pos])
+
+        self.auto_extras.maybe_add(collect)
+
+        # 有效字节超过 EFF_MAX_PERC 时全部标记，省不了多少执行次数
+        if sum(eff) * 100 > self.EFF_MAX_PERC * len(eff):
+            eff = bytearray(b"\x01" * len(eff))
+        return eff
+
+    def _det_bitflip(self, messages, idx, eff):
+        """起点在有效字节上的 1 / 2 / 4 位翻转，以及覆盖有效字节的 2 / 4 字节取反"""
+        msg = messages[idx]
+        bits = len(msg) * 8
+
+        for width, name in ((1, "flip1"), (2, "flip2"), (4, "flip4")):
+            self.stats.stage_name = name
+            for bit in range(bits - width + 1):
+                if not eff[bit >> 3]:
+                    continue
+                for b in range(bit, bit + width):
+                    msg[b >> 3] ^= 128 >> (b & 7)
+                self.common_fuzz_stuff(messages)
+                for b in range(bit, bit + width):
+                    msg[b >> 3] ^= 128 >> (b & 7)
+
+        for width, name in ((2, "flip16"), (4, "flip32")):
+            self.stats.stage_name = name
+            for pos in range(len(msg) - width + 1):
+                if not any(eff[pos:pos + width]):
+                    continue
+                for b in range(pos, pos + width):
+                    msg[b] ^= 0xFF
+                self.common_fuzz_stuff(messages)
+                for b in range(pos, pos + width):
+                    msg[b] ^= 0xFF
+
+    def _det_arith(self, messages, idx, eff):
+        """有效字节上 ±1..ARITH_MAX，多字节时两种字节序都试，跳过 bitflip 已经得到的值"""
+        msg = messages[idx]
+        arith_max = self.mutator.ARITH_MAX
+
+        for width, name in ((1, "arith8"), (2, "arith16"), (4, "arith32")):
+            self.stats.stage_name = name
+            mask = (1 << (8 * width)) - 1
+            # 多字节时只做会进位 / 借位到高位字节的加减，其余的 arith8 已经做过
+            low_mask = 0xFF if width == 2 else 0xFFFF
+
+            for pos in range(len(msg) - width + 1):
+                if not any(eff[pos:pos + width]):
+                    continue
+                orig = bytes(msg[pos:pos + width])
+                orig_le = int.from_bytes(orig, "little")
+
+                for order in ("little", "big") if width > 1 else ("little",):
+                    val = int.from_bytes(orig, order)
+                    for j in range(1, arith_max + 1):
+                        for new, carries in (((val + j) & mask, (val & low_mask) + j > low_mask),
+                                             ((val - j) & mask, (val & low_mask) < j)):
+                            if width > 1 and not carries:
+                                continue
+                            new_bytes = new.to_bytes(width, order)
+                            if pyafl.could_be_bitflip(orig_le ^ int.from_bytes(new_bytes, "little")):
+                                continue
+                            msg[pos:pos + width] = new_bytes
+                            self.common_fuzz_stuff(messages)
+                            msg[pos:pos + width] = orig
+
+    def _det_interest(self, messages, idx, eff):
+        """有效字节上写入 interesting 值，多字节时两种字节序都试，跳过前面阶段已经得到的值"""
+        msg = messages[idx]
+        interesting = {
+            1: self.mutator.INTERESTING_8,
+            2: self.mutator.INTERESTING_8 + self.mutator.INTERESTING_16,
+            4: self.mutator.INTERESTING_8 + self.mutator.INTERESTING_16 + self.mutator.INTERESTING_32,
+        }
+
+        for width, name in ((1, "int8"), (2, "int16"), (4, "int32")):
+            self.stats.stage_name = name
+            mask = (1 << (8 * width)) - 1
+
+            for pos in range(len(msg) - width + 1):
+                if not any(eff[pos:pos + width]):
+                    continue
+                orig = bytes(msg[pos:pos + width])
+                orig_le = int.from_bytes(orig, "little")
+
+                for value in interesting[width]:
+                    le_bytes = (value & mask).to_bytes(width, "little")
+                    candidates = [(le_bytes, 0)]
+                    if width > 1 and le_bytes != le_bytes[::-1]:
+                        candidates.append((le_bytes[::-1], 1))
+
+                    for new_bytes, check_le in candidates:
+                        new = int.from_bytes(new_bytes, "little")
+                        if pyafl.could_be_bitflip(orig_le ^ new) or pyafl.could_be_arith(orig_le, new, width):
+                            continue
+                        if width > 1 and pyafl.could_be_interest(orig_le, new, width, check_le):
+                            continue
+                        msg[pos:pos + width] = new_bytes
+                        self.common_fuzz_stuff(messages)
+                        msg[pos:pos + width] = orig
+
     def cull_queue(self,test_case:TestCase):
         flags = 0
         if test_case.trace_mini_hash not in self.top_rated:
@@ -898,13 +1249,24 @@ class Fuzzer():
             if favor_factor < pre.exec_us * pre.messages_len:
                 self.top_rated[test_case.trace_mini_hash] = test_case
                 flags = 1
+                # 被替换的用例不再 favored（重新校准后 hash 变了的，可能仍是新 key 的 top_rated）
+                if pre.favored and self.top_rated.get(pre.trace_mini_hash) is not pre:
+                    pre.favored = 0
+                    self.stats.favor_paths -= 1
+                    if not pre.was_fuzzed:
+                        self.pending_favored -= 1
+                    if self.scheduler and pre in self.scheduler:
+                        self.update_weight(pre)
         
-        if flags:
+        if flags and not test_case.favored:
             # self.score_changed = 1
             self.stats.favor_paths += 1
             test_case.favored = 1
             if not test_case.was_fuzzed:
                 self.pending_favored += 1
+            # 新发现的用例在加入队列时才计算权重
+            if self.scheduler and test_case in self.scheduler:
+                self.update_weight(test_case)
         
         return flags
             
@@ -918,16 +1280,30 @@ class Fuzzer():
 
     def perform_dry_run(self):
 
-        for test_case in self.init_test_cases:
+        # 校准队列里的副本：之后被选中变异的是它们，cksum（功率调度按它查执行次数）等要记在它们身上
+        for test_case in self.queue[:len(self.init_test_cases)]:
             print(f"Attempting dry run with {test_case.file_path}")
             Fault = self.calibrate_case(test_case,0)
+            self.state_model.add(test_case, pyafl.state_seq())
             if(test_case.var_behavior):
                 print("warning: Instrumentation output varies across runs.")
 
+        if self.scheduler:
+            for test_case in self.queue:
+                self.update_weight(test_case)
+
 
             # test_case.show_status()
     
 
+    def update_weight(self, test_case:TestCase):
+        """加入调度器或重新计算权重"""
+        avg_exec_us = self.total_cal_us / self.cal_cycles if self.cal_cycles else 0
+        if test_case in self.scheduler:
+            self.scheduler.update(test_case, avg_exec_us, pyafl.state_execs())
+        else:
+            self.scheduler.add(test_case, avg_exec_us, pyafl.state_execs())
+
     def handle_interrupt(self, signum, frame):
         print("\n[!] 检测到中断信号，正在停止...")
         self.running = False
@@ -966,6 +1342,9 @@ class Fuzzer():
         elif test_case.handicap:
             perf_score *= 2
             test_case.handicap -= 1
+
+        if self.schedule:
+            perf_score *= self.schedule_factor(test_case) / self.POWER_BETA
         
         if perf_score > self.HAVOC_MAX_MULT * 100:
             perf_score = self.HAVOC_MAX_MULT * 100
@@ -980,6 +1359,37 @@ class Fuzzer():
         return perf_score
 
 
+    def schedule_factor(self, test_case:TestCase):
+        """
+        AFLFast 功率调度的能量系数（整数，0 表示这次不做 havoc）。
+        fuzz 为该用例的路径（cksum）至今被执行的次数，执行得越多说明附近区域越饱和；
+        fuzz_level 为该用例被选中的次数，低频路径每被选中一次能量翻倍。
+        """
+        if self.schedule == "explore":
+            return 1
+        if self.schedule == "exploit":
+            return self.MAX_FACTOR
+
+        fuzz = pyafl.path_freq(test_case.cksum)
+        level = test_case.fuzz_level
+
+        if self.schedule == "coe":
+            # 执行次数高于平均值的路径这次不分配能量
+            if self.fuzz_mu_cycle != self.stats.queue_cycle:
+                self.fuzz_mu = sum(pyafl.path_freq(q.cksum) for q in self.queue) / len(self.queue)
+                self.fuzz_mu_cycle = self.stats.queue_cycle
+            if fuzz > self.fuzz_mu:
+                return 0
+            factor = 1 << level if level < 16 else self.MAX_FACTOR
+        else:  # fast
+            if level < 16:
+                factor = (1 << level) // max(fuzz, 1)
+            else:
+                factor = self.MAX_FACTOR // (1 << (max(fuzz, 1) - 1).bit_length())
+
+        return min(factor, self.MAX_FACTOR)
+
+
 
 
 
@@ -991,9 +1401,10 @@ class Fuzzer():
             2. 找出全局字节差异区间 [start_byte, end_byte]
             3. 在差异区间内随机选一个全局拼接点
             4. 生成新序列：msg1 前半 + msg2 后半（在字节级别）
+            返回拼接后的消息序列，找不到合适的拼接对象时原样返回 msg1
             """
             if not msg1 or len(self.queue) < 2:
-                return
+                return msg1
 
             # 预计算 msg1 的总字节和消息边界
             total1 = bytearray()
@@ -1084,35 +1495,60 @@ class Fuzzer():
                 part1 = msg1[msg1_idx][:byte_offset_in_msg1]
                 part2 = msg2[msg2_idx][byte_offset_in_msg2:]
                 mixed_msg = bytearray(part1 + part2)
-                result.append(mixed_msg)
+                # 混合后的字节流按协议重新切分，保持消息边界
+                result.extend(splitters.split_messages(self.config['protocol'], mixed_msg, self.datagram) or [mixed_msg])
 
                 # 3. 添加 msg2 中拼接点之后的所有完整消息
                 for i in range(msg2_idx + 1, len(msg2)):
                     result.append(bytearray(msg2[i]))
 
-                msg1 = result
+                return result
 
+            return msg1
 
         
     
     def fuzz_one(self):
         
-        if self.pending_favored:
+        # 按权重选择时，已经 fuzz 过的用例的权重已经降低，不再按概率跳过
+        if self.pending_favored and not self.scheduler:
             if self.current_test_case.was_fuzzed:
                 if random.randint(0,100) < self.SKIP_TO_NEW_PROB:
                     return 1
         
-        self.current_test_case.was_fuzzed = 1
+        if self.current_test_case.favored and not self.current_test_case.was_fuzzed:
+            self.pending_favored -= 1
+        if not self.current_test_case.was_fuzzed:
+            self.current_test_case.was_fuzzed = 1
+            if self.scheduler:
+                self.update_weight(self.current_test_case)
+
+        if not self.current_test_case.trim_done and self.config['dumb_mode'] != "True":
+            self.trim_case(self.current_test_case)
+
         mutated_messages = copy.deepcopy(self.current_test_case.messages)
         if not mutated_messages:
             return
-        indices = sorted(random.sample(range(len(mutated_messages)), 2))
-        start_fuzz_msg_index, end_fuzz_msg_index = indices[0], indices[1]
+        if self.target_state is not None:
+            # 只变异到达目标状态之后的消息
+            start_fuzz_msg_index, end_fuzz_msg_index = self.state_model.window(self.current_test_case, self.target_state)
+        elif len(mutated_messages) == 1:
+            # 单条消息的会话（如 UDP 上的 DNS 查询）
+            start_fuzz_msg_index, end_fuzz_msg_index = 0, 1
+        else:
+            indices = sorted(random.sample(range(len(mutated_messages)), 2))
+            start_fuzz_msg_index, end_fuzz_msg_index = indices[0], indices[1]
+
+        if not self.current_test_case.passed_det and self.config['skip_deterministic'] != "True":
+            self.deterministic_stage(self.current_test_case, start_fuzz_msg_index, end_fuzz_msg_index)
 
         
 
 
         perf_score = self.calculate_score(self.current_test_case)
+        self.current_test_case.fuzz_level += 1
+        if not perf_score:
+            return
 
     
         stage_max = int(self.HAVOC_CYCLES_INIT * perf_score / 100 )
@@ -1121,10 +1557,21 @@ class Fuzzer():
 
 
 
+        use_prefix = True
         if self.splice:
+            mutated_messages = self.splice_msgs(mutated_messages)
+            # 拼接后消息条数可能变化，变异窗口收缩到新的序列内
+            end_fuzz_msg_index = min(end_fuzz_msg_index, len(mutated_messages))
+            start_fuzz_msg_index = min(start_fuzz_msg_index, end_fuzz_msg_index - 1)
+            # 拼接点落在窗口之前时，前缀与当前用例不同，不能使用它的快照
+            use_prefix = mutated_messages[:start_fuzz_msg_index] == self.current_test_case.messages[:start_fuzz_msg_index]
 
-            
-            self.splice_msgs(mutated_messages)
+        # 前 start_fuzz_msg_index 条消息在 havoc 中保持不变，从快照开始执行
+        if self.prefix_cache.enabled and start_fuzz_msg_index > 0 and use_prefix:
+            self.prefix = self.prefix_cache.lookup(self.current_test_case, start_fuzz_msg_index)
+            if self.prefix is None:
+                self.stats.total_exec += 1
+                self.prefix = self.prefix_cache.create(self.current_test_case, start_fuzz_msg_index, self.exec_tmout)
 
 
 
@@ -1150,6 +1597,8 @@ class Fuzzer():
 
             self.common_fuzz_stuff(mutated_messages)
 
+        self.prefix = None
+
 
     @profile
     def fuzz_one_for_profile(self):
@@ -1218,18 +1667,46 @@ class Fuzzer():
         self.current_queue_idx = (self.current_queue_idx + 1) % len(self.queue)
         self.current_test_case = self.queue[self.current_queue_idx] 
 
+        # 按权重选择时 current_queue_idx 只用来数轮次：每选 len(queue) 次算一轮
+        if self.scheduler:
+            self.current_test_case = self.scheduler.choose()
+
+        # state-aware：先选目标状态，再从到达该状态的用例中选种子
+        self.target_state = None
+        if self.state_aware and len(self.state_model):
+            self.target_state = self.state_model.choose_state(pyafl.state_execs())
+            self.current_test_case = self.state_model.choose_seed(self.target_state)
+
     def fuzz(self):
         print("start fuzzing, WAAAAAAAAAGH!!!")
         self.start_time = time.time()  # 记录fuzzing开始时间
         self.last_time = self.start_time
         self.last_exec = 0
 
+        self.write_stats_file()
+        if self.metrics_exporter:
+            self.metrics_exporter.start()
+        if self.status_screen:
+            self.status_screen.start()
+
         while self.running:
 
             self.choose_test_case()
             # 运行测试用例并计数
             self.fuzz_one()
 
+        self.write_stats_file()
+        self.plot_file.close()
+        self.timeline.close()
+        if self.crash_buckets.dirty:
+            self.crash_buckets.write_index()
+        self.auto_extras.save()
+        self.prefix_cache.release_all()
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+        if self.status_screen:
+            self.status_screen.stop()
+
 
 
 
@@ -1238,15 +1715,29 @@ class Fuzzer():
         
         if fault == FaultCode.NONE.value:
             hub = pyafl.has_new_bit()
-            if not hub:
+            # state-aware 模式下，到达新状态或新状态转移的用例也保留
+            if not hub and not (self.state_aware and pyafl.state_new()):
                 return 0
             
             test_case_path = os.path.join(self.queue_dir,f"id:{self.stats.queue_len:06d}_{self.stats.stage_name}.raw")
             self.stats.queue_len += 1
 
             self.save_interesting_test_case(messages, test_case_path) 
-            test_case = TestCase(messages=messages, file_path=test_case_path)
+            # 新路径的响应中可能含有协议关键字
+            self.auto_extras.harvest_responses(self.last_responses)
+            self.timeline.append(int(time.time() * 1000), self.stats.total_exec,
+                                 self.stats.queue_len - 1, pyafl.new_edges())
+            # 变异阶段会继续原地修改 messages
+            test_case = TestCase(messages=copy.deepcopy(messages), file_path=test_case_path)
             test_case.depth = self.current_test_case.depth + 1
+            # calibrate_case 会重新执行，先记下这次执行的状态序列；
+            # 从快照执行时状态序列缺少前缀部分，改用校准时完整会话的
+            from_snapshot = self.last_from_snapshot
+            if not from_snapshot:
+                self.state_model.add(test_case, pyafl.state_seq())
+            self.state_model.record_path(self.target_state)
+            self.stats.max_depth = max(self.stats.max_depth, test_case.depth)
+            self.stats.last_path_time = time.time()
             if hub == 2 and not test_case.has_new_cov:
                 test_case.has_new_cov = 1
                 self.stats.queued_with_cov += 1
@@ -1255,6 +1746,8 @@ class Fuzzer():
 
 
             self.calibrate_case(test_case,self.stats.queue_cycle)
+            if from_snapshot:
+                self.state_model.add(test_case, pyafl.state_seq())
 
             is_favor = self.cull_queue(test_case)
 
@@ -1266,6 +1759,11 @@ class Fuzzer():
 
 
             self.queue.append(test_case)
+            if self.scheduler:
+                self.update_weight(test_case)
+            self.stats.stage_finds[self.stats.stage_name] = self.stats.stage_finds.get(self.stats.stage_name, 0) + 1
+            if self.auto_extras.changed:
+                self.refresh_auto_extras()
 
 
             keeping = 1
@@ -1294,28 +1792,35 @@ class Fuzzer():
             self.save_interesting_test_case(messages, os.path.join(self.tmout_test_cases_dir,f"id:{self.stats.unique_hangs:06d}.raw"))
 
             self.stats.unique_hangs += 1
-            self.stats.last_hang_time = datetime.now()
+            self.stats.last_hang_time = time.time()
 
 
         if fault == FaultCode.CRASH.value:
             self.stats.total_crashes += 1
-            if self.stats.unique_crashes >= self.KEEP_UNIQUE_CRASH:
-                return keeping
-            
+
+            # 快照执行的 trace 缺少前缀部分，按完整会话重新执行后再分桶；完整会话不崩溃的不保存
+            if self.last_from_snapshot:
+                if self.run_target_fast(messages, self.exec_tmout) != FaultCode.CRASH.value:
+                    return keeping
+
+            # 按 (简化 trace hash, 信号, 崩溃时的消息下标) 分桶，重复的崩溃只计数
             if  self.config['dumb_mode'] != "True":
                 pyafl.simplify_trace_bits()
-                if not pyafl.tmout_has_new_bit():
-                    return keeping
+            bucket_key = (pyafl.trace_hash32(), pyafl.kill_signal(), pyafl.last_msg_index())
+            if self.crash_buckets.hit(*bucket_key):
+                return keeping
 
-            if not self.stats.unique_crashes:
-                pass
+            if self.stats.unique_crashes >= self.KEEP_UNIQUE_CRASH:
+                return keeping
 
-            self.save_interesting_test_case(messages, os.path.join(self.crash_test_cases_dir,f"id:{self.stats.unique_crashes:06d}.raw"))
+            crash_path = os.path.join(self.crash_test_cases_dir,f"id:{self.stats.unique_crashes:06d}.raw")
+            self.save_interesting_test_case(messages, crash_path)
+            self.crash_buckets.add(crash_path, *bucket_key, self.stats.total_exec)
         
             self.stats.unique_crashes += 1
 
-            self.stats.last_crash_time = datetime.time()
-            self.stats.last_crash_execs = self.stats.total_execs
+            self.stats.last_crash_time = time.time()
+            self.stats.last_crash_execs = self.stats.total_exec
 
         if fault == FaultCode.ERROR.value:
             raise ValueError("Unable to execute target application")
@@ -1346,9 +1851,17 @@ class Fuzzer():
 
     def common_fuzz_stuff(self, messages:List[bytearray]):
         
-        fault = self.run_target_fast(messages, self.exec_tmout)
-
-        self.save_if_interesting(messages, fault)
+        fault = self.run_target_fast(messages, self.exec_tmout, self.prefix)
+        # 路径执行次数（fast / coe 调度）只统计 fuzz 的执行；快照执行的 trace 缺少前缀，不计入
+        if not self.last_from_snapshot:
+            pyafl.count_path()
+        self.stats.stage_cycles[self.stats.stage_name] = self.stats.stage_cycles.get(self.stats.stage_name, 0) + 1
+
+        # 产生新用例时，这次变异用到的 extras 命中次数加一
+        if self.save_if_interesting(messages, fault):
+            for extra in self.mutator.used_extras:
+                extra.hit += 1
+        self.mutator.used_extras.clear()
         
 
 
@@ -1357,8 +1870,8 @@ class Fuzzer():
         current_time = time.time()
         elapsed = current_time - self.last_time
         
-        # 每秒更新一次统计数据
-        if elapsed >= 2.0:
+        # 每秒更新一次统计数据（开启状态界面时由界面线程负责显示）
+        if elapsed >= 2.0 and not self.status_screen:
             # 计算当前时段的执行速度
             execs_in_period = self.stats.total_exec - self.last_exec
             execs_per_second = execs_in_period / elapsed
@@ -1371,6 +1884,99 @@ class Fuzzer():
             self.last_time = current_time
             self.last_exec = self.stats.total_exec
 
+        self.maybe_update_stats(current_time)
+
+
+    def maybe_update_stats(self, current_time):
+        """按时间间隔（而非每次执行）刷新 plot_data 和 fuzzer_stats"""
+        if current_time - self.last_plot_time >= self.PLOT_UPDATE_SEC:
+            elapsed = current_time - self.last_plot_time if self.last_plot_time else current_time - self.start_time
+            if elapsed > 0:
+                self.last_eps = (self.stats.total_exec - self.last_plot_exec) / elapsed
+            self.last_plot_time = current_time
+            self.last_plot_exec = self.stats.total_exec
+            self.maybe_update_plot_file()
+            self.timeline.flush()
+
+        if current_time - self.last_stats_time >= self.STATS_UPDATE_SEC:
+            self.last_stats_time = current_time
+            self.write_stats_file()
+            if self.crash_buckets.dirty:
+                self.crash_buckets.write_index()
+            if self.auto_extras.dirty:
+                # 命中次数变化只影响排名，随统计周期一起保存并重建
+                self.auto_extras.save()
+                self.refresh_auto_extras()
+
+    def refresh_auto_extras(self):
+        """用自动字典当前排名最高的 token 重建 Mutator.a_extras"""
+        self.mutator.a_extras = utils.ExtrasStore(self.auto_extras.top())
+        self.auto_extras.changed = False
+
+    def get_bitmap_stats(self):
+        """返回 (bitmap_cvg, stability)，均为百分比"""
+        t_bytes = pyafl.virgin_bytes_count()
+        var_bytes = pyafl.var_bytes_count()
+        bitmap_cvg = t_bytes * 100.0 / pyafl.map_size()
+        stability = 100.0 - var_bytes * 100.0 / t_bytes if t_bytes else 100.0
+        return bitmap_cvg, stability
+
+    def maybe_update_plot_file(self):
+        """向 plot_data 追加一行（格式与 AFL 的 maybe_update_plot_file 相同）"""
+        bitmap_cvg, _ = self.get_bitmap_stats()
+        pending_total = sum(1 for q in self.queue if not q.was_fuzzed)
+
+        self.plot_file.write(
+            f"{int(time.time())}, {self.stats.queue_cycle}, {self.current_queue_idx}, "
+            f"{len(self.queue)}, {pending_total}, {self.pending_favored}, {bitmap_cvg:0.02f}%, "
+            f"{self.stats.unique_crashes}, {self.stats.unique_hangs}, {self.stats.max_depth}, "
+            f"{self.last_eps:0.02f}\n")
+        self.plot_file.flush()
+
+    def write_stats_file(self):
+        """写入 AFL 兼容的 fuzzer_stats（先写临时文件再原子替换）"""
+        bitmap_cvg, stability = self.get_bitmap_stats()
+        pending_total = sum(1 for q in self.queue if not q.was_fuzzed)
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss >> 10
+
+        fields = [
+            ("start_time", int(self.start_time)),
+            ("last_update", int(time.time())),
+            ("fuzzer_pid", os.getpid()),
+            ("cycles_done", self.stats.queue_cycle),
+            ("execs_done", self.stats.total_exec),
+            ("execs_per_sec", f"{self.last_eps:0.02f}"),
+            ("paths_total", len(self.queue)),
+            ("paths_favored", self.stats.favor_paths),
+            ("paths_found", self.stats.queue_len),
+            ("paths_imported", 0),
+            ("max_depth", self.stats.max_depth),
+            ("cur_path", self.current_queue_idx),
+            ("pending_favs", self.pending_favored),
+            ("pending_total", pending_total),
+            ("variable_paths", self.stats.variable_paths),
+            ("stability", f"{stability:0.02f}%"),
+            ("bitmap_cvg", f"{bitmap_cvg:0.02f}%"),
+            ("unique_crashes", self.stats.unique_crashes),
+            ("unique_hangs", self.stats.unique_hangs),
+            ("last_path", int(self.stats.last_path_time)),
+            ("last_crash", int(self.stats.last_crash_time)),
+            ("last_hang", int(self.stats.last_hang_time)),
+            ("execs_since_crash", self.stats.total_exec - self.stats.last_crash_execs),
+            ("exec_timeout", self.exec_tmout),
+            ("afl_banner", self.config.get('name', '')),
+            ("afl_version", "pyafl"),
+            ("target_mode", "default"),
+            ("command_line", self.config.get('target_cmd', '')),
+            ("peak_rss_mb", peak_rss_mb),
+        ]
+
+        tmp_path = self.stats_file_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            for key, value in fields:
+                f.write(f"{key:<18}: {value}\n")
+        os.replace(tmp_path, self.stats_file_path)
+
 
     
 
@@ -42,6 +42,8 @@
 #include "debug.h"
 #include "alloc-inl.h"
 #include "hash.h"
+#include "net-io-inl.h"
+#include "desock.h"
 
 #include <stdio.h>
 #include <unistd.h>
@@ -66,6 +68,8 @@
 #include <sys/mman.h>
 #include <sys/ioctl.h>
 #include <sys/file.h>
+#include <sys/socket.h>
+#include <sys/un.h>
 
 #include <arpa/inet.h>
 #include <poll.h>
@@ -338,7 +342,10 @@ enum {
 
 enum {
   /* 00 */ PRO_TCP,
-  /* 01 */ PRO_UDP
+  /* 01 */ PRO_UDP,
+  /* 02 */ PRO_UNIX,                  /* unix:///path, net_ip is the path */
+  /* 03 */ PRO_FD,                    /* fd://[N], see libsockpair/       */
+  /* 04 */ PRO_DESOCK                 /* desock://, see libdesock/        */
 };
 
 
@@ -353,6 +360,11 @@ u32 socket_timeout_usecs = 1000;
 u8 net_protocol;
 u8* net_ip;
 u32 net_port;
+s32 sock_handoff_fd = -1;             /* fd:// channel, our end           */
+s32 sock_handoff_peer = -1;           /* Target end, see SOCK_HANDOFF_FD  */
+s32 desock_yield_fd = -1;             /* desock:// yield pipe (read end)  */
+static struct desock_ring* desock_ring; /* desock:// ring, see desock.h   */
+static s32 desock_shm_id = -1;        /* ... and its SHM region           */
 EXP_ST u8 session_virgin_bits[MAP_SIZE];     /* Regions yet untouched while the SUT is still running */
 EXP_ST u8 *cleanup_script; /* script to clean up the environment of the SUT -- make fuzzing more deterministic */
 
@@ -378,10 +390,322 @@ int global_response_buf_len = 0;
 
 int global_sockfd = -1;
 
+/* Per-session message bookkeeping, used to tell which message a crash
+   followed (see __last_msg_index()). */
+
+s32 session_msgs;                     /* Messages sent in this session    */
+s32 session_last_msg = -1;            /* Message after which peer died    */
+
+/* Power schedules (AFLFast): execs per path checksum when "schedule" needs
+   them. Only fuzzing execs are counted (see __count_path()). */
+
+static u32* path_freq;                /* PATH_FREQ_SIZE counters or NULL  */
+
+/* Protocol state tracking. Every response is reduced to a sequence of
+   response codes right after net_recv() (TLS: content type + handshake /
+   alert type, FTP/SMTP: reply code, RTSP/HTTP/SIP: status code, DNS: opcode +
+   rcode). Codes are mapped to compact state ids in order of first appearance;
+   id 0 is the initial state every session starts in. The per-exec sequence,
+   per-state exec counts and the set of seen transitions live here so that
+   tracking costs no Python work per exec; the scheduler only reads them back
+   when it saves a queue entry or picks a seed. */
+
+#define STATE_MAX        256            /* Distinct states tracked          */
+#define STATE_SEQ_MAX    1024           /* Codes kept per session           */
+#define STATE_HASH_SIZE  1024           /* Code -> id table (power of 2)    */
+
+enum {
+  /* 00 */ RESP_NONE,
+  /* 01 */ RESP_TLS,
+  /* 02 */ RESP_REPLY_CODE,
+  /* 03 */ RESP_STATUS_LINE,
+  /* 04 */ RESP_DNS
+};
+
+static u8  resp_proto;                  /* Response parser (RESP_*)         */
+
+static u32 state_codes[STATE_MAX];      /* State id -> response code        */
+static u32 state_cnt = 1;               /* Known states (0 = initial)       */
+static u64 state_execs[STATE_MAX];      /* Execs that reached each state    */
+static u32 state_epoch[STATE_MAX];      /* Last exec each state was counted */
+static u32 state_exec_epoch;            /* Current exec                     */
+static u16 state_hash[STATE_HASH_SIZE]; /* Code -> id + 1                   */
+static u8  state_trans[STATE_MAX * STATE_MAX / 8]; /* Seen transitions      */
+
+static u32 state_seq[STATE_SEQ_MAX * 2];/* (state id, message index) pairs  */
+static u32 state_seq_cnt;
+static u32 state_prev;                  /* Current state of this session    */
+static u8  state_new;                   /* New state / transition this exec */
+
+static void state_reset(void) {
+
+  state_seq_cnt = 0;
+  state_prev    = 0;
+  state_new     = 0;
+
+  state_exec_epoch++;
+  state_epoch[0] = state_exec_epoch;
+  state_execs[0]++;
+
+}
+
+static void state_add(u32 code) {
+
+  u32 slot = (code * 0x9E3779B1) & (STATE_HASH_SIZE - 1);
+  u32 id;
+
+  while (state_hash[slot] && state_codes[state_hash[slot] - 1] != code)
+    slot = (slot + 1) & (STATE_HASH_SIZE - 1);
+
+  if (state_hash[slot]) {
+
+    id = state_hash[slot] - 1;
+
+  } else {
+
+    if (state_cnt == STATE_MAX) return;
+    id = state_cnt++;
+    state_codes[id]  = code;
+    state_hash[slot] = id + 1;
+    state_new = 1;
+
+  }
+
+  if (!(state_trans[(state_prev * STATE_MAX + id) >> 3] & (1 << (id & 7)))) {
+    state_trans[(state_prev * STATE_MAX + id) >> 3] |= 1 << (id & 7);
+    state_new = 1;
+  }
+  state_prev = id;
+
+  if (state_epoch[id] != state_exec_epoch) {
+    state_epoch[id] = state_exec_epoch;
+    state_execs[id]++;
+  }
+
+  if (state_seq_cnt < STATE_SEQ_MAX) {
+    state_seq[state_seq_cnt * 2]     = id;
+    state_seq[state_seq_cnt * 2 + 1] = session_msgs;
+    state_seq_cnt++;
+  }
+
+}
+
+/* TLS records: (content type << 8) | handshake type for every handshake
+   message, | alert description for alerts. Encrypted records yield
+   whatever byte sits there, which is what AFLNet does as well. */
+
+static void state_extract_tls(u8* buf, u32 len) {
+
+  u32 pos = 0;
+
+  while (pos + 5 <= len) {
+
+    u8  type = buf[pos];
+    u32 rlen = (buf[pos + 3] << 8) | buf[pos + 4];
+    u32 end  = MIN(pos + 5 + rlen, len);
+
+    if (type < 20 || type > 24) break;
+
+    if (type == 22 && rlen) {
+
+      u32 hpos = pos + 5;
+      while (hpos + 4 <= end) {
+        state_add((22 << 8) | buf[hpos]);
+        hpos += 4 + ((buf[hpos + 1] << 16) | (buf[hpos + 2] << 8) | buf[hpos + 3]);
+      }
+      if (hpos < end) state_add((22 << 8) | buf[hpos]);
+
+    } else if (type == 21 && rlen == 2 && end == pos + 7) {
+
+      state_add((21 << 8) | buf[pos + 6]);
+
+    } else state_add(type << 8);
+
+    pos += 5 + rlen;
+
+  }
+
+}
+
+/* FTP / SMTP: the 3-digit reply code of every final reply line ("220 ..."),
+   skipping "220-" continuation lines. */
+
+static void state_extract_reply_code(u8* buf, u32 len) {
+
+  u32 pos = 0;
+
+  while (pos + 3 <= len) {
+
+    if (isdigit(buf[pos]) && isdigit(buf[pos + 1]) && isdigit(buf[pos + 2]) &&
+        (pos + 3 == len || buf[pos + 3] != '-'))
+      state_add((buf[pos] - '0') * 100 + (buf[pos + 1] - '0') * 10 + buf[pos + 2] - '0');
+
+    u8* nl = memchr(buf + pos, '\n', len - pos);
+    if (!nl) break;
+    pos = nl - buf + 1;
+
+  }
+
+}
+
+/* RTSP / HTTP / SIP: the status code of every "PROTO/x.y NNN" status line. */
+
+static void state_extract_status_line(u8* buf, u32 len) {
+
+  u32 pos = 0;
+
+  while (pos < len) {
+
+    u8* nl  = memchr(buf + pos, '\n', len - pos);
+    u32 end = nl ? nl - buf : len;
+    u8* sp  = memchr(buf + pos, ' ', end - pos);
+
+    if (sp && memchr(buf + pos, '/', sp - buf - pos) && sp + 4 <= buf + end &&
+        isdigit(sp[1]) && isdigit(sp[2]) && isdigit(sp[3]) && isupper(buf[pos]))
+      state_add((sp[1] - '0') * 100 + (sp[2] - '0') * 10 + sp[3] - '0');
+
+    pos = end + 1;
+
+  }
+
+}
+
+/* DNS: opcode (bits 11-14) and rcode (bits 0-3) of the header flags; over
+   TCP every message carries a 2-byte length prefix. */
+
+static void state_extract_dns(u8* buf, u32 len) {
+
+  u32 pos = 0;
+
+  /* Over UDP every datagram is one message, without the length prefix. */
+  if (net_protocol == PRO_UDP) {
+    if (len >= 4) state_add(((buf[2] << 8) | buf[3]) & 0x780F);
+    return;
+  }
+
+  while (pos + 6 <= len) {
+
+    u32 mlen  = (buf[pos] << 8) | buf[pos + 1];
+    u16 flags = (buf[pos + 4] << 8) | buf[pos + 5];
+
+    state_add(flags & 0x780F);
+    pos += 2 + mlen;
+
+  }
+
+}
+
+static void state_extract(u8* buf, u32 len) {
+
+  switch (resp_proto) {
+
+    case RESP_TLS:         state_extract_tls(buf, len); break;
+    case RESP_REPLY_CODE:  state_extract_reply_code(buf, len); break;
+    case RESP_STATUS_LINE: state_extract_status_line(buf, len); break;
+    case RESP_DNS:         state_extract_dns(buf, len); break;
+
+  }
+
+}
+
 struct itimerval global_run_target_time_it;
 
 static u64 get_cur_time(void);
 
+/* Exec-time breakdown. Every phase of a session is timed with the monotonic
+   clock and accumulated into a fixed-size, HDR-style histogram: values below
+   2^TIMING_SUB_BITS us get an exact bucket, everything above lands in one of
+   2^TIMING_SUB_BITS linear sub-buckets of its power-of-two range. Recording
+   is a clz, a shift and a handful of adds, so it stays enabled at all times. */
+
+#define TIMING_SUB_BITS   2
+#define TIMING_BUCKETS    128
+
+enum {
+  /* 00 */ TIMING_FORK,               /* Fork server spawn / execve()     */
+  /* 01 */ TIMING_SERVER_WAIT,        /* server_wait + cleanup script     */
+  /* 02 */ TIMING_CONNECT,            /* socket() + connect() w/ retries  */
+  /* 03 */ TIMING_SEND,               /* Per-message net_send()           */
+  /* 04 */ TIMING_RECV,               /* Per-message net_recv() wait      */
+  /* 05 */ TIMING_TEARDOWN,           /* Session drain, kill & reap spin  */
+  /* 06 */ TIMING_MAP,                /* Trace map post-processing        */
+  TIMING_COUNT
+};
+
+static const char* timing_names[TIMING_COUNT] = {
+  "fork", "server_wait", "connect", "send", "recv", "teardown", "map"
+};
+
+struct timing_hist {
+  u64 count,                          /* Number of samples                */
+      total_us,                       /* Sum of all samples (us)          */
+      min_us,                         /* Smallest sample (us)             */
+      max_us;                         /* Largest sample (us)              */
+  u64 buckets[TIMING_BUCKETS];        /* Log-linear sample histogram      */
+};
+
+static struct timing_hist timing_hists[TIMING_COUNT];
+
+static u64 connect_retries;           /* Failed connect() attempts        */
+
+/* Get monotonic time in microseconds (vDSO, no syscall on Linux). */
+
+static inline u64 get_mono_us(void) {
+
+  struct timespec ts;
+
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+
+  return (ts.tv_sec * 1000000ULL) + (ts.tv_nsec / 1000);
+
+}
+
+/* Map a sample to its histogram bucket. */
+
+static inline u32 timing_bucket(u64 us) {
+
+  u32 msb;
+
+  if (us < (1 << TIMING_SUB_BITS)) return us;
+  if (us > 0xffffffffULL) us = 0xffffffffULL;
+
+  msb = 31 - __builtin_clz((u32)us);
+
+  return ((msb - TIMING_SUB_BITS + 1) << TIMING_SUB_BITS) +
+         ((us >> (msb - TIMING_SUB_BITS)) & ((1 << TIMING_SUB_BITS) - 1));
+
+}
+
+/* Lower bound (us) of a histogram bucket. */
+
+static u64 timing_bucket_low(u32 idx) {
+
+  u32 msb;
+
+  if (idx < (1 << TIMING_SUB_BITS)) return idx;
+
+  msb = (idx >> TIMING_SUB_BITS) + TIMING_SUB_BITS - 1;
+
+  return (u64)((1 << TIMING_SUB_BITS) + (idx & ((1 << TIMING_SUB_BITS) - 1)))
+         << (msb - TIMING_SUB_BITS);
+
+}
+
+/* Account for one sample of the given phase. */
+
+static inline void timing_record(u8 id, u64 us) {
+
+  struct timing_hist* h = &timing_hists[id];
+
+  if (!h->count || us < h->min_us) h->min_us = us;
+  if (us > h->max_us) h->max_us = us;
+
+  h->count++;
+  h->total_us += us;
+  h->buckets[timing_bucket(us)]++;
+
+}
+
 /* split a string using a delimiter */
 int str_split(char* a_str, const char* a_delim, char **result, int a_count)
 {
@@ -444,6 +768,30 @@ int parse_net_config(u8* net_config, u8* protocol, u8** ip_address, u32* port)
   char **tokens;
   int tokenCount = 3;
 
+  /* unix:///path/to/socket: the rest is the socket path. */
+  if (!strncmp(net_config, "unix://", 7)) {
+    *protocol = PRO_UNIX;
+    *ip_address = strdup(net_config + 7);
+    *port = 0;
+    return !**ip_address || strlen(*ip_address) >= sizeof(((struct sockaddr_un*)0)->sun_path);
+  }
+
+  /* fd://N or fd://: where the target finds the session socket. */
+  if (!strncmp(net_config, "fd://", 5)) {
+    *protocol = PRO_FD;
+    *ip_address = strdup(net_config + 5);
+    *port = 0;
+    return strspn(*ip_address, "0123456789") != strlen(*ip_address);
+  }
+
+  /* desock://: no socket at all, the session goes through shared memory. */
+  if (!strncmp(net_config, "desock://", 9)) {
+    *protocol = PRO_DESOCK;
+    *ip_address = strdup("");
+    *port = 0;
+    return net_config[9] != 0;
+  }
+
   tokens = (char**)malloc(sizeof(char*) * (tokenCount));
 
   if (strlen(net_config) > 80) return 1;
@@ -486,59 +834,67 @@ char *get_test_case(long *fsize)
   return buf;
 }
 
-int net_send(int sockfd, struct timeval timeout, char *mem, unsigned int len) {
-  unsigned int byte_count = 0;
-  int n;
-  struct pollfd pfd[1];
-  pfd[0].fd = sockfd;
-  pfd[0].events = POLLOUT;
-  int rv = poll(pfd, 1, 1);
-
-  setsockopt(sockfd, SOL_SOCKET, SO_SNDTIMEO, (char *)&timeout, sizeof(timeout));
-  if (rv > 0) {
-    if (pfd[0].revents & POLLOUT) {
-      while (byte_count < len) {
-        usleep(10);
-        n = send(sockfd, &mem[byte_count], len - byte_count, MSG_NOSIGNAL);
-        if (n == 0) return byte_count;
-        if (n == -1) return -1;
-        byte_count += n;
-      }
-    }
-  }
-  return byte_count;
+/* Datagram transport for udp:// targets. Every message is sent as exactly
+   one datagram, so message boundaries survive, and responses are drained
+   with recvmmsg() in batches of DGRAM_BATCH datagrams of up to DGRAM_MAX
+   bytes each, so response codes can be extracted per datagram. */
+
+#define DGRAM_BATCH      64
+#define DGRAM_MAX        65536
+
+static u8* dgram_arena;                 /* DGRAM_BATCH * DGRAM_MAX bytes    */
+
+int net_send_dgram(int sockfd, const char *mem, unsigned int len) {
+  return send(sockfd, mem, len, MSG_NOSIGNAL);
 }
 
-int net_recv(int sockfd, struct timeval timeout, int poll_w, char **response_buf, unsigned int *len) {
-  char temp_buf[1000];
-  int n;
+int net_recv_dgram(int sockfd, int poll_w, char **response_buf, unsigned int *len) {
+
+  struct mmsghdr msgs[DGRAM_BATCH];
+  struct iovec iovs[DGRAM_BATCH];
   struct pollfd pfd[1];
+  int i, n, wait = poll_w;
+
+  if (!dgram_arena) dgram_arena = ck_alloc_nozero(DGRAM_BATCH * DGRAM_MAX);
+
   pfd[0].fd = sockfd;
   pfd[0].events = POLLIN;
-  int rv = poll(pfd, 1, poll_w);
 
-  setsockopt(sockfd, SOL_SOCKET, SO_RCVTIMEO, (char *)&timeout, sizeof(timeout));
-  if (rv > 0) {
-    if (pfd[0].revents & POLLIN) {
-      n = recv(sockfd, temp_buf, sizeof(temp_buf), 0);
-      if ((n < 0) && (errno != 11)) {
-        //fprintf(stderr, "\nError no is: %d\n", errno);
-        return 1;
-      }
-      while (n > 0) {
-        usleep(10);
-        *response_buf = (unsigned char *)ck_realloc(*response_buf, *len + n);
-        memcpy(&(*response_buf)[*len], temp_buf, n);
-        *len = *len + n;
-        n = recv(sockfd, temp_buf, sizeof(temp_buf), 0);
-        if ((n < 0) && (errno != 11)) {
-          //fprintf(stderr, "\nError no is: %d\n", errno);
-          return 1;
-        }
-      }
+  /* Wait poll_w for the first datagram, then keep draining as long as more
+     arrive within the socket timeout (same as net_recv()). */
+
+  while (poll(pfd, 1, wait) > 0) {
+
+    for (i = 0; i < DGRAM_BATCH; i++) {
+      iovs[i].iov_base = dgram_arena + i * DGRAM_MAX;
+      iovs[i].iov_len  = DGRAM_MAX;
+      memset(&msgs[i].msg_hdr, 0, sizeof(struct msghdr));
+      msgs[i].msg_hdr.msg_iov    = &iovs[i];
+      msgs[i].msg_hdr.msg_iovlen = 1;
+    }
+
+    n = recvmmsg(sockfd, msgs, DGRAM_BATCH, MSG_DONTWAIT, NULL);
+
+    if (n < 0) {
+      if (errno == EAGAIN || errno == EWOULDBLOCK || errno == EINTR) continue;
+      /* ICMP port unreachable: nobody is listening (any more). */
+      net_peer_closed = 1;
+      return 1;
     }
-  } else if (rv < 0) return 1;
+
+    for (i = 0; i < n; i++) {
+      net_reserve(response_buf, *len, msgs[i].msg_len);
+      memcpy(&(*response_buf)[*len], iovs[i].iov_base, msgs[i].msg_len);
+      *len += msgs[i].msg_len;
+      state_extract(iovs[i].iov_base, msgs[i].msg_len);
+    }
+
+    wait = MAX(socket_timeout_usecs / 1000, 1);
+
+  }
+
   return 0;
+
 }
 
 int send_over_network()
@@ -565,10 +921,7 @@ int send_over_network()
 
   //Set timeout for socket data sending/receiving -- otherwise it causes a big delay
   //if the server is still alive after processing all the requests
-  struct timeval timeout;
-  timeout.tv_sec = 0;
-  timeout.tv_usec = socket_timeout_usecs;
-  setsockopt(sockfd, SOL_SOCKET, SO_SNDTIMEO, (char *)&timeout, sizeof(timeout));
+  net_setup_socket(sockfd, socket_timeout_usecs, net_protocol == PRO_TCP);
 
   memset(&serv_addr, '0', sizeof(serv_addr));
 
@@ -595,14 +948,14 @@ int send_over_network()
   int response_buf_size = 0;
 
   //retrieve early server response if needed
-  if (net_recv(sockfd, timeout, poll_wait_msecs, &response_buf, &response_buf_size)) goto HANDLE_RESPONSES;
+  if (net_recv(sockfd, poll_wait_msecs, socket_timeout_usecs, &response_buf, &response_buf_size)) goto HANDLE_RESPONSES;
 
   //write the requests stored in the generated seed input
-  n = net_send(sockfd, timeout, buf, buf_size);
+  n = net_send(sockfd, buf, buf_size);
 
 HANDLE_RESPONSES:
 
-  net_recv(sockfd, timeout, poll_wait_msecs, &response_buf, &response_buf_size);
+  net_recv(sockfd, poll_wait_msecs, socket_timeout_usecs, &response_buf, &response_buf_size);
 
   //wait a bit letting the server to complete its remaing task(s)
   memset(session_virgin_bits, 255, MAP_SIZE);
@@ -1177,6 +1530,12 @@ EXP_ST void read_bitmap(u8* fname) {
    This function is called after every exec() on a fairly large buffer, so
    it needs to be fast. We do this in 32-bit and 64-bit flavors. */
 
+/* Map indices that went from pristine to hit in virgin_bits during the last
+   __has_new_bit() call; read by the Python side for the edge timeline log. */
+
+static u32 new_edges[MAP_SIZE];
+static u32 new_edges_cnt;
+
 static inline u8 has_new_bits(u8* virgin_map) {
 
 #ifdef WORD_SIZE_64
@@ -1231,6 +1590,18 @@ static inline u8 has_new_bits(u8* virgin_map) {
 
       }
 
+      if (virgin_map == virgin_bits) {
+
+        u8* cur = (u8*)current;
+        u8* vir = (u8*)virgin;
+        u32 base = cur - trace_bits;
+        u32 j;
+
+        for (j = 0; j < sizeof(*current); j++)
+          if (cur[j] && vir[j] == 0xff) new_edges[new_edges_cnt++] = base + j;
+
+      }
+
       *virgin &= ~*current;
 
     }
@@ -1503,6 +1874,7 @@ static inline void classify_counts(u32* mem) {
 static void remove_shm(void) {
 
   shmctl(shm_id, IPC_RMID, NULL);
+  if (desock_shm_id >= 0) shmctl(desock_shm_id, IPC_RMID, NULL);
 
 }
 
@@ -1601,75 +1973,393 @@ static void cull_queue(void) {
   queued_favored  = 0;
   pending_favored = 0;
 
-  q = queue;
+  q = queue;
+
+  while (q) {
+    q->favored = 0;
+    q = q->next;
+  }
+
+  /* Let's see if anything in the bitmap isn't captured in temp_v.
+     If yes, and if it has a top_rated[] contender, let's use it. */
+
+  for (i = 0; i < MAP_SIZE; i++)
+    if (top_rated[i] && (temp_v[i >> 3] & (1 << (i & 7)))) {
+
+      u32 j = MAP_SIZE >> 3;
+
+      /* Remove all bits belonging to the current entry from temp_v. */
+
+      while (j--) 
+        if (top_rated[i]->trace_mini[j])
+          temp_v[j] &= ~top_rated[i]->trace_mini[j];
+
+      top_rated[i]->favored = 1;
+      queued_favored++;
+
+      if (!top_rated[i]->was_fuzzed) pending_favored++;
+
+    }
+
+  q = queue;
+
+  while (q) {
+    mark_as_redundant(q, !q->favored);
+    q = q->next;
+  }
+
+}
+
+
+/* Configure shared memory and virgin_bits. This is called at startup. */
+
+EXP_ST void setup_shm(void) {
+
+  u8* shm_str;
+
+  if (!in_bitmap) memset(virgin_bits, 255, MAP_SIZE);
+
+  memset(virgin_tmout, 255, MAP_SIZE);
+  memset(virgin_crash, 255, MAP_SIZE);
+
+  shm_id = shmget(IPC_PRIVATE, MAP_SIZE, IPC_CREAT | IPC_EXCL | 0600);
+
+  if (shm_id < 0) PFATAL("shmget() failed");
+
+  atexit(remove_shm);
+
+  shm_str = alloc_printf("%d", shm_id);
+
+  /* If somebody is asking us to fuzz instrumented binaries in dumb mode,
+     we don't want them to detect instrumentation, since we won't be sending
+     fork server commands. This should be replaced with better auto-detection
+     later on, perhaps? */
+
+  if (!dumb_mode) setenv(SHM_ENV_VAR, shm_str, 1);
+
+  ck_free(shm_str);
+
+  trace_bits = shmat(shm_id, NULL, 0);
+  
+  if (!trace_bits) PFATAL("shmat() failed");
+
+  /* desock:// targets get their messages through a second region (see
+     desock.h), handed over the same way. */
+
+  if (net_protocol != PRO_DESOCK) return;
+
+  desock_shm_id = shmget(IPC_PRIVATE, sizeof(struct desock_ring), IPC_CREAT | IPC_EXCL | 0600);
+
+  if (desock_shm_id < 0) PFATAL("shmget() failed");
+
+  shm_str = alloc_printf("%d", desock_shm_id);
+  setenv(DESOCK_SHM_ENV_VAR, shm_str, 1);
+  ck_free(shm_str);
+
+  desock_ring = shmat(desock_shm_id, NULL, 0);
+
+  if (desock_ring == (void*)-1) PFATAL("shmat() failed");
+
+}
+
+
+/* fd:// transport: create the channel on which every exec's session socket
+   is handed to the target (picked up by libsockpair). The fuzzer keeps the
+   target's end too, so that sockets nobody claimed can be drained. */
+
+EXP_ST void setup_sock_handoff(void) {
+
+  s32 sv[2];
+
+  if (net_protocol != PRO_FD) return;
+
+  if (socketpair(AF_UNIX, SOCK_DGRAM, 0, sv)) PFATAL("socketpair() failed");
+
+  sock_handoff_fd   = sv[0];
+  sock_handoff_peer = sv[1];
+
+  setenv("PYAFL_SOCK_FD", net_ip, 1);
+
+}
+
+
+/* In the child about to exec the target: put the channel in place. */
+
+static void sock_handoff_child(void) {
+
+  if (sock_handoff_peer < 0) return;
+
+  if (dup2(sock_handoff_peer, SOCK_HANDOFF_FD) < 0) PFATAL("dup2() failed");
+
+  close(sock_handoff_fd);
+  close(sock_handoff_peer);
+
+}
+
+
+/* Queue the target's end of a new socketpair for the next child, and keep
+   the other end as the session socket. Must run before the fork. */
+
+static void sock_handoff(void) {
+
+  struct msghdr msg;
+  struct iovec iov;
+  union {
+    struct cmsghdr hdr;
+    char buf[CMSG_SPACE(sizeof(int))];
+  } cbuf;
+  struct cmsghdr* cmsg;
+  s32 sv[2], fd;
+  u8 tag = 'S';
+
+  /* Throw away sockets left over from children that never took theirs
+     (target without libsockpair, or one that died in the fork server). */
+
+  while (1) {
+
+    memset(&msg, 0, sizeof(msg));
+    iov.iov_base = &tag;
+    iov.iov_len  = 1;
+    msg.msg_iov        = &iov;
+    msg.msg_iovlen     = 1;
+    msg.msg_control    = cbuf.buf;
+    msg.msg_controllen = sizeof(cbuf.buf);
+
+    if (recvmsg(sock_handoff_peer, &msg, MSG_DONTWAIT) < 0) break;
+
+    cmsg = CMSG_FIRSTHDR(&msg);
+    if (cmsg && cmsg->cmsg_type == SCM_RIGHTS) {
+      memcpy(&fd, CMSG_DATA(cmsg), sizeof(int));
+      close(fd);
+    }
+
+  }
+
+  if (socketpair(AF_UNIX, SOCK_STREAM, 0, sv)) PFATAL("socketpair() failed");
+
+  memset(&msg, 0, sizeof(msg));
+  memset(&cbuf, 0, sizeof(cbuf));
+
+  tag = 'S';
+  iov.iov_base = &tag;
+  iov.iov_len  = 1;
+  msg.msg_iov        = &iov;
+  msg.msg_iovlen     = 1;
+  msg.msg_control    = cbuf.buf;
+  msg.msg_controllen = sizeof(cbuf.buf);
+
+  cmsg = CMSG_FIRSTHDR(&msg);
+  cmsg->cmsg_level = SOL_SOCKET;
+  cmsg->cmsg_type  = SCM_RIGHTS;
+  cmsg->cmsg_len   = CMSG_LEN(sizeof(int));
+  memcpy(CMSG_DATA(cmsg), &sv[1], sizeof(int));
+
+  if (sendmsg(sock_handoff_fd, &msg, 0) != 1) PFATAL("Unable to hand the session socket over");
+
+  close(sv[1]);
+
+  global_sockfd = sv[0];
+  net_setup_socket(global_sockfd, socket_timeout_usecs, 0);
+
+}
+
+
+/* desock:// transport: the yield pipe next to the fork server pipes (the
+   ring itself is set up in setup_shm()). The fuzzer keeps the target's end
+   as well. */
+
+static s32 desock_yield_peer = -1;      /* Target end (write)               */
+static u32 desock_staged;               /* End of records written so far    */
+static u32 desock_spin;                 /* Polls before sleeping, see below */
+
+EXP_ST void setup_desock(void) {
+
+  s32 yield[2];
+
+  if (net_protocol != PRO_DESOCK) return;
+
+  /* Children are only watched through the fork server status pipe. */
+  if (dumb_mode == 1 || no_forkserver)
+    FATAL("desock:// needs the fork server (no dumb mode, no AFL_NO_FORKSRV)");
+
+  if (pipe(yield)) PFATAL("pipe() failed");
+
+  /* Spinning only helps if the target can run meanwhile, i.e. not when it
+     inherits our CPU binding or there is only one core. */
+#ifdef HAVE_AFFINITY
+  if (cpu_core_count > 1 && cpu_aff < 0) desock_spin = DESOCK_SPIN;
+#else
+  if (cpu_core_count > 1) desock_spin = DESOCK_SPIN;
+#endif /* ^HAVE_AFFINITY */
+
+  desock_yield_fd   = yield[0];
+  desock_yield_peer = yield[1];
+
+}
+
+
+/* In the child about to exec the target: put the pipe in place. */
+
+static void desock_child(void) {
+
+  if (desock_yield_fd < 0) return;
+
+  if (dup2(desock_yield_peer, DESOCK_FD) < 0) PFATAL("dup2() failed");
+
+  close(desock_yield_fd);
+  close(desock_yield_peer);
+
+}
+
+
+/* Start a new session: empty ring, nothing left in the pipe. Must run
+   before the fork. */
+
+static void desock_reset(void) {
+
+  struct pollfd pfd;
+  u8 junk[256];
+
+  desock_ring->wr = desock_ring->rd = 0;
+  desock_ring->eof = desock_ring->resp_len = 0;
+  desock_ring->want = 0;
+  desock_ring->target_sleeping = desock_ring->fuzzer_sleeping = 0;
+
+  desock_staged = 0;
+
+  pfd.fd     = desock_yield_fd;
+  pfd.events = POLLIN;
+
+  while (poll(&pfd, 1, 0) > 0 && read(desock_yield_fd, junk, sizeof(junk)) > 0);
+
+}
+
+
+/* Write one message record past the last one, without delivering it yet.
+   Returns -1 if it does not fit. */
+
+static int desock_stage(const char* buf, u32 len) {
+
+  if (desock_staged - desock_ring->rd + 4 + len > DESOCK_RING_SIZE) return -1;
+
+  desock_copy_in(desock_ring, desock_staged, (u8*)&len, 4);
+  desock_copy_in(desock_ring, desock_staged + 4, (u8*)buf, len);
+  desock_staged += 4 + len;
+
+  return 0;
+
+}
+
+
+static void desock_ring_bell(void) {
+
+  MEM_BARRIER();
+  desock_ring->bell++;
+  DESOCK_FENCE();
+
+  if (desock_ring->target_sleeping) desock_futex_wake(&desock_ring->bell);
+
+}
+
+
+/* Deliver the next staged message, or stage and deliver buf if it is not
+   NULL. Returns the message length, or -1 if the target is gone or the ring
+   is full. */
+
+static int desock_send(const char* buf, u32 len) {
+
+  if (net_peer_closed) return -1;
+  if (buf && desock_stage(buf, len)) return -1;
+  if (desock_staged == desock_ring->wr) return -1;
+
+  desock_copy_out(desock_ring, desock_ring->wr, (u8*)&len, 4);
+  desock_ring->wr += 4 + len;
+  desock_ring_bell();
+
+  return len;
+
+}
+
+
+static u8 desock_answered(void) {
+
+  u32 want = desock_ring->want;
 
-  while (q) {
-    q->favored = 0;
-    q = q->next;
-  }
+  if (want == DESOCK_CLOSED) net_peer_closed = 1;
+  return want == DESOCK_CLOSED || want > session_msgs;
 
-  /* Let's see if anything in the bitmap isn't captured in temp_v.
-     If yes, and if it has a top_rated[] contender, let's use it. */
+}
 
-  for (i = 0; i < MAP_SIZE; i++)
-    if (top_rated[i] && (temp_v[i >> 3] & (1 << (i & 7)))) {
 
-      u32 j = MAP_SIZE >> 3;
+/* Wait until the target has consumed every message sent so far and asks for
+   more, closes the connection or dies (the fork server status pipe becomes
+   readable; the status itself is left for __post_run_target()), then take
+   what it sent meanwhile as the response. The answer usually comes within
+   microseconds, so the ring is polled for a while before going to sleep. */
 
-      /* Remove all bits belonging to the current entry from temp_v. */
+static void desock_recv(void) {
 
-      while (j--) 
-        if (top_rated[i]->trace_mini[j])
-          temp_v[j] &= ~top_rated[i]->trace_mini[j];
+  struct pollfd pfd[2];
+  u8 junk[64];
+  u32 i, len;
 
-      top_rated[i]->favored = 1;
-      queued_favored++;
+  for (i = 0; i < desock_spin; i++) {
+    if (desock_answered()) goto answered;
+    DESOCK_PAUSE();
+  }
 
-      if (!top_rated[i]->was_fuzzed) pending_favored++;
+  pfd[0].fd = desock_yield_fd;
+  pfd[1].fd = fsrv_st_fd;
+  pfd[0].events = pfd[1].events = POLLIN;
 
-    }
+  while (1) {
 
-  q = queue;
+    desock_ring->fuzzer_sleeping = 1;
+    DESOCK_FENCE();
 
-  while (q) {
-    mark_as_redundant(q, !q->favored);
-    q = q->next;
-  }
+    if (desock_answered()) break;
 
-}
+    if (poll(pfd, 2, -1) < 0) {
+      if (errno == EINTR) continue;
+      PFATAL("poll() failed");
+    }
 
+    if (pfd[0].revents & POLLIN) {
+      if (read(desock_yield_fd, junk, sizeof(junk)) <= 0) PFATAL("Unable to read from the desock yield pipe");
+      continue;
+    }
 
-/* Configure shared memory and virgin_bits. This is called at startup. */
+    /* One last look: the target may have answered and exited right away. */
+    if (!desock_answered()) net_peer_closed = 1;
+    break;
 
-EXP_ST void setup_shm(void) {
+  }
 
-  u8* shm_str;
+  desock_ring->fuzzer_sleeping = 0;
 
-  if (!in_bitmap) memset(virgin_bits, 255, MAP_SIZE);
+answered:
 
-  memset(virgin_tmout, 255, MAP_SIZE);
-  memset(virgin_crash, 255, MAP_SIZE);
+  MEM_BARRIER();
 
-  shm_id = shmget(IPC_PRIVATE, MAP_SIZE, IPC_CREAT | IPC_EXCL | 0600);
+  len = desock_ring->resp_len;
+  if (!len) return;
 
-  if (shm_id < 0) PFATAL("shmget() failed");
+  net_reserve(&global_response_buf, global_response_buf_len, len);
+  memcpy(global_response_buf + global_response_buf_len, desock_ring->resp, len);
+  state_extract(desock_ring->resp, len);
 
-  atexit(remove_shm);
+  global_response_buf_len += len;
+  desock_ring->resp_len = 0;
 
-  shm_str = alloc_printf("%d", shm_id);
+}
 
-  /* If somebody is asking us to fuzz instrumented binaries in dumb mode,
-     we don't want them to detect instrumentation, since we won't be sending
-     fork server commands. This should be replaced with better auto-detection
-     later on, perhaps? */
 
-  if (!dumb_mode) setenv(SHM_ENV_VAR, shm_str, 1);
+/* End of the session: reads return 0 from now on. */
 
-  ck_free(shm_str);
+static void desock_finish(void) {
 
-  trace_bits = shmat(shm_id, NULL, 0);
-  
-  if (!trace_bits) PFATAL("shmat() failed");
+  desock_ring->eof = 1;
+  desock_ring_bell();
 
 }
 
@@ -2357,6 +3047,8 @@ EXP_ST void init_forkserver(char** argv) {
 
     if (dup2(ctl_pipe[0], FORKSRV_FD) < 0) PFATAL("dup2() failed");
     if (dup2(st_pipe[1], FORKSRV_FD + 1) < 0) PFATAL("dup2() failed");
+    sock_handoff_child();
+    desock_child();
 
     close(ctl_pipe[0]);
     close(ctl_pipe[1]);
@@ -8075,6 +8767,14 @@ int __parse_args(const char *json_str){
         if (verbose) OKF("out_dir: %s ", out_dir);
     }
 
+    /* AFL 自身的工作目录，多个实例并行时需要各不相同 */
+    if ((item = cJSON_GetObjectItem(root, "afl_dir")) != NULL) {
+
+        if (out_dir) free(out_dir);
+        out_dir = strdup(item->valuestring);
+        if (verbose) OKF("out_dir: %s ", out_dir);
+    }
+
     /* 执行超时 */
     if ((item = cJSON_GetObjectItem(root, "exec_tmout")) != NULL) {
         u8 suffix = 0;
@@ -8145,9 +8845,9 @@ int __parse_args(const char *json_str){
     /* 网络配置 */
     if ((item = cJSON_GetObjectItem(root, "use_net")) != NULL) {
         if (parse_net_config(item->valuestring, &net_protocol, &net_ip, &net_port))
-            FATAL("Bad syntax used for use_net. Check the network setting. [tcp/udp]://127.0.0.1/port");
+            FATAL("Bad syntax used for use_net. Check the network setting. [tcp/udp]://127.0.0.1/port, unix:///path or fd://[N]");
         use_net = 1;
-        if (verbose) OKF("Network: %s://%s/%u", net_protocol, net_ip, net_port);
+        if (verbose) OKF("Network: %s", item->valuestring);
     }
 
     /* 服务器等待时间 */
@@ -8207,6 +8907,29 @@ int __parse_args(const char *json_str){
             if (verbose) OKF("Target command: %s", target_cmd[0]);
         }
     }
+    /* 协议（决定响应码的提取方式） */
+    if ((item = cJSON_GetObjectItem(root, "protocol")) != NULL) {
+        if (!strcasecmp(item->valuestring, "TLS"))
+            resp_proto = RESP_TLS;
+        else if (!strcasecmp(item->valuestring, "FTP") || !strcasecmp(item->valuestring, "SMTP"))
+            resp_proto = RESP_REPLY_CODE;
+        else if (!strcasecmp(item->valuestring, "RTSP") || !strcasecmp(item->valuestring, "HTTP") ||
+                 !strcasecmp(item->valuestring, "SIP"))
+            resp_proto = RESP_STATUS_LINE;
+        else if (!strcasecmp(item->valuestring, "DNS"))
+            resp_proto = RESP_DNS;
+        if (verbose) OKF("Protocol: %s", item->valuestring);
+    }
+
+    /* 功率调度：fast / coe 需要统计每条路径的执行次数 */
+    if ((item = cJSON_GetObjectItem(root, "schedule")) != NULL) {
+        if (!strcasecmp(item->valuestring, "fast") || !strcasecmp(item->valuestring, "coe")) {
+            if (!path_freq) path_freq = ck_alloc(PATH_FREQ_SIZE * sizeof(u32));
+        } else if (strcasecmp(item->valuestring, "explore") && strcasecmp(item->valuestring, "exploit"))
+            FATAL("Unknown power schedule '%s' (fast, coe, explore or exploit)", item->valuestring);
+        if (verbose) OKF("Power schedule: %s", item->valuestring);
+    }
+
     /* 名称 */
     if ((item = cJSON_GetObjectItem(root, "name")) != NULL) {
         strncpy(name, item->valuestring, MAX_STR_LEN - 1);
@@ -8301,6 +9024,8 @@ void __set_up(){
 
   setup_post();
   setup_shm();
+  setup_sock_handoff();
+  setup_desock();
   init_count_class16();
 
 
@@ -8359,6 +9084,8 @@ int __pre_run_target(u32 timeout){
   static u32 prev_timed_out = 0;
   static u64 exec_ms = 0;
 
+  u64 t0;
+
   child_timed_out = 0;
 
 
@@ -8369,6 +9096,18 @@ int __pre_run_target(u32 timeout){
   memset(trace_bits, 0, MAP_SIZE);
   MEM_BARRIER();
 
+  net_peer_closed  = 0;
+  session_msgs     = 0;
+  session_last_msg = -1;
+  state_reset();
+
+  t0 = get_mono_us();
+
+  /* fd:// targets need their socket queued before the child exists, and
+     desock:// targets must not find anything left from the last one. */
+  if (net_protocol == PRO_FD) sock_handoff();
+  else if (net_protocol == PRO_DESOCK) desock_reset();
+
   /* If we're running in "dumb" mode, we can't rely on the fork server
      logic compiled into the target program, so we will just keep calling
      execve(). There is a bit of code duplication between here and 
@@ -8429,6 +9168,7 @@ int __pre_run_target(u32 timeout){
       close(out_dir_fd);
       close(dev_urandom_fd);
       close(fileno(plot_file));
+      sock_handoff_child();
 
       /* Set sane defaults for ASAN if nothing else specified. */
 
@@ -8476,6 +9216,8 @@ int __pre_run_target(u32 timeout){
 
   }
 
+  timing_record(TIMING_FORK, get_mono_us() - t0);
+
     /* Configure timeout, as requested by user, then wait for child to terminate. */
 
   global_run_target_time_it.it_value.tv_sec = (timeout / 1000);
@@ -8483,8 +9225,17 @@ int __pre_run_target(u32 timeout){
 
   setitimer(ITIMER_REAL, &global_run_target_time_it, NULL);
 
+  /* Nothing to wait for or connect to: the socketpair (or the desock ring)
+     buffers the session until the target reads it. */
+  if (net_protocol == PRO_FD || net_protocol == PRO_DESOCK) return 0;
+
   int n;
   struct sockaddr_in serv_addr;
+  struct sockaddr_un unix_addr;
+  struct sockaddr* addr = (struct sockaddr*)&serv_addr;
+  socklen_t addr_len = sizeof(serv_addr);
+
+  t0 = get_mono_us();
 
   //Clean up the server if needed
   if (cleanup_script) system(cleanup_script);
@@ -8492,11 +9243,16 @@ int __pre_run_target(u32 timeout){
   //Wait a bit for the server initialization
   usleep(server_wait_usecs);
 
-  //Create a TCP/UDP socket
+  timing_record(TIMING_SERVER_WAIT, get_mono_us() - t0);
+  t0 = get_mono_us();
+
+  //Create a TCP/UDP/unix socket
   if (net_protocol == PRO_TCP)
     global_sockfd = socket(AF_INET, SOCK_STREAM, 0);
   else if (net_protocol == PRO_UDP)
     global_sockfd = socket(AF_INET, SOCK_DGRAM, 0);
+  else if (net_protocol == PRO_UNIX)
+    global_sockfd = socket(AF_UNIX, SOCK_STREAM, 0);
 
   if (global_sockfd < 0) {
     PFATAL("Cannot create a socket");
@@ -8505,10 +9261,7 @@ int __pre_run_target(u32 timeout){
   
   //Set timeout for socket data sending/receiving -- otherwise it causes a big delay
   //if the server is still alive after processing all the requests
-  struct timeval socket_timeout;
-  socket_timeout.tv_sec = 0;
-  socket_timeout.tv_usec = socket_timeout_usecs;
-  setsockopt(global_sockfd, SOL_SOCKET, SO_SNDTIMEO, (char *)&socket_timeout, sizeof(socket_timeout));
+  net_setup_socket(global_sockfd, socket_timeout_usecs, net_protocol == PRO_TCP);
 
   memset(&serv_addr, '0', sizeof(serv_addr));
 
@@ -8516,19 +9269,38 @@ int __pre_run_target(u32 timeout){
   serv_addr.sin_port = htons(net_port);
   serv_addr.sin_addr.s_addr = inet_addr(net_ip);
 
-  if(connect(global_sockfd, (struct sockaddr *)&serv_addr, sizeof(serv_addr)) < 0) {
+  if (net_protocol == PRO_UNIX) {
+    memset(&unix_addr, 0, sizeof(unix_addr));
+    unix_addr.sun_family = AF_UNIX;
+    strcpy(unix_addr.sun_path, net_ip);
+    addr = (struct sockaddr*)&unix_addr;
+    addr_len = sizeof(unix_addr);
+  }
+
+  if(connect(global_sockfd, addr, addr_len) < 0) {
+    /* connect() on a datagram socket only sets the peer address; it does not
+       wait for the server, so there is nothing to retry. */
+    if (net_protocol == PRO_UDP) {
+      close(global_sockfd);
+      timing_record(TIMING_CONNECT, get_mono_us() - t0);
+      return 1;
+    }
     //If it cannot connect to the server under test
     //try it again as the server initial startup time is varied
     for (n=0; n < 1000; n++) {
-      if (connect(global_sockfd, (struct sockaddr *)&serv_addr, sizeof(serv_addr)) == 0) break;
+      connect_retries++;
+      if (connect(global_sockfd, addr, addr_len) == 0) break;
       usleep(1000);
     }
     if (n== 1000) {
       close(global_sockfd);
+      timing_record(TIMING_CONNECT, get_mono_us() - t0);
       return 1;
     }
   }
 
+  timing_record(TIMING_CONNECT, get_mono_us() - t0);
+
   return 0;
 
   // //retrieve early server response if needed
@@ -8551,40 +9323,298 @@ int __pre_run_target(u32 timeout){
 
 
 
-void __get_test_case_and_run_target(const char *buf, size_t buf_len){
-   // 1. 输入验证
-    // if (buf == NULL) FATAL("Input buffer is NULL");
-    // if (buf_len == 0) FATAL("Buffer length cannot be zero");
+/* Send one message of the session and collect the response to it. With
+   desock://, buf may be NULL for the next message staged in the ring. */
+
+static void session_exchange(const char* buf, u32 buf_len) {
+
+  int n, resp_start;
+  u64 t0, t1;
+
+  t0 = get_mono_us();
+
+  if (net_protocol == PRO_UDP) {
+
+    int retry;
+
+    n = net_send_dgram(global_sockfd, buf, buf_len);
+    t1 = get_mono_us();
+
+    /* A server that has not bound its port yet bounces the first datagram
+       (ICMP port unreachable); resend it for as long as a TCP connect()
+       would have been retried. */
+    for (retry = 0; net_recv_dgram(global_sockfd, poll_wait_msecs, &global_response_buf,
+                                   &global_response_buf_len) && !session_msgs && retry < 1000; retry++) {
+      net_peer_closed = 0;
+      connect_retries++;
+      usleep(1000);
+      n = net_send_dgram(global_sockfd, buf, buf_len);
+    }
+
+  } else if (net_protocol == PRO_DESOCK) {
+
+    n = desock_send(buf, buf_len);
+    t1 = get_mono_us();
+
+    if (n >= 0) desock_recv();
+
+  } else {
+
+    n = net_send(global_sockfd, (char*)buf, buf_len);
+    t1 = get_mono_us();
+
+    resp_start = global_response_buf_len;
+    net_recv(global_sockfd, poll_wait_msecs, socket_timeout_usecs, &global_response_buf, &global_response_buf_len);
+    if (global_response_buf_len > resp_start)
+      state_extract((u8*)global_response_buf + resp_start, global_response_buf_len - resp_start);
+
+  }
+
+  timing_record(TIMING_SEND, t1 - t0);
+  timing_record(TIMING_RECV, get_mono_us() - t1);
+
+  /* The first message that could not be sent, or after which the server
+     hung up, marks where the session died. */
+  if (session_last_msg < 0) {
+    if (n < 0) session_last_msg = session_msgs ? session_msgs - 1 : 0;
+    else if (net_peer_closed) session_last_msg = session_msgs;
+  }
+  session_msgs++;
+
+}
 
+void __get_test_case_and_run_target(const char *buf, size_t buf_len){
+  session_exchange(buf, buf_len);
+}
 
-    int n;
-    struct timeval timeout;
-    timeout.tv_sec = 0;
-    timeout.tv_usec = socket_timeout_usecs;
+/* desock:// only: write a message of the session into the ring ahead of
+   time (one memcpy from the caller's buffer). Returns 1 if that is not
+   possible, and the message has to go through
+   __get_test_case_and_run_target() instead. */
 
-    n = net_send(global_sockfd, timeout, buf, buf_len);
+int __stage_message(const char *buf, u32 buf_len){
+  if (net_protocol != PRO_DESOCK) return 1;
+  return desock_stage(buf, buf_len) ? 1 : 0;
+}
 
-    net_recv(global_sockfd, timeout, poll_wait_msecs, &global_response_buf, &global_response_buf_len);
+/* Deliver the next staged message and collect the response to it. */
 
+void __run_staged_target(){
+  session_exchange(NULL, 0);
 }
 
 
 
 void __run_target(){
+  session_exchange(global_buf, global_buf_len);
+}
 
-  int n;
-  struct timeval timeout;
-  timeout.tv_sec = 0;
-  timeout.tv_usec = socket_timeout_usecs;
+/* Send a whole session at once. Datagram targets get every message as its
+   own datagram via sendmmsg(), stream targets get all messages back to back
+   via writev(); the responses are drained once afterwards, so they can no
+   longer be told apart per message. */
+
+void __run_target_batch(const char** bufs, u32* lens, u32 cnt){
+
+  struct mmsghdr msgs[DGRAM_BATCH];
+  struct iovec iovs[DGRAM_BATCH];
+  u32 i, done = 0;
+  int n, resp_start = global_response_buf_len;
+  u64 t0, t1;
+
+  /* desock:// already keeps message boundaries at no cost; every message
+     still has to wait for the target to ask for the next one. */
+  if (net_protocol == PRO_DESOCK) {
+    for (i = 0; i < cnt; i++) session_exchange(bufs[i], lens[i]);
+    return;
+  }
+
+  t0 = get_mono_us();
+
+  if (net_protocol == PRO_UDP) {
+
+    while (done < cnt) {
+
+      u32 batch = MIN(cnt - done, DGRAM_BATCH);
+
+      memset(msgs, 0, sizeof(struct mmsghdr) * batch);
+      for (i = 0; i < batch; i++) {
+        iovs[i].iov_base = (void*)bufs[done + i];
+        iovs[i].iov_len  = lens[done + i];
+        msgs[i].msg_hdr.msg_iov    = &iovs[i];
+        msgs[i].msg_hdr.msg_iovlen = 1;
+      }
+
+      n = sendmmsg(global_sockfd, msgs, batch, MSG_NOSIGNAL);
+      if (n <= 0) break;
+      done += n;
+
+    }
+
+    t1 = get_mono_us();
+    net_recv_dgram(global_sockfd, poll_wait_msecs, &global_response_buf, &global_response_buf_len);
+
+  } else {
+
+    struct iovec* iov = ck_alloc(cnt * sizeof(struct iovec));
+
+    for (i = 0; i < cnt; i++) {
+      iov[i].iov_base = (void*)bufs[i];
+      iov[i].iov_len  = lens[i];
+    }
+
+    n = net_sendv(global_sockfd, iov, cnt);
+    done = MAX(n, 0);
+    ck_free(iov);
+
+    t1 = get_mono_us();
+    net_recv(global_sockfd, poll_wait_msecs, socket_timeout_usecs, &global_response_buf, &global_response_buf_len);
+    if (global_response_buf_len > resp_start)
+      state_extract((u8*)global_response_buf + resp_start, global_response_buf_len - resp_start);
+
+  }
 
-  n = net_send(global_sockfd, timeout, global_buf, global_buf_len);
+  timing_record(TIMING_SEND, t1 - t0);
+  timing_record(TIMING_RECV, get_mono_us() - t1);
 
-  net_recv(global_sockfd, timeout, poll_wait_msecs, &global_response_buf, &global_response_buf_len);
+  if (session_last_msg < 0 && cnt) {
+    if (done < cnt) session_last_msg = session_msgs + done;
+    else if (net_peer_closed) session_last_msg = session_msgs + cnt - 1;
+  }
+  session_msgs += cnt;
+
+}
+
+/* Session prefix snapshots (see libprefixfork/). __prefix_snapshot() turns
+   the running target, which has just been sent the first k messages of a
+   session, into a snapshot holder and returns a control connection to it.
+   __prefix_pre_run_target() then replaces __pre_run_target(): it asks the
+   holder for a fresh copy of the server and uses the socketpair it hands
+   back as the session socket, so only messages k and later are sent.
+   __post_run_target() reads the copy's wait status from the holder. */
+
+static s32 prefix_ctl_fd = -1;          /* Holder of the current exec       */
+static u8  prefix_lost;                 /* Holder went away mid-exec        */
+
+static void prefix_sock_addr(struct sockaddr_un* addr, socklen_t* len, s32 pid) {
+
+  memset(addr, 0, sizeof(*addr));
+  addr->sun_family = AF_UNIX;
+  snprintf(addr->sun_path + 1, sizeof(addr->sun_path) - 1, PREFIX_SOCK_NAME, pid);
+  *len = offsetof(struct sockaddr_un, sun_path) + 1 + strlen(addr->sun_path + 1);
+
+}
+
+s32 __prefix_snapshot(){
+
+  struct sockaddr_un addr;
+  socklen_t addr_len;
+  s32 ctl, n, status, res;
+
+  if (dumb_mode == 1 || no_forkserver || child_pid <= 0) return -1;
+
+  prefix_sock_addr(&addr, &addr_len, child_pid);
+  kill(child_pid, SIGUSR2);
+
+  ctl = socket(AF_UNIX, SOCK_STREAM, 0);
+  if (ctl < 0) PFATAL("Cannot create a socket");
+
+  for (n = 0; n < 1000; n++) {
+    if (!connect(ctl, (struct sockaddr*)&addr, addr_len)) break;
+    usleep(1000);
+  }
+
+  close(global_sockfd);
+
+  /* The snapshotted process exits on its own once the holder is forked (or
+     dies from SIGUSR2 if libprefixfork is not preloaded). */
+
+  if ((res = read(fsrv_st_fd, &status, 4)) != 4) {
+    if (stop_soon) return -1;
+    RPFATAL(res, "Unable to communicate with fork server (OOM?)");
+  }
+  child_pid = 0;
+
+  global_run_target_time_it.it_value.tv_sec = 0;
+  global_run_target_time_it.it_value.tv_usec = 0;
+  setitimer(ITIMER_REAL, &global_run_target_time_it, NULL);
+
+  if (n == 1000) {
+    close(ctl);
+    return -1;
+  }
+
+  return ctl;
+
+}
+
+int __prefix_pre_run_target(s32 ctl, s32 first_msg, u32 start_state, u32 timeout){
+
+  struct msghdr msg;
+  struct iovec iov;
+  union {
+    struct cmsghdr hdr;
+    char buf[CMSG_SPACE(sizeof(int))];
+  } cbuf;
+  struct cmsghdr* cmsg;
+  s32 pid = 0, fd = -1;
+  u8 cmd = 'F';
+  u64 t0;
+
+  child_timed_out = 0;
+
+  memset(trace_bits, 0, MAP_SIZE);
+  MEM_BARRIER();
+
+  net_peer_closed  = 0;
+  session_msgs     = first_msg;
+  session_last_msg = -1;
+  state_reset();
+  state_prev = start_state;
+
+  t0 = get_mono_us();
+
+  if (write(ctl, &cmd, 1) != 1) return 1;
+
+  memset(&msg, 0, sizeof(msg));
+  iov.iov_base = &pid;
+  iov.iov_len  = sizeof(pid);
+  msg.msg_iov        = &iov;
+  msg.msg_iovlen     = 1;
+  msg.msg_control    = cbuf.buf;
+  msg.msg_controllen = sizeof(cbuf.buf);
+
+  if (recvmsg(ctl, &msg, 0) != sizeof(pid)) return 1;
+  cmsg = CMSG_FIRSTHDR(&msg);
+  if (!cmsg || cmsg->cmsg_type != SCM_RIGHTS) return 1;
+  memcpy(&fd, CMSG_DATA(cmsg), sizeof(int));
+
+  child_pid     = pid;
+  global_sockfd = fd;
+  prefix_ctl_fd = ctl;
+
+  timing_record(TIMING_FORK, get_mono_us() - t0);
+
+  /* A unix socketpair stands in for the session socket: no TCP_NODELAY. */
+  net_setup_socket(global_sockfd, socket_timeout_usecs, 0);
+
+  global_run_target_time_it.it_value.tv_sec = (timeout / 1000);
+  global_run_target_time_it.it_value.tv_usec = (timeout % 1000) * 1000;
+  setitimer(ITIMER_REAL, &global_run_target_time_it, NULL);
 
+  return 0;
+
+}
+
+void __prefix_release(s32 ctl){
+  /* The holder exits when its control connection is closed. */
+  close(ctl);
 }
 
 int __post_run_target(u32 timeout){
     int status = 0;
+    u8  from_snapshot;
+    u64 t0 = get_mono_us();
 
 
     //wait a bit letting the server to complete its remaing task(s)
@@ -8593,7 +9623,8 @@ int __post_run_target(u32 timeout){
       if (has_new_bits(session_virgin_bits) != 2) break;
     }
 
-    close(global_sockfd);
+    if (net_protocol == PRO_DESOCK) desock_finish();
+    else close(global_sockfd);
 
     if (terminate_child && (child_pid > 0)) kill(child_pid, SIGTERM);
 
@@ -8604,7 +9635,18 @@ int __post_run_target(u32 timeout){
     }
 
 
-      if (dumb_mode == 1 || no_forkserver) {
+  from_snapshot = prefix_ctl_fd >= 0;
+
+  if (from_snapshot) {
+
+    /* Mutant forked by a snapshot holder: the holder reaps it. */
+    if (read(prefix_ctl_fd, &status, 4) != 4) {
+      status = 0;
+      prefix_lost = 1;
+    }
+    prefix_ctl_fd = -1;
+
+  } else if (dumb_mode == 1 || no_forkserver) {
     if (waitpid(child_pid, &status, 0) <= 0) PFATAL("waitpid() failed");
 
   } else {
@@ -8621,6 +9663,8 @@ int __post_run_target(u32 timeout){
   
   if (!WIFSTOPPED(status)) child_pid = 0;
 
+  timing_record(TIMING_TEARDOWN, get_mono_us() - t0);
+
   static u32 prev_timed_out = 0;
   static u64 exec_ms = 0;
   u32 tb4;
@@ -8645,16 +9689,25 @@ int __post_run_target(u32 timeout){
 
   tb4 = *(u32*)trace_bits;
 
+  t0 = get_mono_us();
+
 #ifdef WORD_SIZE_64
   classify_counts((u64*)trace_bits);
 #else
   classify_counts((u32*)trace_bits);
 #endif /* ^WORD_SIZE_64 */
 
+  timing_record(TIMING_MAP, get_mono_us() - t0);
+
   prev_timed_out = child_timed_out;
 
   /* Report outcome to caller. */
 
+  if (prefix_lost) {
+    prefix_lost = 0;
+    return FAULT_ERROR;
+  }
+
   if (WIFSIGNALED(status) && !stop_soon) {
 
     kill_signal = WTERMSIG(status);
@@ -8693,6 +9746,32 @@ u32 __get_exec_tmout(){
 }
 
 
+u32 __timing_count(){
+  return TIMING_COUNT;
+}
+
+const char* __timing_name(u32 id){
+  return timing_names[id];
+}
+
+struct timing_hist* __timing_hist(u32 id){
+  return &timing_hists[id];
+}
+
+u64 __timing_bucket_low(u32 idx){
+  return timing_bucket_low(idx);
+}
+
+u64 __connect_retries(){
+  return connect_retries;
+}
+
+void __reset_timing_stats(){
+  memset(timing_hists, 0, sizeof(timing_hists));
+  connect_retries = 0;
+}
+
+
 u32 __trace_bytes_count(){
   return count_bytes(trace_bits);
 }
@@ -8701,6 +9780,57 @@ u32 __var_bytes_count(){
   return count_bytes(var_bytes);
 }
 
+u32 __virgin_bytes_count(){
+  return count_non_255_bytes(virgin_bits);
+}
+
+u32 __map_size(){
+  return MAP_SIZE;
+}
+
+u8* __trace_bits(){
+  return trace_bits;
+}
+
+u8 __kill_signal(){
+  return kill_signal;
+}
+
+/* Index of the message the target died on: the first one after which the
+   connection broke, or the last message sent if it never did. */
+
+s32 __last_msg_index(){
+  if (session_last_msg >= 0) return session_last_msg;
+  return session_msgs ? session_msgs - 1 : 0;
+}
+
+/* Calibration support: remember the trace of the first run, then flag every
+   byte that differs on subsequent runs as variable (see calibrate_case()). */
+
+static u8 first_trace[MAP_SIZE];
+
+void __save_first_trace(){
+  memcpy(first_trace, trace_bits, MAP_SIZE);
+}
+
+u32 __update_var_bytes(){
+
+  u32 i;
+
+  for (i = 0; i < MAP_SIZE; i++) {
+
+    if (!var_bytes[i] && first_trace[i] != trace_bits[i]) {
+
+      var_bytes[i] = 1;
+      var_byte_count++;
+
+    }
+
+  }
+
+  return var_byte_count;
+}
+
 u32 __trace_hash32(){
   return  hash32(trace_bits, MAP_SIZE, HASH_CONST);
 }
@@ -8733,9 +9863,70 @@ int __crash_has_new_bit(){
 }
 
 int __has_new_bit(){
+  new_edges_cnt = 0;
   return has_new_bits(virgin_bits);
 }
 
+u32* __new_edges(u32* cnt){
+  *cnt = new_edges_cnt;
+  return new_edges;
+}
+
+/* Protocol state model accessors (see state_extract()). */
+
+u8 __state_new(){
+  return state_new;
+}
+
+u32 __state_count(){
+  return state_cnt;
+}
+
+u32* __state_seq(u32* cnt){
+  *cnt = state_seq_cnt;
+  return state_seq;
+}
+
+u32* __state_codes(){
+  return state_codes;
+}
+
+u64* __state_execs(){
+  return state_execs;
+}
+
+/* Execs so far of the path with checksum cksum (__trace_hash32()). */
+
+u32 __path_freq(u32 cksum){
+  return path_freq ? path_freq[cksum % PATH_FREQ_SIZE] : 0;
+}
+
+/* Count the last exec towards its path. Called from the fuzzing stages only,
+   so calibration, trimming and crash / hang re-runs do not inflate the
+   counters of the entries they run. A snapshot run's trace lacks the prefix
+   and hashes differently from the same session run whole, so the caller
+   skips those. */
+
+void __count_path(){
+  if (path_freq)
+    path_freq[hash32(trace_bits, MAP_SIZE, HASH_CONST) % PATH_FREQ_SIZE]++;
+}
+
+/* Dedup predicates for the Python deterministic stages. Values are the
+   mutated bytes read as little-endian integers, as in fuzz_one(). */
+
+u8 __could_be_bitflip(u32 xor_val){
+  return could_be_bitflip(xor_val);
+}
+
+u8 __could_be_arith(u32 old_val, u32 new_val, u8 blen){
+  return could_be_arith(old_val, new_val, blen);
+}
+
+u8 __could_be_interest(u32 old_val, u32 new_val, u8 blen, u8 check_le){
+  return could_be_interest(old_val, new_val, blen, check_le);
+}
+
 
 // 添加此函数定义
 long long get_current_ms() {
@@ -0,0 +1,107 @@
+import os
+import re
+import random
+from typing import Dict, Iterable, List
+
+from utils import Extra
+
+
+# 与 config.h 一致
+MIN_AUTO_EXTRA = 3
+MAX_AUTO_EXTRA = 32
+USE_AUTO_EXTRAS = 50
+MAX_AUTO_EXTRAS = USE_AUTO_EXTRAS * 10
+
+# 响应中的可打印字符串（命令字、状态行、头部字段等）
+_PRINTABLE_RUN = re.compile(rb"[\x20-\x7e]{%d,%d}" % (MIN_AUTO_EXTRA, MAX_AUTO_EXTRA))
+
+_INTERESTING_16 = [-32768, -129, 128, 255, 256, 512, 1000, 1024, 4096, 32767]
+_INTERESTING_32 = [-2147483648, -100663046, -32769, 32768, 65535, 65536, 100663045, 2147483647]
+_INTERESTING_BYTES = (
+    {v.to_bytes(2, e, signed=True) for v in _INTERESTING_16 for e in ("big", "little")} |
+    {v.to_bytes(4, e, signed=True) for v in _INTERESTING_32 for e in ("big", "little")}
+)
+
+
+class AutoExtras:
+    """
+    自动字典（对应 afl-fuzz 的 maybe_add_auto / save_auto / load_auto）。
+
+    候选 token 有两个来源：
+      - 新路径对应的服务器响应中的可打印字符串
+      - 效应器式扫描：逐字节修改后覆盖率以相同方式变化的连续字节
+    按小写内容去重并累计命中次数，最多保留 MAX_AUTO_EXTRAS 个候选，
+    命中次数最高的 USE_AUTO_EXTRAS 个交给 Mutator.a_extras 使用，
+    并持久化到 output_dir/auto_extras，下次启动时重新载入。
+    """
+
+    def __init__(self, auto_dir: str, user_extras: Iterable[Extra] = ()):
+        self.auto_dir = auto_dir
+        self.tokens: Dict[bytes, Extra] = {}
+        self.user_tokens = {bytes(e.data).lower() for e in user_extras}
+        self.changed = False  # 有 token 加入或被淘汰，Mutator.a_extras 需要重建（由使用方清除）
+        self.dirty = False    # 自上次 save() 以来有改动（包括命中次数），top() 的排名可能变了
+
+        os.makedirs(auto_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        for file_name in sorted(os.listdir(self.auto_dir)):
+            if not file_name.startswith("auto_"):
+                continue
+            with open(os.path.join(self.auto_dir, file_name), 'rb') as f:
+                data = f.read()
+            self.maybe_add(data)
+        self.changed = False
+        self.dirty = False
+
+    def maybe_add(self, mem: bytes) -> bool:
+        """加入一个候选 token，返回是否为新 token"""
+        mem = bytes(mem)
+        if not MIN_AUTO_EXTRA <= len(mem) <= MAX_AUTO_EXTRA:
+            return False
+
+        # 跳过全部相同字节、内置 interesting 值和用户字典中已有的条目
+        if mem.count(mem[:1]) == len(mem):
+            return False
+        if mem in _INTERESTING_BYTES:
+            return False
+        key = mem.lower()
+        if key in self.user_tokens:
+            return False
+
+        self.dirty = True
+        extra = self.tokens.get(key)
+        if extra:
+            extra.hit += 1
+            return False
+
+        if len(self.tokens) >= MAX_AUTO_EXTRAS:
+            # 满了就从命中次数较低的一半里随机淘汰一个
+            ranked = sorted(self.tokens, key=lambda k: self.tokens[k].hit, reverse=True)
+            del self.tokens[random.choice(ranked[MAX_AUTO_EXTRAS // 2:])]
+
+        self.tokens[key] = Extra(mem)
+        self.changed = True
+        return True
+
+    def harvest_responses(self, responses: Iterable[bytes]):
+        for response in responses:
+            if response:
+                for token in _PRINTABLE_RUN.findall(response):
+                    self.maybe_add(token.strip())
+
+    def top(self) -> List[Extra]:
+        """命中次数最高的 USE_AUTO_EXTRAS 个 token"""
+        ranked = sorted(self.tokens.values(), key=lambda e: e.hit, reverse=True)
+        return ranked[:USE_AUTO_EXTRAS]
+
+    def save(self):
+        """与 save_auto 一样写成 auto_000000 ... 的原始文件"""
+        for file_name in os.listdir(self.auto_dir):
+            if file_name.startswith("auto_"):
+                os.unlink(os.path.join(self.auto_dir, file_name))
+        for i, extra in enumerate(self.top()):
+            with open(os.path.join(self.auto_dir, f"auto_{i:06d}"), 'wb') as f:
+                f.write(extra.data)
+        self.dirty = False
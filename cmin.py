@@ -0,0 +1,199 @@
+import os
+import json
+import heapq
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+import pyafl
+from replay import load_session
+
+
+# classify_counts 之后每个字节只有一位被置位，该位的编号就是命中次数桶
+_BUCKET_OF = np.zeros(256, dtype=np.uint32)
+for _k in range(8):
+    _BUCKET_OF[1 << _k] = _k
+
+_POPCOUNT = np.array([bin(b).count("1") for b in range(256)], dtype=np.uint8)
+
+# 与 FaultCode.NONE 一致
+FAULT_NONE = 0
+
+
+def worker_config(config: dict, worker: int) -> dict:
+    """
+    为第 worker 个执行进程生成配置：端口为 use_net 端口 + worker，
+    AFL 工作目录用 mkdtemp 新建（否则并行的 cmin / tmin 会争用同一个 out_dir 锁），
+    用完后由调用方删除 config["afl_dir"]
+    """
+    config = dict(config)
+    config["afl_dir"] = tempfile.mkdtemp(prefix=f"pyafl-cmin-{worker}-")
+
+    if config["use_net"].startswith(("fd://", "desock://")):
+        # 每个 fork server 有自己的 socketpair 交接通道 / desock 共享内存，不需要区分
+        return config
+    if config["use_net"].startswith("unix://"):
+        path = config["use_net"][len("unix://"):]
+        new_path = f"{path}.{worker}" if worker else path
+        config["use_net"] = f"unix://{new_path}"
+        config["target_cmd"] = config["target_cmd"].replace(path, new_path)
+        return config
+
+    proto_ip, _, port = config["use_net"].rpartition("/")
+    new_port = str(int(port) + worker)
+    config["use_net"] = f"{proto_ip}/{new_port}"
+
+    cmd = config["target_cmd"].split()
+    if "@@" in cmd:
+        cmd = [new_port if arg == "@@" else arg for arg in cmd]
+    elif port in cmd:
+        cmd = [new_port if arg == port else arg for arg in cmd]
+    elif worker:
+        shutil.rmtree(config["afl_dir"], ignore_errors=True)
+        raise ValueError(f"Port {port} of use_net not found in target_cmd; "
+                         f"use @@ where the server takes its port to run more than one worker")
+    config["target_cmd"] = " ".join(cmd)
+    return config
+
+
+def trace_tuples(trace: bytes) -> np.ndarray:
+    """把分类后的 trace_bits 转为 (边, 计数桶) 元组编号: edge * 8 + bucket"""
+    trace = np.frombuffer(trace, dtype=np.uint8)
+    edges = np.flatnonzero(trace).astype(np.uint32)
+    return edges * 8 + _BUCKET_OF[trace[edges]]
+
+
+def _cmin_worker(config: dict, files: List[str]) -> List[Tuple[str, Optional[np.ndarray]]]:
+    """在独立进程中启动 fork server，依次执行会话并收集元组；崩溃/超时的会话返回 None"""
+    pyafl.parse_args(json.dumps(config))
+    pyafl.set_up()
+    exec_tmout = pyafl.get_exec_tmout()
+
+    results = []
+    try:
+        for path in files:
+            pyafl.pre_run_target(exec_tmout)
+            pyafl.get_response_buff()
+            for msg in load_session(path):
+                pyafl.run_target(bytes(msg))
+                pyafl.get_response_buff()
+            fault = pyafl.post_run_target(exec_tmout)
+
+            results.append((path, trace_tuples(pyafl.trace_bits()) if fault == FAULT_NONE else None))
+    finally:
+        pyafl.clear()
+    return results
+
+
+def _cmin_task(args):
+    return _cmin_worker(*args)
+
+
+def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+    return _POPCOUNT[bits].sum(axis=-1, dtype=np.int64)
+
+
+def greedy_set_cover(tuple_sets: List[np.ndarray], sizes: List[int]) -> List[int]:
+    """
+    贪心集合覆盖：每次选择新增覆盖元组最多的会话（相同时选更小的文件）。
+    每个会话的元组集合压缩为 NumPy packed bits；由于增益只会下降，
+    使用惰性堆，只重新计算堆顶会话的增益。
+    返回选中会话的下标。
+    """
+    universe = np.unique(np.concatenate(tuple_sets)) if tuple_sets else np.empty(0, np.uint32)
+    nbytes = (len(universe) + 7) // 8
+
+    rows = np.zeros((len(tuple_sets), nbytes), dtype=np.uint8)
+    row_bytes = []  # 每行非零字节的位置，重新计算增益时只看这些字节
+    for i, tuples in enumerate(tuple_sets):
+        cols = np.searchsorted(universe, tuples)
+        np.bitwise_or.at(rows[i], cols >> 3, (0x80 >> (cols & 7)).astype(np.uint8))
+        row_bytes.append(np.unique(cols >> 3))
+
+    covered = np.zeros(nbytes, dtype=np.uint8)
+    heap = [(-gain, sizes[i], i) for i, gain in enumerate(_popcount_rows(rows))]
+    heapq.heapify(heap)
+
+    chosen = []
+    while heap:
+        neg_gain, size, i = heapq.heappop(heap)
+        pos = row_bytes[i]
+        gain = int(_popcount_rows(rows[i, pos] & ~covered[pos]))
+        if gain == 0:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, size, i))
+            continue
+        chosen.append(i)
+        covered[pos] |= rows[i, pos]
+
+    return chosen
+
+
+def minimize(config: dict, in_dir: str, out_dir: str, jobs: int = 1) -> List[str]:
+    files = sorted(str(p) for p in Path(in_dir).glob("*.raw"))
+    if not files:
+        raise FileNotFoundError(f"No .raw sessions found in {in_dir}")
+
+    jobs = max(1, min(jobs, len(files)))
+    print(f"Executing {len(files)} sessions with {jobs} workers:")
+
+    results = []
+    configs = []
+    # 每个 worker 独占一个新进程（pyafl 的 fork server 状态是进程级全局的）
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        for w in range(jobs):
+            configs.append(worker_config(config, w))
+        with ctx.Pool(processes=jobs, maxtasksperchild=1) as pool, \
+                tqdm(total=len(files), desc="Executing") as pbar:
+            tasks = [(configs[w], files[w::jobs]) for w in range(jobs)]
+            for batch in pool.imap_unordered(_cmin_task, tasks):
+                results.extend(batch)
+                pbar.update(len(batch))
+    finally:
+        for worker_conf in configs:
+            shutil.rmtree(worker_conf["afl_dir"], ignore_errors=True)
+
+    results.sort()
+    rejected = sum(1 for _, tuples in results if tuples is None)
+    results = [(path, tuples) for path, tuples in results if tuples is not None]
+    if rejected:
+        print(f"Skipped {rejected} crashing or timing out sessions")
+
+    chosen = greedy_set_cover([tuples for _, tuples in results],
+                              [os.path.getsize(path) for path, _ in results])
+
+    os.makedirs(out_dir, exist_ok=True)
+    kept = []
+    for i in sorted(chosen):
+        path = results[i][0]
+        shutil.copy2(path, out_dir)
+        kept.append(path)
+
+    print(f"Narrowed down to {len(kept)} sessions, saved in {out_dir}")
+    return kept
+
+
+# python3 main.py cmin ./configs/openssl.json -o ./min-queue -j 8
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py cmin",
+                                     description="Minimize a queue of .raw sessions by edge coverage")
+    parser.add_argument("config", help="Path to the configuration JSON file")
+    parser.add_argument("-i", "--input", help="Directory with .raw sessions (default: <output_dir>/queue)")
+    parser.add_argument("-o", "--output", required=True, help="Directory for the minimized corpus")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Parallel workers (worker w uses use_net port + w)")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    in_dir = args.input or os.path.join(config["output_dir"], "queue")
+    minimize(config, in_dir, args.output, args.jobs)
@@ -96,6 +96,12 @@
 
 #define HAVOC_MAX_MULT      16
 
+/* Power schedules ("schedule": "fast" / "coe"): number of counters for
+   how often each path (checksum of the classified trace) is exercised.
+   Paths whose checksums collide share a counter: */
+
+#define PATH_FREQ_SIZE      (1 << 20)
+
 /* Absolute minimum number of havoc cycles (after all adjustments): */
 
 #define HAVOC_MIN           16
@@ -303,6 +309,27 @@
 
 #define FORKSRV_FD          198
 
+/* Abstract unix socket name a libprefixfork snapshot holder listens on; %d
+   is the pid of the target process that was snapshotted: */
+
+#define PREFIX_SOCK_NAME    "pyafl-prefix-%d"
+
+/* Descriptor on which fd:// targets receive the session socket from the
+   fuzzer (SCM_RIGHTS, one socketpair end per exec; see libsockpair/): */
+
+#define SOCK_HANDOFF_FD     (FORKSRV_FD - 2)
+
+/* desock:// transport (see libdesock/): yield pipe descriptor in the
+   target, environment variable carrying the ring's shm id, the sizes of the
+   message ring and of the response area, and how many times the fuzzer
+   polls the ring for the target's answer before it goes to sleep: */
+
+#define DESOCK_FD           (FORKSRV_FD - 4)
+#define DESOCK_SHM_ENV_VAR  "__PYAFL_DESOCK_SHM_ID"
+#define DESOCK_RING_SIZE    (1 << 20)
+#define DESOCK_RESP_SIZE    (1 << 20)
+#define DESOCK_SPIN         2000
+
 /* Fork server init timeout multiplier: we'll wait the user-selected
    timeout plus this much for the fork server to spin up. */
 
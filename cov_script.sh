@@ -1,84 +0,0 @@
-#!/bin/bash
-# ./cov_script.sh /home/ubuntu/experiments/out-openssl-pyafl 4433 50 /home/ubuntu/pyafl/pyafl-openssl.csv
-
-folder=$1   #fuzzer result folder
-pno=$2      #port number
-step=$3     #step to skip running gcovr and outputting data to covfile
-            #e.g., step=5 means we run gcovr after every 5 test cases
-covfile=$4  #path to coverage file
-
-
-cd /home/ubuntu/experiments/openssl-gcov
-
-#delete the existing coverage file
-rm $covfile; touch $covfile
-
-#clear gcov data
-gcovr -r . -s -d > /dev/null 2>&1
-
-#output the header of the coverage file which is in the CSV format
-#Time: timestamp, l_per/b_per and l_abs/b_abs: line/branch coverage in percentage and absolutate number
-echo "Time,l_per,l_abs,b_per,b_abs" >> $covfile
-
-#files stored in replayable-* folders are structured
-#in such a way that messages are separated
-# if [ $fmode -eq "1" ]; then
-#   testdir="replayable-queue"
-#   replayer="aflnet-replay"
-# else
-#   testdir="queue"
-#   replayer="aflnet-replay"
-# fi
-testdir="queue"
-# testdir="in-tls"
-replayer="/home/ubuntu/pyafl/aflnet-replay"
-#process seeds first
-# for f in $(echo $folder/$testdir/*.raw); do 
-#   time=$(stat -c %Y $f)
-    
-#   $replayer $f TLS $pno 100 > /dev/null 2>&1 &
-#   timeout -k 0 3s ./apps/openssl s_server -key key.pem -cert cert.pem -4 -naccept 1 -no_anti_replay > /dev/null 2>&1
-  
-#   wait
-#   cov_data=$(gcovr -r . -s | grep "[lb][a-z]*:")
-#   l_per=$(echo "$cov_data" | grep lines | cut -d" " -f2 | rev | cut -c2- | rev)
-#   l_abs=$(echo "$cov_data" | grep lines | cut -d" " -f3 | cut -c2-)
-#   b_per=$(echo "$cov_data" | grep branch | cut -d" " -f2 | rev | cut -c2- | rev)
-#   b_abs=$(echo "$cov_data" | grep branch | cut -d" " -f3 | cut -c2-)
-  
-#   echo "$time,$l_per,$l_abs,$b_per,$b_abs" >> $covfile
-# done
-
-#process other testcases
-count=0
-for f in $(echo $folder/$testdir/*); do 
-  time=$(stat -c %Y $f)
-  
-  $replayer $f TLS $pno 100 > /dev/null 2>&1 &
-  timeout -k 0 3s ./apps/openssl s_server -key key.pem -cert cert.pem -4 -naccept 1 -no_anti_replay > /dev/null 2>&1
-
-  wait
-  count=$(expr $count + 1)
-  rem=$(expr $count % $step)
-  if [ "$rem" != "0" ]; then continue; fi
-  cov_data=$(gcovr -r . -s | grep "[lb][a-z]*:")
-  l_per=$(echo "$cov_data" | grep lines | cut -d" " -f2 | rev | cut -c2- | rev)
-  l_abs=$(echo "$cov_data" | grep lines | cut -d" " -f3 | cut -c2-)
-  b_per=$(echo "$cov_data" | grep branch | cut -d" " -f2 | rev | cut -c2- | rev)
-  b_abs=$(echo "$cov_data" | grep branch | cut -d" " -f3 | cut -c2-)
-  
-  echo "$time,$l_per,$l_abs,$b_per,$b_abs" >> $covfile
-done
-
-#ouput cov data for the last testcase(s) if step > 1
-if [[ $step -gt 1 ]]
-then
-  time=$(stat -c %Y $f)
-  cov_data=$(gcovr -r . -s | grep "[lb][a-z]*:")
-  l_per=$(echo "$cov_data" | grep lines | cut -d" " -f2 | rev | cut -c2- | rev)
-  l_abs=$(echo "$cov_data" | grep lines | cut -d" " -f3 | cut -c2-)
-  b_per=$(echo "$cov_data" | grep branch | cut -d" " -f2 | rev | cut -c2- | rev)
-  b_abs=$(echo "$cov_data" | grep branch | cut -d" " -f3 | cut -c2-)
-  
-  echo "$time,$l_per,$l_abs,$b_per,$b_abs" >> $covfile
-fi
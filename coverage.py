@@ -1,32 +1,156 @@
 #!/usr/bin/env python3
 import os
+import json
 import time
+import shutil
+import tempfile
 import subprocess
 from pathlib import Path
 import argparse
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 from tqdm import tqdm
 
+from replay import replay_batch
+
+DEFAULT_WORK_DIR = "/home/ubuntu/experiments/openssl-gcov"
+
+OPENSSL_CMD = [
+    "./apps/openssl", "s_server",
+    "-key", "key.pem",
+    "-cert", "cert.pem",
+    "-4", "-naccept", "1",
+    "-no_anti_replay"
+]
+
+
+def _replay_batch(test_files: List[Path], port: int, gcov_prefix: str,
+                  server_cmd: List[str]) -> int:
+    """Worker entry point: replay test cases with a private port and GCOV_PREFIX"""
+    env = dict(os.environ, GCOV_PREFIX=gcov_prefix, GCOV_PREFIX_STRIP="0")
+    replay_batch(test_files, port, server_cmd, env)
+    return len(test_files)
+
+
+def _popcount(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+class _FileCoverage:
+    """Cumulative line/branch bitsets for one source file"""
+
+    def __init__(self):
+        self.lines = 0          # bit n set: line n is instrumented
+        self.lines_hit = 0      # bit n set: line n was executed
+        self.branch_ids = {}    # (line, branch index) -> bit
+        self.branches = 0
+        self.branches_hit = 0
+
+    def add_line(self, line: dict):
+        bit = 1 << line["line_number"]
+        self.lines |= bit
+        if line["count"]:
+            self.lines_hit |= bit
+
+        for idx, branch in enumerate(line["branches"]):
+            key = (line["line_number"], idx)
+            if key not in self.branch_ids:
+                self.branch_ids[key] = len(self.branch_ids)
+            bit = 1 << self.branch_ids[key]
+            self.branches |= bit
+            if branch["count"]:
+                self.branches_hit |= bit
+
+
+class IncrementalCoverage:
+    """
+    Incremental replacement for "gcovr -r . -s". The set of instrumented lines
+    and branches is read from every .gcno once; afterwards each update() only
+    runs gcov on objects whose .gcda changed since the previous call (by mtime)
+    and ORs the result into per-source-file bitsets. Profiles only ever grow
+    while replaying, so the union equals what gcovr would report.
+    """
+
+    GCOV_BATCH = 256
+
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+        self.files: Dict[str, _FileCoverage] = {}
+        self.mtimes: Dict[Path, int] = {}
+        self.objects = sorted(self.root.rglob("*.gcno"))
+
+        for gcno in self.objects:
+            self._changed(gcno.with_suffix(".gcda"))
+        self._ingest(self.objects)
+
+    def _changed(self, gcda: Path) -> bool:
+        try:
+            mtime = gcda.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if self.mtimes.get(gcda) == mtime:
+            return False
+        self.mtimes[gcda] = mtime
+        return True
+
+    def _ingest(self, objects: List[Path]):
+        for start in range(0, len(objects), self.GCOV_BATCH):
+            batch = [str(obj) for obj in objects[start:start + self.GCOV_BATCH]]
+            result = subprocess.run(
+                ["gcov", "--json-format", "--stdout", "--branch-probabilities"] + batch,
+                cwd=self.root, capture_output=True, text=True
+            )
+            for line in result.stdout.splitlines():
+                if not line.startswith("{"):
+                    continue
+                report = json.loads(line)
+                cwd = report.get("current_working_directory", str(self.root))
+                for src in report["files"]:
+                    path = os.path.normpath(os.path.join(cwd, src["file"]))
+                    if not path.startswith(str(self.root) + os.sep):
+                        continue  # same filter as gcovr -r .
+                    cov = self.files.setdefault(path, _FileCoverage())
+                    for src_line in src["lines"]:
+                        cov.add_line(src_line)
+
+    def update(self) -> Tuple[float, int, float, int]:
+        """Ingest changed profiles and return (l_per, l_abs, b_per, b_abs)"""
+        changed = [gcno for gcno in self.objects if self._changed(gcno.with_suffix(".gcda"))]
+        if changed:
+            self._ingest(changed)
+
+        lines = sum(_popcount(f.lines) for f in self.files.values())
+        lines_hit = sum(_popcount(f.lines_hit) for f in self.files.values())
+        branches = sum(_popcount(f.branches) for f in self.files.values())
+        branches_hit = sum(_popcount(f.branches_hit) for f in self.files.values())
+
+        return (
+            round(lines_hit * 100.0 / lines, 1) if lines else 0.0,
+            lines_hit,
+            round(branches_hit * 100.0 / branches, 1) if branches else 0.0,
+            branches_hit
+        )
+
+
 class CoverageCollector:
-    def __init__(self, folder: str, pno: int, step: int, covfile: str):
+    def __init__(self, folder: str, pno: int, step: int, covfile: str,
+                 jobs: int = 1, server_cmd: Optional[List[str]] = None,
+                 incremental: bool = False):
         self.folder = Path(folder)
         self.pno = pno
         self.step = step
         self.covfile = Path(covfile)
+        self.jobs = max(1, jobs)
         self.testdir = "queue"
-        self.replayer = "afl-replay"
-        self.openssl_cmd = [
-            "./apps/openssl", "s_server",
-            "-key", "key.pem",
-            "-cert", "cert.pem",
-            "-4", "-naccept", "1",
-            "-no_anti_replay"
-        ]
+        self.server_cmd = server_cmd or OPENSSL_CMD
+        self.work_dir = Path.cwd()
+        self._has_gcda = False
         
         # Initialize coverage file
         self.covfile.unlink(missing_ok=True)
         self.covfile.touch()
         self._run_gcovr(clear=True)
+        self.engine = IncrementalCoverage(self.work_dir) if incremental else None
         with self.covfile.open('a') as f:
             f.write("Time,l_per,l_abs,b_per,b_abs\n")
 
@@ -57,54 +181,84 @@ class CoverageCollector:
             int(coverage["branches_abs"])
         )
 
-    def _run_test_case(self, test_file: Path) -> float:
-        """Execute a single test case and return timestamp"""
-        # Run replayer in background
-        replayer_cmd = [
-            self.replayer,
-            str(test_file),
-            "TLS",
-            str(self.pno),
-            "100"
-        ]
-        replayer_proc = subprocess.Popen(
-            replayer_cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
+    def _measure(self) -> Tuple[float, int, float, int]:
+        """Current cumulative coverage, from the incremental engine or gcovr"""
+        if self.engine:
+            return self.engine.update()
+        return self._run_gcovr()
 
-        # Run OpenSSL server with timeout
-        try:
+    def _merge_gcda(self, gcov_prefix: Path):
+        """Merge the .gcda files one worker wrote under its GCOV_PREFIX into the build tree"""
+        src = Path(str(gcov_prefix) + str(self.work_dir))
+        if not src.is_dir() or not any(src.rglob("*.gcda")):
+            return
+
+        if not self._has_gcda:
+            # gcov-tool cannot merge into a tree without profiles; seed it with a copy
+            shutil.copytree(src, self.work_dir, dirs_exist_ok=True)
+            self._has_gcda = True
+        else:
             subprocess.run(
-                ["timeout", "-k", "0", "3s"] + self.openssl_cmd,
+                ["gcov-tool", "merge", "-o", str(self.work_dir), str(self.work_dir), str(src)],
                 stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
                 check=True
             )
-        except subprocess.CalledProcessError:
-            pass  # Expected timeout
 
-        replayer_proc.wait()
-        return test_file.stat().st_mtime
+        shutil.rmtree(gcov_prefix)
+        gcov_prefix.mkdir()
 
     def collect_coverage(self):
         """Main method to collect coverage data"""
-        # Get all .raw test files
-        test_files = list(self.folder.glob(f"{self.testdir}/*.raw"))
+        # Get all .raw test files, in discovery order
+        test_files = sorted(self.folder.glob(f"{self.testdir}/*.raw"))
+
+        if self.jobs > 1:
+            self._collect_coverage_parallel(test_files)
+            return
         
-        # Process files with progress bar
+        # Each step-sized chunk is streamed through one server instance
         print("Processing test files:")
-        for i, test_file in enumerate(tqdm(test_files, desc="Processing"), 1):
-            timestamp = self._run_test_case(test_file)
-            
-            if i % self.step == 0:
-                cov_data = self._run_gcovr()
-                self._write_coverage(timestamp, *cov_data)
-
-        # Final coverage data if step > 1
-        if self.step > 1 and test_files:
-            cov_data = self._run_gcovr()
-            self._write_coverage(timestamp, *cov_data)
+        with tqdm(total=len(test_files), desc="Processing") as pbar:
+            for start in range(0, len(test_files), self.step):
+                chunk = test_files[start:start + self.step]
+                replay_batch(chunk, self.pno, self.server_cmd)
+                pbar.update(len(chunk))
+
+                cov_data = self._measure()
+                self._write_coverage(chunk[-1].stat().st_mtime, *cov_data)
+
+    def _collect_coverage_parallel(self, test_files: List[Path]):
+        """
+        Replay each step-sized chunk of test cases across a process pool. Worker w
+        uses port pno + w and its own GCOV_PREFIX; their profiles are merged
+        into the build tree before gcovr runs, so the CSV matches the serial mode.
+        """
+        prefix_root = Path(tempfile.mkdtemp(prefix="pyafl-cov-"))
+        prefixes = [prefix_root / f"w{w}" for w in range(self.jobs)]
+        for prefix in prefixes:
+            prefix.mkdir()
+
+        print(f"Processing test files with {self.jobs} workers:")
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool, \
+                    tqdm(total=len(test_files), desc="Processing") as pbar:
+                for start in range(0, len(test_files), self.step):
+                    chunk = test_files[start:start + self.step]
+                    futures = [
+                        pool.submit(_replay_batch, chunk[w::self.jobs], self.pno + w,
+                                    str(prefixes[w]), self.server_cmd)
+                        for w in range(self.jobs) if chunk[w::self.jobs]
+                    ]
+                    for future in as_completed(futures):
+                        pbar.update(future.result())
+
+                    for prefix in prefixes:
+                        self._merge_gcda(prefix)
+
+                    cov_data = self._measure()
+                    self._write_coverage(chunk[-1].stat().st_mtime, *cov_data)
+        finally:
+            shutil.rmtree(prefix_root, ignore_errors=True)
 
     def _write_coverage(self, timestamp: float, l_per: float, 
                        l_abs: int, b_per: float, b_abs: int):
@@ -119,13 +273,33 @@ def main():
     parser.add_argument("pno", type=int, help="Port number")
     parser.add_argument("step", type=int, help="Step size for coverage collection")
     parser.add_argument("covfile", help="Path to coverage file")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Parallel replay workers (worker w uses port pno + w)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Read only changed .gcda files per step instead of running gcovr")
+    parser.add_argument("--conf", help="pyafl config; its \"coverage\" section supplies "
+                                       "work_dir, target_cmd and parrallel")
     
     args = parser.parse_args()
+
+    work_dir = DEFAULT_WORK_DIR
+    server_cmd = None
+    jobs = args.jobs
+    if args.conf:
+        with open(args.conf, 'r', encoding='utf-8') as f:
+            cov_conf = json.load(f).get("coverage", {})
+        work_dir = cov_conf.get("work_dir", work_dir)
+        if "target_cmd" in cov_conf:
+            server_cmd = cov_conf["target_cmd"].split()
+        if jobs is None and cov_conf.get("parrallel") == "True":
+            jobs = os.cpu_count()
     
-    # Change to OpenSSL directory
-    os.chdir("/home/ubuntu/experiments/openssl-gcov")
+    # Change to the gcov build directory
+    os.chdir(work_dir)
     
-    collector = CoverageCollector(args.folder, args.pno, args.step, args.covfile)
+    collector = CoverageCollector(args.folder, args.pno, args.step, args.covfile,
+                                  jobs=jobs or 1, server_cmd=server_cmd,
+                                  incremental=args.incremental)
     collector.collect_coverage()
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+import os
+import json
+import time
+from typing import Dict, Optional, Tuple
+
+
+class CrashBucket:
+    def __init__(self, file_path: str, trace_hash: int, signal: int, last_msg: int, total_exec: int):
+        self.file_path = file_path
+        self.trace_hash = trace_hash
+        self.signal = signal
+        self.last_msg = last_msg
+        self.count = 1
+        self.first_time = self.last_time = time.time()
+        self.first_exec = total_exec
+
+    def to_dict(self) -> dict:
+        return {
+            "file": os.path.basename(self.file_path),
+            "trace_hash": f"{self.trace_hash:08x}",
+            "signal": self.signal,
+            "last_msg": self.last_msg,
+            "count": self.count,
+            "first_time": int(self.first_time),
+            "last_time": int(self.last_time),
+            "first_exec": self.first_exec,
+        }
+
+
+class CrashBuckets:
+    """
+    崩溃去重与分桶。
+
+    以 (简化 trace hash, 信号, 崩溃时的消息下标) 作为桶的 key，
+    每个桶只保存一个代表用例，重复的崩溃只增加计数，不再写文件。
+    所有桶记录在 output_dir/crash_index.json 中，供分诊时查找。
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.buckets: Dict[Tuple[int, int, int], CrashBucket] = {}
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def hit(self, trace_hash: int, signal: int, last_msg: int) -> Optional[CrashBucket]:
+        """已有的桶计数加一并返回；新的 key 返回 None"""
+        bucket = self.buckets.get((trace_hash, signal, last_msg))
+        if bucket:
+            bucket.count += 1
+            bucket.last_time = time.time()
+            self.dirty = True
+        return bucket
+
+    def add(self, file_path: str, trace_hash: int, signal: int, last_msg: int, total_exec: int) -> CrashBucket:
+        bucket = CrashBucket(file_path, trace_hash, signal, last_msg, total_exec)
+        self.buckets[(trace_hash, signal, last_msg)] = bucket
+        self.write_index()
+        return bucket
+
+    def write_index(self):
+        """原子地重写索引文件（新桶出现时立即写，计数随 fuzzer_stats 定期刷新）"""
+        index = {
+            "buckets": len(self.buckets),
+            "crashes": sum(b.count for b in self.buckets.values()),
+            "entries": [b.to_dict() for b in self.buckets.values()],
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
@@ -0,0 +1,110 @@
+/*
+   pyafl - desock shared memory layout
+   -----------------------------------
+
+   Shared between the fuzzer (afl-python.c) and libdesock, which makes a
+   network server read its session from shared memory instead of a socket
+   ("use_net": "desock://", see libdesock/README.desock).
+
+   The fuzzer appends every message to the ring as a [u32 len][data] record.
+   A whole session can be staged past wr in one go; a message is delivered
+   by moving wr over its record and ringing the bell: bumping the bell word
+   and, only if the target is asleep on it, a futex wake. The target's
+   read() / recv() calls return data from the current record only, so
+   message boundaries are kept. When the target has consumed everything and
+   asks for more, it stores the number of messages it has started reading
+   in want (DESOCK_CLOSED once it closed the connection) and goes to sleep
+   on the bell; only if the fuzzer is asleep itself does it also write a
+   byte to the yield pipe (DESOCK_FD in the target), which the fuzzer polls
+   together with the fork server status pipe. The fuzzer then takes the
+   bytes the target sent meanwhile from resp[].
+
+   wr and rd only ever grow; positions in data[] are taken modulo
+   DESOCK_RING_SIZE.
+
+*/
+
+#ifndef _HAVE_DESOCK_H
+#define _HAVE_DESOCK_H
+
+#include <string.h>
+#include <unistd.h>
+#include <time.h>
+#include <sys/syscall.h>
+#include <linux/futex.h>
+
+#include "types.h"
+#include "config.h"
+
+#define DESOCK_CLOSED  0xffffffff     /* want: target closed connection   */
+
+/* The sleeping flags are stored before the other side's word is checked
+   again, and the other side stores its word before checking the flag:
+   these need a full fence, not just a compiler barrier. */
+
+#define DESOCK_FENCE() __sync_synchronize()
+
+#if defined(__x86_64__) || defined(__i386__)
+#  define DESOCK_PAUSE() __builtin_ia32_pause()
+#else
+#  define DESOCK_PAUSE() MEM_BARRIER()
+#endif /* ^x86 */
+
+struct desock_ring {
+
+  volatile u32 wr;                    /* Bytes appended by the fuzzer     */
+  volatile u32 rd;                    /* Bytes consumed by the target     */
+  volatile u32 eof;                   /* No more messages this session    */
+  volatile u32 resp_len;              /* Bytes in resp[]                  */
+
+  volatile u32 bell;                  /* Doorbell (futex word)            */
+  volatile u32 target_sleeping;       /* Target waits on bell             */
+  volatile u32 want;                  /* Messages the target asked for    */
+  volatile u32 fuzzer_sleeping;       /* Fuzzer waits on the yield pipe   */
+
+  u8 data[DESOCK_RING_SIZE];          /* Message records                  */
+  u8 resp[DESOCK_RESP_SIZE];          /* Everything the target sent       */
+
+};
+
+
+/* Copy len bytes in / out of the ring at position pos, wrapping around. */
+
+static inline void desock_copy_in(struct desock_ring* ring, u32 pos, const u8* src, u32 len) {
+
+  u32 off = pos % DESOCK_RING_SIZE, first = MIN(len, DESOCK_RING_SIZE - off);
+
+  memcpy(ring->data + off, src, first);
+  memcpy(ring->data, src + first, len - first);
+
+}
+
+static inline void desock_copy_out(struct desock_ring* ring, u32 pos, u8* dst, u32 len) {
+
+  u32 off = pos % DESOCK_RING_SIZE, first = MIN(len, DESOCK_RING_SIZE - off);
+
+  memcpy(dst, ring->data + off, first);
+  memcpy(dst + first, ring->data, len - first);
+
+}
+
+
+/* Sleep while *addr == val (at most timeout_ms), wake one sleeper. The ring
+   is mapped at different addresses, so these are shared (not private)
+   futexes. */
+
+static inline int desock_futex_wait(volatile u32* addr, u32 val, u32 timeout_ms) {
+
+  struct timespec ts = { timeout_ms / 1000, (timeout_ms % 1000) * 1000000 };
+
+  return syscall(SYS_futex, addr, FUTEX_WAIT, val, &ts, NULL, 0);
+
+}
+
+static inline void desock_futex_wake(volatile u32* addr) {
+
+  syscall(SYS_futex, addr, FUTEX_WAKE, 1, NULL, NULL, 0);
+
+}
+
+#endif /* !_HAVE_DESOCK_H */
@@ -0,0 +1,717 @@
+/*
+
+   pyafl - desocketing library
+   ---------------------------
+
+   This Linux-only companion library makes a network server read its
+   session straight from shared memory instead of a socket when fuzzed with
+   "use_net": "desock://". See README.desock for more info, and desock.h
+   for the shared memory layout and the bell / yield protocol.
+
+   bind() on an AF_INET / AF_INET6 socket does not bind anything; the
+   socket is remembered as a fake listener (stream) or a fake connected
+   datagram socket. The first accept() on a fake listener returns a fake
+   connection, the second one ends the process: the session is over.
+   Reads on fake connections return data from the current message in the
+   ring and sleep on the bell when there is none; writes are appended
+   to the response area. poll(), select() and epoll report fake sockets as
+   ready, so event-loop servers get to their read() calls.
+
+   Sockets that are never bound (outgoing connections) are left alone, and
+   without the shared memory id in the environment every call goes to libc.
+
+*/
+
+#define _GNU_SOURCE
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <dlfcn.h>
+#include <errno.h>
+#include <poll.h>
+#include <sys/select.h>
+#include <sys/epoll.h>
+#include <sys/socket.h>
+#include <sys/shm.h>
+#include <sys/uio.h>
+#include <netinet/in.h>
+#include <arpa/inet.h>
+
+#include "../types.h"
+#include "../config.h"
+#include "../desock.h"
+
+#ifndef __linux__
+#  error "Sorry, this library is Linux-specific for now!"
+#endif /* !__linux__ */
+
+#define DESOCK_MAX_FD    1024          /* Fake sockets tracked below this  */
+#define DESOCK_MAX_EPOLL 64            /* Fake sockets registered in epoll */
+
+enum {
+  /* 00 */ DS_NONE,
+  /* 01 */ DS_LISTEN,                  /* Bound stream socket             */
+  /* 02 */ DS_CONN,                    /* Returned by accept()            */
+  /* 03 */ DS_DGRAM                    /* Bound datagram socket           */
+};
+
+static struct desock_ring* ring;       /* NULL: pass everything through   */
+
+static u8  kind[DESOCK_MAX_FD];
+static u8  accepted;                   /* Fake connection handed out      */
+static u8  conn_closed;                /* ... and closed again            */
+static u32 cur_left;                   /* Unread bytes of current message */
+static u32 seen;                       /* Messages started so far         */
+
+static struct {
+  int epfd, fd;
+  struct epoll_event ev;
+} ep[DESOCK_MAX_EPOLL];
+
+#define OURS(_fd) ((_fd) >= 0 && (_fd) < DESOCK_MAX_FD && kind[_fd])
+
+/* Once the connection is gone the listener turns readable again, so that
+   event-loop servers call accept() and end the session. */
+#define READABLE(_fd) (kind[_fd] != DS_LISTEN || !accepted || conn_closed)
+
+/* libc versions, looked up on first use (which may come before our
+   constructor runs). */
+
+static u8 resolved;
+static void __desock_resolve(void);
+
+#define REAL(_f) ((resolved ? 0 : (__desock_resolve(), 0)), __desock_##_f)
+
+static int (*__desock_bind)(int, const struct sockaddr*, socklen_t);
+static int (*__desock_listen)(int, int);
+static int (*__desock_accept)(int, struct sockaddr*, socklen_t*);
+static int (*__desock_accept4)(int, struct sockaddr*, socklen_t*, int);
+static ssize_t (*__desock_read)(int, void*, size_t);
+static ssize_t (*__desock___read_chk)(int, void*, size_t, size_t);
+static ssize_t (*__desock_readv)(int, const struct iovec*, int);
+static ssize_t (*__desock_recv)(int, void*, size_t, int);
+static ssize_t (*__desock___recv_chk)(int, void*, size_t, size_t, int);
+static ssize_t (*__desock_recvfrom)(int, void*, size_t, int, struct sockaddr*, socklen_t*);
+static ssize_t (*__desock___recvfrom_chk)(int, void*, size_t, size_t, int, struct sockaddr*, socklen_t*);
+static ssize_t (*__desock_recvmsg)(int, struct msghdr*, int);
+static ssize_t (*__desock_write)(int, const void*, size_t);
+static ssize_t (*__desock_writev)(int, const struct iovec*, int);
+static ssize_t (*__desock_send)(int, const void*, size_t, int);
+static ssize_t (*__desock_sendto)(int, const void*, size_t, int, const struct sockaddr*, socklen_t);
+static ssize_t (*__desock_sendmsg)(int, const struct msghdr*, int);
+static int (*__desock_close)(int);
+static int (*__desock_shutdown)(int, int);
+static int (*__desock_setsockopt)(int, int, int, const void*, socklen_t);
+static int (*__desock_getsockopt)(int, int, int, void*, socklen_t*);
+static int (*__desock_getpeername)(int, struct sockaddr*, socklen_t*);
+static int (*__desock_poll)(struct pollfd*, nfds_t, int);
+static int (*__desock_select)(int, fd_set*, fd_set*, fd_set*, struct timeval*);
+static int (*__desock_epoll_ctl)(int, int, int, struct epoll_event*);
+static int (*__desock_epoll_wait)(int, struct epoll_event*, int, int);
+
+
+static void __desock_resolve(void) {
+
+  __desock_bind = dlsym(RTLD_NEXT, "bind");
+  __desock_listen = dlsym(RTLD_NEXT, "listen");
+  __desock_accept = dlsym(RTLD_NEXT, "accept");
+  __desock_accept4 = dlsym(RTLD_NEXT, "accept4");
+  __desock_read = dlsym(RTLD_NEXT, "read");
+  __desock___read_chk = dlsym(RTLD_NEXT, "__read_chk");
+  __desock_readv = dlsym(RTLD_NEXT, "readv");
+  __desock_recv = dlsym(RTLD_NEXT, "recv");
+  __desock___recv_chk = dlsym(RTLD_NEXT, "__recv_chk");
+  __desock_recvfrom = dlsym(RTLD_NEXT, "recvfrom");
+  __desock___recvfrom_chk = dlsym(RTLD_NEXT, "__recvfrom_chk");
+  __desock_recvmsg = dlsym(RTLD_NEXT, "recvmsg");
+  __desock_write = dlsym(RTLD_NEXT, "write");
+  __desock_writev = dlsym(RTLD_NEXT, "writev");
+  __desock_send = dlsym(RTLD_NEXT, "send");
+  __desock_sendto = dlsym(RTLD_NEXT, "sendto");
+  __desock_sendmsg = dlsym(RTLD_NEXT, "sendmsg");
+  __desock_close = dlsym(RTLD_NEXT, "close");
+  __desock_shutdown = dlsym(RTLD_NEXT, "shutdown");
+  __desock_setsockopt = dlsym(RTLD_NEXT, "setsockopt");
+  __desock_getsockopt = dlsym(RTLD_NEXT, "getsockopt");
+  __desock_getpeername = dlsym(RTLD_NEXT, "getpeername");
+  __desock_poll = dlsym(RTLD_NEXT, "poll");
+  __desock_select = dlsym(RTLD_NEXT, "select");
+  __desock_epoll_ctl = dlsym(RTLD_NEXT, "epoll_ctl");
+  __desock_epoll_wait = dlsym(RTLD_NEXT, "epoll_wait");
+
+  resolved = 1;
+
+}
+
+
+/* Tell the fuzzer (if it is asleep, through the yield pipe as well). */
+
+static void __desock_yield(u32 val) {
+
+  u8 b = 1;
+
+  ring->want = val;
+  DESOCK_FENCE();
+
+  if (ring->fuzzer_sleeping) REAL(write)(DESOCK_FD, &b, 1);
+
+}
+
+
+/* Ask for the next message and sleep on the bell until the fuzzer delivers
+   it or ends the session. Returns 0 if the fuzzer is gone. */
+
+static int __desock_wait(void) {
+
+  static pid_t parent;
+  u32 bell = ring->bell;
+
+  DESOCK_FENCE();
+  if (ring->rd != ring->wr || ring->eof) return 1;
+
+  if (!parent) parent = getppid();
+
+  __desock_yield(seen);
+
+  while (ring->bell == bell) {
+
+    ring->target_sleeping = 1;
+    DESOCK_FENCE();
+
+    /* Orphaned after a long wait: nobody will ever ring. */
+    if (ring->bell == bell && desock_futex_wait(&ring->bell, bell, 1000) &&
+        errno == ETIMEDOUT && getppid() != parent) return 0;
+
+    ring->target_sleeping = 0;
+
+  }
+
+  return 1;
+
+}
+
+
+static void __desock_closed(void) {
+
+  conn_closed = 1;
+  __desock_yield(DESOCK_CLOSED);
+
+}
+
+
+static void __desock_peer(struct sockaddr* addr, socklen_t* addrlen) {
+
+  struct sockaddr_in peer;
+
+  if (!addr || !addrlen) return;
+
+  memset(&peer, 0, sizeof(peer));
+  peer.sin_family      = AF_INET;
+  peer.sin_addr.s_addr = htonl(INADDR_LOOPBACK);
+  memcpy(addr, &peer, MIN(*addrlen, sizeof(peer)));
+  *addrlen = sizeof(peer);
+
+}
+
+
+/* Read from the current message. Stream sockets never get more than one
+   message per call; datagram sockets get one whole message (truncated to
+   len) per call. */
+
+static ssize_t __desock_recv_data(int fd, u8* buf, size_t len, u8 peek) {
+
+  u32 n;
+
+  while (!cur_left) {
+
+    if (ring->rd != ring->wr) {
+      desock_copy_out(ring, ring->rd, (u8*)&cur_left, 4);
+      ring->rd += 4;
+      seen++;
+      continue;
+    }
+
+    if (ring->eof) return 0;
+    if (!__desock_wait()) return 0;
+
+  }
+
+  n = MIN(len, cur_left);
+  desock_copy_out(ring, ring->rd, buf, n);
+
+  if (peek) return n;
+
+  if (kind[fd] == DS_DGRAM) {
+    ring->rd += cur_left;
+    cur_left  = 0;
+  } else {
+    ring->rd += n;
+    cur_left -= n;
+  }
+
+  return n;
+
+}
+
+
+static ssize_t __desock_recv_iov(int fd, const struct iovec* iov, int cnt) {
+
+  ssize_t total = 0, n;
+  int i;
+
+  /* Only the first chunk may block; the rest only takes what is left of
+     the message. */
+  for (i = 0; i < cnt; i++) {
+    if (i && !cur_left) break;
+    n = __desock_recv_data(fd, iov[i].iov_base, iov[i].iov_len, 0);
+    if (n <= 0) break;
+    total += n;
+  }
+
+  return total;
+
+}
+
+
+static ssize_t __desock_send_data(const void* buf, size_t len) {
+
+  u32 n = MIN(len, DESOCK_RESP_SIZE - ring->resp_len);
+
+  memcpy(ring->resp + ring->resp_len, buf, n);
+  ring->resp_len += n;
+
+  return len;
+
+}
+
+
+static ssize_t __desock_send_iov(const struct iovec* iov, int cnt) {
+
+  ssize_t total = 0;
+  int i;
+
+  for (i = 0; i < cnt; i++) total += __desock_send_data(iov[i].iov_base, iov[i].iov_len);
+  return total;
+
+}
+
+
+/* Socket setup */
+
+int bind(int fd, const struct sockaddr* addr, socklen_t len) {
+
+  int type;
+  socklen_t tlen = sizeof(type);
+
+  if (!ring || fd < 0 || fd >= DESOCK_MAX_FD || !addr ||
+      (addr->sa_family != AF_INET && addr->sa_family != AF_INET6) ||
+      REAL(getsockopt)(fd, SOL_SOCKET, SO_TYPE, &type, &tlen))
+    return REAL(bind)(fd, addr, len);
+
+  kind[fd] = (type == SOCK_DGRAM) ? DS_DGRAM : DS_LISTEN;
+  return 0;
+
+}
+
+
+int listen(int fd, int backlog) {
+
+  if (OURS(fd)) return 0;
+  return REAL(listen)(fd, backlog);
+
+}
+
+
+static int __desock_accepted(struct sockaddr* addr, socklen_t* addrlen, int flags) {
+
+  int fd;
+
+  /* The server is back for another client: this session is done. */
+  if (accepted) exit(0);
+
+  fd = socket(AF_UNIX, SOCK_STREAM | (flags & SOCK_CLOEXEC), 0);
+  if (fd < 0 || fd >= DESOCK_MAX_FD) return -1;
+
+  kind[fd] = DS_CONN;
+  accepted = 1;
+  __desock_peer(addr, addrlen);
+
+  return fd;
+
+}
+
+
+int accept(int fd, struct sockaddr* addr, socklen_t* addrlen) {
+
+  if (OURS(fd) && kind[fd] == DS_LISTEN) return __desock_accepted(addr, addrlen, 0);
+  return REAL(accept)(fd, addr, addrlen);
+
+}
+
+
+int accept4(int fd, struct sockaddr* addr, socklen_t* addrlen, int flags) {
+
+  if (OURS(fd) && kind[fd] == DS_LISTEN) return __desock_accepted(addr, addrlen, flags);
+  return REAL(accept4)(fd, addr, addrlen, flags);
+
+}
+
+
+/* Reads */
+
+ssize_t read(int fd, void* buf, size_t len) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_recv_data(fd, buf, len, 0);
+  return REAL(read)(fd, buf, len);
+
+}
+
+
+ssize_t __read_chk(int fd, void* buf, size_t len, size_t buflen) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_recv_data(fd, buf, MIN(len, buflen), 0);
+  return REAL(__read_chk)(fd, buf, len, buflen);
+
+}
+
+
+ssize_t readv(int fd, const struct iovec* iov, int cnt) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_recv_iov(fd, iov, cnt);
+  return REAL(readv)(fd, iov, cnt);
+
+}
+
+
+ssize_t recv(int fd, void* buf, size_t len, int flags) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_recv_data(fd, buf, len, flags & MSG_PEEK);
+  return REAL(recv)(fd, buf, len, flags);
+
+}
+
+
+ssize_t __recv_chk(int fd, void* buf, size_t len, size_t buflen, int flags) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN)
+    return __desock_recv_data(fd, buf, MIN(len, buflen), flags & MSG_PEEK);
+  return REAL(__recv_chk)(fd, buf, len, buflen, flags);
+
+}
+
+
+ssize_t recvfrom(int fd, void* buf, size_t len, int flags, struct sockaddr* addr, socklen_t* addrlen) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) {
+    __desock_peer(addr, addrlen);
+    return __desock_recv_data(fd, buf, len, flags & MSG_PEEK);
+  }
+  return REAL(recvfrom)(fd, buf, len, flags, addr, addrlen);
+
+}
+
+
+ssize_t __recvfrom_chk(int fd, void* buf, size_t len, size_t buflen, int flags,
+                       struct sockaddr* addr, socklen_t* addrlen) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) {
+    __desock_peer(addr, addrlen);
+    return __desock_recv_data(fd, buf, MIN(len, buflen), flags & MSG_PEEK);
+  }
+  return REAL(__recvfrom_chk)(fd, buf, len, buflen, flags, addr, addrlen);
+
+}
+
+
+ssize_t recvmsg(int fd, struct msghdr* msg, int flags) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) {
+    __desock_peer(msg->msg_name, &msg->msg_namelen);
+    msg->msg_controllen = 0;
+    msg->msg_flags = 0;
+    return __desock_recv_iov(fd, msg->msg_iov, msg->msg_iovlen);
+  }
+  return REAL(recvmsg)(fd, msg, flags);
+
+}
+
+
+/* Writes */
+
+ssize_t write(int fd, const void* buf, size_t len) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_send_data(buf, len);
+  return REAL(write)(fd, buf, len);
+
+}
+
+
+ssize_t writev(int fd, const struct iovec* iov, int cnt) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_send_iov(iov, cnt);
+  return REAL(writev)(fd, iov, cnt);
+
+}
+
+
+ssize_t send(int fd, const void* buf, size_t len, int flags) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_send_data(buf, len);
+  return REAL(send)(fd, buf, len, flags);
+
+}
+
+
+ssize_t sendto(int fd, const void* buf, size_t len, int flags, const struct sockaddr* addr, socklen_t addrlen) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_send_data(buf, len);
+  return REAL(sendto)(fd, buf, len, flags, addr, addrlen);
+
+}
+
+
+ssize_t sendmsg(int fd, const struct msghdr* msg, int flags) {
+
+  if (OURS(fd) && kind[fd] != DS_LISTEN) return __desock_send_iov(msg->msg_iov, msg->msg_iovlen);
+  return REAL(sendmsg)(fd, msg, flags);
+
+}
+
+
+/* Teardown and socket options */
+
+int close(int fd) {
+
+  int i;
+
+  if (OURS(fd)) {
+
+    if (kind[fd] == DS_CONN) __desock_closed();
+    kind[fd] = DS_NONE;
+
+    for (i = 0; i < DESOCK_MAX_EPOLL; i++)
+      if (ep[i].fd == fd) ep[i].fd = -1;
+
+  }
+
+  return REAL(close)(fd);
+
+}
+
+
+int shutdown(int fd, int how) {
+
+  if (OURS(fd)) {
+    if (kind[fd] == DS_CONN && how != SHUT_RD) __desock_closed();
+    return 0;
+  }
+  return REAL(shutdown)(fd, how);
+
+}
+
+
+int setsockopt(int fd, int level, int name, const void* val, socklen_t len) {
+
+  if (OURS(fd)) return 0;
+  return REAL(setsockopt)(fd, level, name, val, len);
+
+}
+
+
+int getsockopt(int fd, int level, int name, void* val, socklen_t* len) {
+
+  /* SO_TYPE and friends are real; TCP options on a fake socket are zero. */
+  if (OURS(fd) && level != SOL_SOCKET) {
+    if (val && len) memset(val, 0, *len);
+    return 0;
+  }
+  return REAL(getsockopt)(fd, level, name, val, len);
+
+}
+
+
+int getpeername(int fd, struct sockaddr* addr, socklen_t* addrlen) {
+
+  if (OURS(fd)) {
+    __desock_peer(addr, addrlen);
+    return 0;
+  }
+  return REAL(getpeername)(fd, addr, addrlen);
+
+}
+
+
+/* Readiness: fake sockets are always ready (a fake listener until it has
+   been accepted), and reads on them block in the library if need be. */
+
+/* glibc declares fds[] write-only, but events is an input. */
+#pragma GCC diagnostic ignored "-Wmaybe-uninitialized"
+
+int poll(struct pollfd* fds, nfds_t nfds, int timeout) {
+
+  nfds_t i;
+  int ready = 0, rv;
+
+  if (!ring) return REAL(poll)(fds, nfds, timeout);
+
+  /* Hide fake sockets from the real poll() (negative fds are skipped) */
+  for (i = 0; i < nfds; i++) {
+
+    if (!OURS(fds[i].fd)) continue;
+
+    fds[i].fd = ~fds[i].fd;
+    ready++;
+
+  }
+
+  if (!ready) return REAL(poll)(fds, nfds, timeout);
+
+  ready = 0;
+
+  for (i = 0; i < nfds; i++) {
+
+    int fd = ~fds[i].fd;
+
+    if (fds[i].fd >= 0 || !OURS(fd)) continue;
+
+    if ((fds[i].events & (POLLOUT | POLLWRNORM)) ||
+        ((fds[i].events & (POLLIN | POLLRDNORM)) && READABLE(fd))) ready++;
+
+  }
+
+  rv = REAL(poll)(fds, nfds, ready ? 0 : timeout);
+
+  for (i = 0; i < nfds; i++) {
+
+    int fd = ~fds[i].fd;
+
+    if (fds[i].fd >= 0 || !OURS(fd)) continue;
+
+    fds[i].fd      = fd;
+    fds[i].revents = fds[i].events & (POLLOUT | POLLWRNORM);
+    if (READABLE(fd)) fds[i].revents |= fds[i].events & (POLLIN | POLLRDNORM);
+
+  }
+
+  return rv < 0 ? rv : rv + ready;
+
+}
+
+
+int select(int nfds, fd_set* rfds, fd_set* wfds, fd_set* efds, struct timeval* timeout) {
+
+  fd_set our_r, our_w;
+  struct timeval zero = { 0, 0 };
+  int fd, ready = 0, rv;
+
+  if (!ring) return REAL(select)(nfds, rfds, wfds, efds, timeout);
+
+  FD_ZERO(&our_r);
+  FD_ZERO(&our_w);
+
+  for (fd = 0; fd < MIN(nfds, DESOCK_MAX_FD); fd++) {
+
+    if (!kind[fd]) continue;
+
+    if (rfds && FD_ISSET(fd, rfds)) {
+      FD_CLR(fd, rfds);
+      if (READABLE(fd)) { FD_SET(fd, &our_r); ready++; }
+    }
+
+    if (wfds && FD_ISSET(fd, wfds)) {
+      FD_CLR(fd, wfds);
+      FD_SET(fd, &our_w);
+      ready++;
+    }
+
+    if (efds) FD_CLR(fd, efds);
+
+  }
+
+  rv = REAL(select)(nfds, rfds, wfds, efds, ready ? &zero : timeout);
+  if (rv < 0) return rv;
+
+  for (fd = 0; fd < MIN(nfds, DESOCK_MAX_FD); fd++) {
+    if (FD_ISSET(fd, &our_r)) FD_SET(fd, rfds);
+    if (FD_ISSET(fd, &our_w)) FD_SET(fd, wfds);
+  }
+
+  return rv + ready;
+
+}
+
+
+int epoll_ctl(int epfd, int op, int fd, struct epoll_event* ev) {
+
+  int i, slot = -1;
+
+  if (!OURS(fd)) return REAL(epoll_ctl)(epfd, op, fd, ev);
+
+  for (i = 0; i < DESOCK_MAX_EPOLL; i++) {
+    if (ep[i].fd == fd && ep[i].epfd == epfd) { slot = i; break; }
+    if (slot < 0 && ep[i].fd <= 0 && !ep[i].epfd) slot = i;
+  }
+
+  if (slot < 0) {
+    errno = ENOSPC;
+    return -1;
+  }
+
+  if (op == EPOLL_CTL_DEL) {
+    ep[slot].fd   = -1;
+    ep[slot].epfd = 0;
+    return 0;
+  }
+
+  ep[slot].epfd = epfd;
+  ep[slot].fd   = fd;
+  if (ev) ep[slot].ev = *ev;
+
+  return 0;
+
+}
+
+
+int epoll_wait(int epfd, struct epoll_event* events, int max, int timeout) {
+
+  int i, ready = 0, rv;
+
+  if (!ring) return REAL(epoll_wait)(epfd, events, max, timeout);
+
+  for (i = 0; i < DESOCK_MAX_EPOLL && ready < max; i++) {
+
+    u32 got;
+
+    if (ep[i].epfd != epfd || ep[i].fd <= 0 || !OURS(ep[i].fd)) continue;
+
+    got = ep[i].ev.events & EPOLLOUT;
+    if (READABLE(ep[i].fd)) got |= ep[i].ev.events & EPOLLIN;
+    if (!got) continue;
+
+    events[ready].events = got;
+    events[ready].data   = ep[i].ev.data;
+    ready++;
+
+  }
+
+  if (ready == max) return ready;
+
+  rv = REAL(epoll_wait)(epfd, events + ready, max - ready, ready ? 0 : timeout);
+  return rv < 0 ? (ready ? ready : rv) : rv + ready;
+
+}
+
+
+__attribute__((constructor)) void __desock_init(void) {
+
+  u8* id = getenv(DESOCK_SHM_ENV_VAR);
+  void* mem;
+
+  if (!id) return;
+
+  mem = shmat(atoi(id), NULL, 0);
+  if (mem != (void*)-1) ring = mem;
+
+}
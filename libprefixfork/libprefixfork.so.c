@@ -0,0 +1,216 @@
+/*
+
+   pyafl - session prefix snapshots
+   --------------------------------
+
+   This Linux-only companion library lets the fuzzer snapshot a network
+   server after it has processed the first k messages of a session, and then
+   run any number of mutated suffixes from that point without re-sending the
+   prefix. See README.prefixfork for more info.
+
+   The library remembers the listening and the accepted socket of the
+   session (accept() / accept4()). On SIGUSR2 the process forks: the original
+   exits cleanly so the fork server can carry on, and the copy becomes a
+   snapshot holder that closes the listening socket (freeing the port) and
+   waits on the abstract unix socket PREFIX_SOCK_NAME for one controlling
+   connection. Every 'F' byte received there forks a child that gets a fresh
+   socketpair dup2()'ed over the session socket and resumes the server where
+   it was interrupted. The other end of the pair and the child's pid are
+   passed back with SCM_RIGHTS, and the child's wait status follows once it
+   exits. Closing the control connection makes the holder exit.
+
+*/
+
+#define _GNU_SOURCE
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stddef.h>
+#include <string.h>
+#include <signal.h>
+#include <unistd.h>
+#include <dlfcn.h>
+#include <errno.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <sys/wait.h>
+
+#include "../types.h"
+#include "../config.h"
+
+#ifndef __linux__
+#  error "Sorry, this library is Linux-specific for now!"
+#endif /* !__linux__ */
+
+
+static int __prefix_listen_fd = -1;
+static int __prefix_conn_fd   = -1;
+
+static int (*__prefix_accept)(int, struct sockaddr*, socklen_t*);
+static int (*__prefix_accept4)(int, struct sockaddr*, socklen_t*, int);
+
+
+/* Send the child's pid and our end of its socketpair to the fuzzer. */
+
+static int __prefix_send_child(int ctl, pid_t pid, int fd) {
+
+  struct msghdr msg;
+  struct iovec iov;
+  union {
+    struct cmsghdr hdr;
+    char buf[CMSG_SPACE(sizeof(int))];
+  } cbuf;
+  struct cmsghdr* cmsg;
+
+  memset(&msg, 0, sizeof(msg));
+  memset(&cbuf, 0, sizeof(cbuf));
+
+  iov.iov_base = &pid;
+  iov.iov_len  = sizeof(pid);
+
+  msg.msg_iov        = &iov;
+  msg.msg_iovlen     = 1;
+  msg.msg_control    = cbuf.buf;
+  msg.msg_controllen = sizeof(cbuf.buf);
+
+  cmsg = CMSG_FIRSTHDR(&msg);
+  cmsg->cmsg_level = SOL_SOCKET;
+  cmsg->cmsg_type  = SCM_RIGHTS;
+  cmsg->cmsg_len   = CMSG_LEN(sizeof(int));
+  memcpy(CMSG_DATA(cmsg), &fd, sizeof(int));
+
+  return sendmsg(ctl, &msg, MSG_NOSIGNAL) == sizeof(pid) ? 0 : -1;
+
+}
+
+
+/* Snapshot holder loop. Only returns in the forked children, which then
+   resume the server from the interrupted point. */
+
+static void __prefix_hold(pid_t snap_pid) {
+
+  struct sockaddr_un addr;
+  socklen_t addr_len;
+  int srv, ctl;
+  u8 cmd;
+
+  if (__prefix_listen_fd >= 0) close(__prefix_listen_fd);
+
+  srv = socket(AF_UNIX, SOCK_STREAM, 0);
+  if (srv < 0) _exit(1);
+
+  memset(&addr, 0, sizeof(addr));
+  addr.sun_family = AF_UNIX;
+  /* Abstract namespace: leading NUL, no file to clean up. */
+  snprintf(addr.sun_path + 1, sizeof(addr.sun_path) - 1, PREFIX_SOCK_NAME, (int)snap_pid);
+  addr_len = offsetof(struct sockaddr_un, sun_path) + 1 + strlen(addr.sun_path + 1);
+
+  if (bind(srv, (struct sockaddr*)&addr, addr_len) || listen(srv, 1)) _exit(1);
+
+  /* Not our accept() wrapper: that would overwrite the session socket. */
+  if (!__prefix_accept) __prefix_accept = dlsym(RTLD_NEXT, "accept");
+  while ((ctl = __prefix_accept(srv, NULL, NULL)) < 0 && errno == EINTR);
+  close(srv);
+  if (ctl < 0) _exit(1);
+
+  while (1) {
+
+    int sp[2], status;
+    pid_t pid;
+    ssize_t n;
+
+    while ((n = read(ctl, &cmd, 1)) < 0 && errno == EINTR);
+    if (n != 1 || cmd != 'F') _exit(0);
+
+    if (socketpair(AF_UNIX, SOCK_STREAM, 0, sp)) _exit(1);
+
+    pid = fork();
+    if (pid < 0) _exit(1);
+
+    if (!pid) {
+
+      close(ctl);
+      close(sp[0]);
+      dup2(sp[1], __prefix_conn_fd);
+      close(sp[1]);
+      return;
+
+    }
+
+    close(sp[1]);
+    if (__prefix_send_child(ctl, pid, sp[0])) _exit(1);
+    close(sp[0]);
+
+    while (waitpid(pid, &status, 0) < 0 && errno == EINTR);
+    if (write(ctl, &status, 4) != 4) _exit(0);
+
+  }
+
+}
+
+
+static void __prefix_snapshot(int sig) {
+
+  pid_t snap_pid = getpid(), pid;
+  int saved_errno = errno;
+
+  (void)sig;
+
+  if (__prefix_conn_fd < 0) return;
+
+  pid = fork();
+  if (pid < 0) return;
+
+  /* The original process is done as far as the fork server is concerned. */
+  if (pid) _exit(0);
+
+  __prefix_hold(snap_pid);
+  errno = saved_errno;
+
+}
+
+
+static void __prefix_remember(int listen_fd, int conn_fd) {
+
+  if (conn_fd < 0) return;
+  __prefix_listen_fd = listen_fd;
+  __prefix_conn_fd   = conn_fd;
+
+}
+
+
+int accept(int sockfd, struct sockaddr* addr, socklen_t* addrlen) {
+
+  int fd;
+
+  if (!__prefix_accept) __prefix_accept = dlsym(RTLD_NEXT, "accept");
+  fd = __prefix_accept(sockfd, addr, addrlen);
+  __prefix_remember(sockfd, fd);
+  return fd;
+
+}
+
+
+int accept4(int sockfd, struct sockaddr* addr, socklen_t* addrlen, int flags) {
+
+  int fd;
+
+  if (!__prefix_accept4) __prefix_accept4 = dlsym(RTLD_NEXT, "accept4");
+  fd = __prefix_accept4(sockfd, addr, addrlen, flags);
+  __prefix_remember(sockfd, fd);
+  return fd;
+
+}
+
+
+__attribute__((constructor)) void __prefix_init(void) {
+
+  struct sigaction sa;
+
+  memset(&sa, 0, sizeof(sa));
+  sa.sa_handler = __prefix_snapshot;
+  sa.sa_flags   = SA_RESTART;
+  sigemptyset(&sa.sa_mask);
+  sigaction(SIGUSR2, &sa, NULL);
+
+}
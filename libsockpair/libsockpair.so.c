@@ -0,0 +1,158 @@
+/*
+
+   pyafl - socketpair transport shim
+   ---------------------------------
+
+   This Linux-only companion library lets a target fuzzed with
+   "use_net": "fd://N" (or "fd://") talk to the fuzzer over a socketpair
+   instead of a TCP connection. See README.sockpair for more info.
+
+   For every exec the fuzzer queues one end of a fresh socketpair on the
+   datagram channel SOCK_HANDOFF_FD (SCM_RIGHTS). Right after the fork
+   server forks a child, or when the target starts without a fork server,
+   the library takes that socket and puts it in place:
+
+     - with PYAFL_SOCK_FD=N it is dup2()'ed over descriptor N (and over
+       stdout too when N is 0, for inetd-style servers),
+
+     - otherwise the first accept() / accept4() on any listening socket
+       returns it, as if a client had just connected.
+
+   Processes that find nothing queued (the fork server itself, children the
+   target forks on its own) are left alone.
+
+*/
+
+#define _GNU_SOURCE
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <pthread.h>
+#include <dlfcn.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <sys/socket.h>
+#include <netinet/in.h>
+#include <arpa/inet.h>
+
+#include "../types.h"
+#include "../config.h"
+
+#ifndef __linux__
+#  error "Sorry, this library is Linux-specific for now!"
+#endif /* !__linux__ */
+
+
+static int __sockpair_fd = -1;          /* Session socket, until accepted  */
+
+static int (*__sockpair_accept)(int, struct sockaddr*, socklen_t*);
+static int (*__sockpair_accept4)(int, struct sockaddr*, socklen_t*, int);
+
+
+/* Take the session socket queued for this process, if any. */
+
+static void __sockpair_take(void) {
+
+  struct msghdr msg;
+  struct iovec iov;
+  union {
+    struct cmsghdr hdr;
+    char buf[CMSG_SPACE(sizeof(int))];
+  } cbuf;
+  struct cmsghdr* cmsg;
+  u8 tag;
+  int fd, n;
+  char* target;
+
+  memset(&msg, 0, sizeof(msg));
+
+  iov.iov_base = &tag;
+  iov.iov_len  = 1;
+
+  msg.msg_iov        = &iov;
+  msg.msg_iovlen     = 1;
+  msg.msg_control    = cbuf.buf;
+  msg.msg_controllen = sizeof(cbuf.buf);
+
+  if (recvmsg(SOCK_HANDOFF_FD, &msg, MSG_DONTWAIT | MSG_CMSG_CLOEXEC) != 1) return;
+
+  cmsg = CMSG_FIRSTHDR(&msg);
+  if (!cmsg || cmsg->cmsg_type != SCM_RIGHTS) return;
+  memcpy(&fd, CMSG_DATA(cmsg), sizeof(int));
+
+  /* This process owns the session now; its own children must not go
+     looking for another one. */
+  close(SOCK_HANDOFF_FD);
+
+  target = getenv("PYAFL_SOCK_FD");
+
+  if (!target || !*target) {
+    __sockpair_fd = fd;
+    return;
+  }
+
+  /* The socket may already have landed on the requested descriptor (e.g.
+     the fork server runs with stdin closed). */
+  n = atoi(target);
+
+  if (fd != n) dup2(fd, n);
+  if (!n) dup2(n, 1);
+  if (fd != n && (n || fd != 1)) close(fd);
+
+}
+
+
+static int __sockpair_accepted(struct sockaddr* addr, socklen_t* addrlen, int flags) {
+
+  int fd = __sockpair_fd;
+  struct sockaddr_in peer;
+
+  __sockpair_fd = -1;
+
+  /* Pretend the peer is a loopback client, for servers that log it. */
+  if (addr && addrlen) {
+    memset(&peer, 0, sizeof(peer));
+    peer.sin_family      = AF_INET;
+    peer.sin_addr.s_addr = htonl(INADDR_LOOPBACK);
+    memcpy(addr, &peer, MIN(*addrlen, sizeof(peer)));
+    *addrlen = sizeof(peer);
+  }
+
+  if (!(flags & SOCK_CLOEXEC)) fcntl(fd, F_SETFD, 0);
+  if (flags & SOCK_NONBLOCK) fcntl(fd, F_SETFL, fcntl(fd, F_GETFL) | O_NONBLOCK);
+
+  return fd;
+
+}
+
+
+int accept(int sockfd, struct sockaddr* addr, socklen_t* addrlen) {
+
+  if (__sockpair_fd >= 0) return __sockpair_accepted(addr, addrlen, 0);
+
+  if (!__sockpair_accept) __sockpair_accept = dlsym(RTLD_NEXT, "accept");
+  return __sockpair_accept(sockfd, addr, addrlen);
+
+}
+
+
+int accept4(int sockfd, struct sockaddr* addr, socklen_t* addrlen, int flags) {
+
+  if (__sockpair_fd >= 0) return __sockpair_accepted(addr, addrlen, flags);
+
+  if (!__sockpair_accept4) __sockpair_accept4 = dlsym(RTLD_NEXT, "accept4");
+  return __sockpair_accept4(sockfd, addr, addrlen, flags);
+
+}
+
+
+__attribute__((constructor)) void __sockpair_init(void) {
+
+  /* Fork server children come from fork(); without a fork server, the
+     target itself is the fresh process. */
+  pthread_atfork(NULL, NULL, __sockpair_take);
+  __sockpair_take();
+
+}
@@ -1,8 +1,20 @@
 import argparse
 import json
+import sys
 from Fuzzer import Fuzzer
+import cmin
+import tmin
 
 def main():
+    # python3 main.py cmin ...: 会话语料最小化
+    if len(sys.argv) > 1 and sys.argv[1] == "cmin":
+        cmin.main(sys.argv[2:])
+        return
+    # python3 main.py tmin ...: 崩溃 / 超时会话最小化
+    if len(sys.argv) > 1 and sys.argv[1] == "tmin":
+        tmin.main(sys.argv[2:])
+        return
+
     # 创建参数解析器
     parser = argparse.ArgumentParser(description='Run the fuzzer with specified configuration')
     parser.add_argument('config', help='Path to the configuration JSON file')
@@ -26,6 +38,8 @@ def main():
 
 
 # python3 main.py ./configs/openssl.json
+# python3 main.py cmin ./configs/openssl.json -o ./min-queue -j 8
+# python3 main.py tmin ./configs/openssl.json ./out/crash_test_cases/id:000000.raw -j 4
 if __name__ == "__main__":
     main()
 
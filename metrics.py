@@ -0,0 +1,159 @@
+import os
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pyafl
+
+
+# 导出的 Stats 字段: (属性名, 指标名, 类型, 说明)
+STATS_METRICS = [
+    ("total_exec", "pyafl_execs_total", "counter", "Total target executions"),
+    ("queue_len", "pyafl_queue_len", "gauge", "Test cases saved to the queue"),
+    ("queue_cycle", "pyafl_queue_cycle", "gauge", "Queue cycles done"),
+    ("favor_paths", "pyafl_favor_paths", "gauge", "Paths marked as favored"),
+    ("unique_crashes", "pyafl_unique_crashes", "gauge", "Crashes with unique signatures"),
+    ("unique_hangs", "pyafl_unique_hangs", "gauge", "Hangs with unique signatures"),
+    ("total_crashes", "pyafl_crashes_total", "counter", "Total crashing executions"),
+    ("total_tmouts", "pyafl_tmouts_total", "counter", "Total timed out executions"),
+]
+
+# 直方图按 1us ~ 2^31us 的 2 的幂分段，与 C 端桶边界对齐。样本是整数 us，
+# 下界小于 2^k 的桶之和正好是 <= 2^k - 1 us 的样本数，因此 le（包含边界）取 2^k - 1 us
+HIST_BOUNDS_US = [1 << k for k in range(32)]
+
+
+def parse_metrics_addr(addr: str):
+    """
+    解析 metrics 配置，格式与 use_net 保持一致:
+        tcp://127.0.0.1/9100  或  unix:///path/to/pyafl.sock
+    返回 (family, address)
+    """
+    if addr.startswith("unix://"):
+        return socket.AF_UNIX, addr[len("unix://"):]
+    if addr.startswith("tcp://"):
+        host, _, port = addr[len("tcp://"):].partition("/")
+        if not port.isdigit():
+            raise ValueError(f"Bad syntax used for metrics: {addr}")
+        return socket.AF_INET, (host, int(port))
+    raise ValueError(f"Bad syntax used for metrics: {addr}. [tcp/unix]://...")
+
+
+def render_metrics(fuzzer) -> str:
+    """
+    按 Prometheus text format (0.0.4) 生成指标文本。
+    在 metrics 线程上执行，只读取 fuzzer 上的普通计数器和 C 端直方图（不加锁）；
+    生成文本期间持有 GIL，会与 fuzz 循环争用解释器。
+    """
+    stats = fuzzer.stats
+    lines = []
+
+    def metric(name, mtype, help_text, value):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {mtype}")
+        lines.append(f"{name} {value}")
+
+    for attr, name, mtype, help_text in STATS_METRICS:
+        metric(name, mtype, help_text, getattr(stats, attr, 0))
+
+    metric("pyafl_paths_total", "gauge", "Entries in the in-memory queue", len(fuzzer.queue))
+    metric("pyafl_pending_favored", "gauge", "Favored paths not fuzzed yet", fuzzer.pending_favored)
+    metric("pyafl_execs_per_sec", "gauge", "Exec speed over the last plot interval",
+           f"{getattr(fuzzer, 'last_eps', 0.0):.2f}")
+    metric("pyafl_uptime_seconds", "gauge", "Seconds since the fuzzer started",
+           f"{time.time() - fuzzer.start_time:.0f}")
+
+    timing = pyafl.get_timing_stats()
+
+    metric("pyafl_connect_retries_total", "counter", "Failed connect() attempts",
+           timing["connect"]["retries"])
+
+    name = "pyafl_exec_phase_seconds"
+    lines.append(f"# HELP {name} Time spent per exec phase")
+    lines.append(f"# TYPE {name} histogram")
+    for phase, hist in timing.items():
+        buckets = hist["buckets"]
+        idx = 0
+        cumulative = 0
+        for bound in HIST_BOUNDS_US:
+            while idx < len(buckets) and buckets[idx][0] < bound:
+                cumulative += buckets[idx][1]
+                idx += 1
+            lines.append(f'{name}_bucket{{phase="{phase}",le="{(bound - 1) / 1e6:.10g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{phase="{phase}",le="+Inf"}} {hist["count"]}')
+        lines.append(f'{name}_sum{{phase="{phase}"}} {hist["total_us"] / 1e6:g}')
+        lines.append(f'{name}_count{{phase="{phase}"}} {hist["count"]}')
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+
+        body = render_metrics(self.server.fuzzer).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket 下 client_address 为空字符串
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        # 不向终端打印访问日志
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MetricsExporter:
+    """
+    内嵌的 Prometheus/OpenMetrics 指标服务，运行在后台守护线程上。
+
+    用法:
+        exporter = MetricsExporter(fuzzer, "tcp://127.0.0.1/9100")
+        exporter.start()
+        ...
+        exporter.stop()
+    """
+
+    def __init__(self, fuzzer, addr: str):
+        self.fuzzer = fuzzer
+        self.addr = addr
+        self.family, self.address = parse_metrics_addr(addr)
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self.server = _UnixHTTPServer(self.address, _MetricsHandler)
+        else:
+            self.server = ThreadingHTTPServer(self.address, _MetricsHandler)
+            self.server.daemon_threads = True
+
+        self.server.fuzzer = self.fuzzer
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name="pyafl-metrics", daemon=True)
+        self.thread.start()
+        print(f"metrics endpoint listening on {self.addr}")
+
+    def stop(self):
+        if not self.server:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.server = None
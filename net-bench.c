@@ -0,0 +1,323 @@
+/*
+   pyafl - loopback benchmark for the send / receive path
+   ------------------------------------------------------
+
+   Compares the original net_send() / net_recv() (kept below as legacy_*)
+   with the ones in net-io-inl.h over a TCP loopback connection, using the
+   same request / response pattern as a fuzzing session: send a message (or
+   a burst of messages), then read until the server has been quiet for the
+   socket timeout.
+
+   A forked echo-style server reads fixed-size requests and answers each
+   one with a fixed-size response. Each scenario is run with both
+   implementations and reported as messages/s and MB/s (request + response
+   bytes).
+
+   Build and run:
+
+     make net-bench
+     ./net-bench [ -n rounds ] [ -t socket_timeout_usecs ] [ -p poll_wait_msecs ]
+
+*/
+
+#define _GNU_SOURCE
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <signal.h>
+#include <time.h>
+#include <sys/wait.h>
+#include <arpa/inet.h>
+
+#include "types.h"
+#include "debug.h"
+#include "alloc-inl.h"
+#include "net-io-inl.h"
+
+
+/* The original implementation, verbatim apart from the names. */
+
+static int legacy_net_send(int sockfd, struct timeval timeout, char *mem, unsigned int len) {
+  unsigned int byte_count = 0;
+  int n;
+  struct pollfd pfd[1];
+  pfd[0].fd = sockfd;
+  pfd[0].events = POLLOUT;
+  int rv = poll(pfd, 1, 1);
+
+  setsockopt(sockfd, SOL_SOCKET, SO_SNDTIMEO, (char *)&timeout, sizeof(timeout));
+  if (rv > 0) {
+    if (pfd[0].revents & POLLOUT) {
+      while (byte_count < len) {
+        usleep(10);
+        n = send(sockfd, &mem[byte_count], len - byte_count, MSG_NOSIGNAL);
+        if (n == 0) return byte_count;
+        if (n == -1) return -1;
+        byte_count += n;
+      }
+    }
+  }
+  return byte_count;
+}
+
+static int legacy_net_recv(int sockfd, struct timeval timeout, int poll_w, char **response_buf, unsigned int *len) {
+  char temp_buf[1000];
+  int n;
+  struct pollfd pfd[1];
+  pfd[0].fd = sockfd;
+  pfd[0].events = POLLIN;
+  int rv = poll(pfd, 1, poll_w);
+
+  setsockopt(sockfd, SOL_SOCKET, SO_RCVTIMEO, (char *)&timeout, sizeof(timeout));
+  if (rv > 0) {
+    if (pfd[0].revents & POLLIN) {
+      n = recv(sockfd, temp_buf, sizeof(temp_buf), 0);
+      if ((n < 0) && (errno != 11)) {
+        net_peer_closed = 1;
+        return 1;
+      }
+      if (!n) net_peer_closed = 1;
+      while (n > 0) {
+        usleep(10);
+        *response_buf = (char *)ck_realloc(*response_buf, *len + n);
+        memcpy(&(*response_buf)[*len], temp_buf, n);
+        *len = *len + n;
+        n = recv(sockfd, temp_buf, sizeof(temp_buf), 0);
+        if ((n < 0) && (errno != 11)) {
+          net_peer_closed = 1;
+          return 1;
+        }
+        if (!n) net_peer_closed = 1;
+      }
+    }
+  } else if (rv < 0) return 1;
+  return 0;
+}
+
+
+struct scenario {
+  const char* name;
+  u32 req_len;                          /* Bytes per request message       */
+  u32 resp_len;                         /* Bytes per response              */
+  u32 burst;                            /* Messages sent before reading    */
+};
+
+static struct scenario scenarios[] = {
+  { "small",    64,        64,        1  },
+  { "tls-cert", 300,       16 * 1024, 1  },
+  { "upload",   16 * 1024, 64,        1  },
+  { "burst",    64,        64,        16 },
+};
+
+static u32 rounds = 1000, timeout_usecs = 1000, poll_w = 5;
+static u16 port;
+
+
+static u64 get_mono_us(void) {
+
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (u64)ts.tv_sec * 1000000ULL + ts.tv_nsec / 1000;
+
+}
+
+
+static int read_all(int fd, u8* buf, u32 len) {
+
+  u32 done = 0;
+  ssize_t n;
+
+  while (done < len) {
+    n = read(fd, buf + done, len - done);
+    if (n <= 0) return -1;
+    done += n;
+  }
+
+  return 0;
+
+}
+
+
+/* One connection per run: an 8-byte header (request and response size),
+   then one response for every complete request until EOF. */
+
+static void serve(int srv) {
+
+  static u8 buf[16 * 1024 * 16];
+  int fd, one = 1;
+  u32 hdr[2];
+
+  while ((fd = accept(srv, NULL, NULL)) >= 0) {
+
+    setsockopt(fd, IPPROTO_TCP, TCP_NODELAY, &one, sizeof(one));
+
+    if (!read_all(fd, (u8*)hdr, sizeof(hdr))) {
+      while (!read_all(fd, buf, hdr[0]))
+        if (write(fd, buf, hdr[1]) != hdr[1]) break;
+    }
+
+    close(fd);
+
+  }
+
+  _exit(0);
+
+}
+
+
+static pid_t start_server(void) {
+
+  struct sockaddr_in addr;
+  socklen_t addr_len = sizeof(addr);
+  int srv, one = 1;
+  pid_t pid;
+
+  srv = socket(AF_INET, SOCK_STREAM, 0);
+  if (srv < 0) PFATAL("socket() failed");
+  setsockopt(srv, SOL_SOCKET, SO_REUSEADDR, &one, sizeof(one));
+
+  memset(&addr, 0, sizeof(addr));
+  addr.sin_family      = AF_INET;
+  addr.sin_addr.s_addr = htonl(INADDR_LOOPBACK);
+
+  if (bind(srv, (struct sockaddr*)&addr, sizeof(addr)) || listen(srv, 4) ||
+      getsockname(srv, (struct sockaddr*)&addr, &addr_len)) PFATAL("Unable to listen on loopback");
+
+  port = ntohs(addr.sin_port);
+
+  pid = fork();
+  if (pid < 0) PFATAL("fork() failed");
+  if (!pid) serve(srv);
+
+  close(srv);
+  return pid;
+
+}
+
+
+/* Returns elapsed microseconds for `rounds` request / response rounds. */
+
+static u64 run(struct scenario* sc, u8 legacy) {
+
+  struct sockaddr_in addr;
+  struct timeval timeout;
+  struct iovec iov[16];
+  u32 hdr[2] = { sc->req_len, sc->resp_len };
+  char *req = ck_alloc(sc->req_len), *resp = NULL;
+  u32 resp_len, i, r;
+  u64 t0, t1;
+  int fd;
+
+  timeout.tv_sec  = 0;
+  timeout.tv_usec = timeout_usecs;
+
+  fd = socket(AF_INET, SOCK_STREAM, 0);
+  if (fd < 0) PFATAL("socket() failed");
+
+  /* The old code set SO_SNDTIMEO at connect time and both timeouts again
+     on every call; the new code sets everything once. */
+  if (legacy) setsockopt(fd, SOL_SOCKET, SO_SNDTIMEO, (char *)&timeout, sizeof(timeout));
+  else net_setup_socket(fd, timeout_usecs, 1);
+
+  memset(&addr, 0, sizeof(addr));
+  addr.sin_family      = AF_INET;
+  addr.sin_port        = htons(port);
+  addr.sin_addr.s_addr = htonl(INADDR_LOOPBACK);
+
+  if (connect(fd, (struct sockaddr*)&addr, sizeof(addr))) PFATAL("connect() failed");
+  if (write(fd, hdr, sizeof(hdr)) != sizeof(hdr)) PFATAL("write() failed");
+
+  t0 = get_mono_us();
+
+  for (r = 0; r < rounds; r++) {
+
+    if (legacy || sc->burst == 1) {
+
+      for (i = 0; i < sc->burst; i++) {
+        if (legacy) legacy_net_send(fd, timeout, req, sc->req_len);
+        else net_send(fd, req, sc->req_len);
+      }
+
+    } else {
+
+      for (i = 0; i < sc->burst; i++) {
+        iov[i].iov_base = req;
+        iov[i].iov_len  = sc->req_len;
+      }
+      net_sendv(fd, iov, sc->burst);
+
+    }
+
+    /* Like the fuzzer, reuse the response buffer and reset its length. */
+    resp_len = 0;
+    while (resp_len < sc->resp_len * sc->burst && !net_peer_closed) {
+      if (legacy) legacy_net_recv(fd, timeout, poll_w, &resp, &resp_len);
+      else net_recv(fd, poll_w, timeout_usecs, &resp, &resp_len);
+    }
+
+    if (net_peer_closed) FATAL("Server closed the connection");
+
+  }
+
+  t1 = get_mono_us();
+
+  close(fd);
+  ck_free(req);
+  ck_free(resp);
+
+  return t1 - t0;
+
+}
+
+
+int main(int argc, char** argv) {
+
+  pid_t pid;
+  u32 i;
+  s32 opt;
+
+  while ((opt = getopt(argc, argv, "n:t:p:")) > 0)
+
+    switch (opt) {
+
+      case 'n': rounds = atoi(optarg); break;
+      case 't': timeout_usecs = atoi(optarg); break;
+      case 'p': poll_w = atoi(optarg); break;
+
+      default:
+        SAYF("Usage: %s [ -n rounds ] [ -t socket_timeout_usecs ] [ -p poll_wait_msecs ]\n", argv[0]);
+        exit(1);
+
+    }
+
+  if (!rounds || !timeout_usecs || timeout_usecs >= 1000000) FATAL("Bad -n / -t value");
+
+  signal(SIGPIPE, SIG_IGN);
+  pid = start_server();
+
+  SAYF("%u rounds per run, socket timeout %u us, poll wait %u ms\n\n",
+       rounds, timeout_usecs, poll_w);
+  SAYF("%-10s %-8s %12s %10s %9s\n", "scenario", "impl", "msgs/s", "MB/s", "speedup");
+
+  for (i = 0; i < sizeof(scenarios) / sizeof(scenarios[0]); i++) {
+
+    struct scenario* sc = &scenarios[i];
+    double msgs  = (double)rounds * sc->burst;
+    double bytes = msgs * (sc->req_len + sc->resp_len);
+    u64 t_old = run(sc, 1), t_new = run(sc, 0);
+
+    SAYF("%-10s %-8s %12.0f %10.2f\n", sc->name, "legacy",
+         msgs * 1e6 / t_old, bytes / t_old);
+    SAYF("%-10s %-8s %12.0f %10.2f %8.2fx\n", "", "net-io",
+         msgs * 1e6 / t_new, bytes / t_new, (double)t_old / t_new);
+
+  }
+
+  kill(pid, SIGTERM);
+  waitpid(pid, NULL, 0);
+
+  return 0;
+
+}
@@ -0,0 +1,197 @@
+/*
+   pyafl - stream socket I/O
+   -------------------------
+
+   Send / receive helpers for talking to the server under test over a
+   connected socket, shared by afl-python.c and the net-bench loopback
+   benchmark.
+
+   Socket options are set once per connection by net_setup_socket():
+   SO_SNDTIMEO / SO_RCVTIMEO bound how long a blocked send() or recv() may
+   wait, and TCP_NODELAY stops Nagle from holding back small messages while
+   the server is waiting for them.
+
+   A response ends when the server stays quiet for the socket timeout.
+   net_recv() drains whatever is queued with non-blocking recv() calls and
+   waits for more with ppoll(), which honours microsecond timeouts; a
+   blocking recv() would have its SO_RCVTIMEO rounded up to scheduler ticks
+   (several ms per message). Data goes directly into the caller's
+   ck_alloc()'ed buffer, which grows geometrically and is reused across
+   messages and sessions, NET_RECV_CHUNK bytes per recv() call.
+
+*/
+
+#ifndef _HAVE_NET_IO_INL_H
+#define _HAVE_NET_IO_INL_H
+
+#ifndef _GNU_SOURCE
+#define _GNU_SOURCE
+#endif
+
+#include <errno.h>
+#include <time.h>
+#include <poll.h>
+#include <sys/socket.h>
+#include <sys/time.h>
+#include <sys/uio.h>
+#include <netinet/in.h>
+#include <netinet/tcp.h>
+
+#include "types.h"
+#include "alloc-inl.h"
+
+#define NET_RECV_CHUNK   (64 * 1024)   /* Bytes requested per recv()      */
+#define NET_IOV_BATCH    64            /* Messages per writev()           */
+
+static u8 net_peer_closed;             /* net_recv() saw EOF / reset      */
+
+
+/* Set the per-connection options. timeout_usecs must be below 1 s. */
+
+static inline void net_setup_socket(int sockfd, u32 timeout_usecs, u8 stream) {
+
+  struct timeval timeout;
+  int one = 1;
+
+  timeout.tv_sec  = 0;
+  timeout.tv_usec = timeout_usecs;
+
+  setsockopt(sockfd, SOL_SOCKET, SO_SNDTIMEO, (char *)&timeout, sizeof(timeout));
+  setsockopt(sockfd, SOL_SOCKET, SO_RCVTIMEO, (char *)&timeout, sizeof(timeout));
+
+  if (stream) setsockopt(sockfd, IPPROTO_TCP, TCP_NODELAY, &one, sizeof(one));
+
+}
+
+
+/* Make room for at least `need` more bytes after the first `len` bytes of
+   a ck_alloc()'ed buffer, at least doubling its size when it has to grow. */
+
+static inline void net_reserve(char **buf, u32 len, u32 need) {
+
+  u32 size = *buf ? ALLOC_S(*buf) : 0;
+
+  if (len + need <= size) return;
+
+  size = MAX(size * 2, len + need);
+  *buf = ck_realloc(*buf, size);
+
+}
+
+
+/* Send the whole buffer. Returns the number of bytes sent, which is short
+   if the send timeout expired, or -1 on error. */
+
+static inline int net_send(int sockfd, char *mem, u32 len) {
+
+  u32 byte_count = 0;
+  int n;
+
+  while (byte_count < len) {
+
+    n = send(sockfd, mem + byte_count, len - byte_count, MSG_NOSIGNAL);
+
+    if (n < 0) {
+      if (errno == EINTR) continue;
+      if (errno == EAGAIN || errno == EWOULDBLOCK) break;
+      return -1;
+    }
+    if (!n) break;
+
+    byte_count += n;
+
+  }
+
+  return byte_count;
+
+}
+
+
+/* Send several messages back to back with writev(), NET_IOV_BATCH at a time.
+   iov is consumed (advanced past partial writes). Returns the number of
+   messages sent completely, or -1 if the first one could not be sent. */
+
+static inline int net_sendv(int sockfd, struct iovec *iov, u32 cnt) {
+
+  u32 done = 0;
+  ssize_t n;
+
+  while (done < cnt) {
+
+    n = writev(sockfd, iov + done, MIN(cnt - done, NET_IOV_BATCH));
+
+    if (n < 0) {
+      if (errno == EINTR) continue;
+      if (errno == EAGAIN || errno == EWOULDBLOCK) break;
+      return done ? (int)done : -1;
+    }
+    if (!n) break;
+
+    while (done < cnt && (size_t)n >= iov[done].iov_len) {
+      n -= iov[done].iov_len;
+      done++;
+    }
+
+    if (n) {
+      iov[done].iov_base = (u8 *)iov[done].iov_base + n;
+      iov[done].iov_len -= n;
+    }
+
+  }
+
+  return done;
+
+}
+
+
+/* Append the response to *response_buf. Waits up to poll_w ms for the first
+   byte, then keeps reading until the server stays quiet for quiet_usecs or
+   closes the connection. Returns 1 on error. */
+
+static inline int net_recv(int sockfd, int poll_w, u32 quiet_usecs, char **response_buf, u32 *len) {
+
+  struct pollfd pfd[1];
+  struct timespec quiet;
+  int n, rv;
+
+  pfd[0].fd = sockfd;
+  pfd[0].events = POLLIN;
+
+  quiet.tv_sec  = quiet_usecs / 1000000;
+  quiet.tv_nsec = (quiet_usecs % 1000000) * 1000;
+
+  rv = poll(pfd, 1, poll_w);
+  if (rv < 0) return 1;
+  if (!rv) return 0;
+
+  while (1) {
+
+    net_reserve(response_buf, *len, NET_RECV_CHUNK);
+    n = recv(sockfd, *response_buf + *len, NET_RECV_CHUNK, MSG_DONTWAIT);
+
+    if (n < 0) {
+      if (errno == EINTR) continue;
+      if (errno == EAGAIN || errno == EWOULDBLOCK) {
+        rv = ppoll(pfd, 1, &quiet, NULL);
+        if (rv > 0) continue;
+        if (rv < 0 && errno == EINTR) continue;
+        break;
+      }
+      net_peer_closed = 1;
+      return 1;
+    }
+
+    if (!n) {
+      net_peer_closed = 1;
+      break;
+    }
+
+    *len += n;
+
+  }
+
+  return 0;
+
+}
+
+#endif /* !_HAVE_NET_IO_INL_H */
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import pyafl
+
+
+# 与 FaultCode.ERROR 一致：快照进程在执行过程中消失
+FAULT_ERROR = 3
+
+
+class PrefixSnapshot:
+    def __init__(self, ctl: int, prefix: List[bytearray], responses: List[bytes], state: int):
+        self.ctl = ctl
+        self.prefix = prefix          # 快照之前已发送的消息
+        self.responses = responses    # 前缀消息对应的响应，拼到每次执行的响应前面
+        self.state = state            # 快照时所处的协议状态 id
+        self.runs = 0
+
+
+class PrefixCache:
+    """
+    会话前缀快照（需要在目标进程中预加载 libprefixfork）。
+
+    havoc 只变异 [start, end) 范围内的消息时，前 start 条消息每次都相同。
+    第一次遇到 (用例, start) 时正常发送前缀，然后让服务器 fork 出快照进程；
+    之后的每次执行都从快照 fork 一个新进程，只发送第 start 条及以后的消息。
+    最多保留 capacity 个快照，按 LRU 淘汰。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.snapshots: "OrderedDict[Tuple[object, int], PrefixSnapshot]" = OrderedDict()
+        self.enabled = capacity > 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def lookup(self, test_case, k: int) -> Optional[PrefixSnapshot]:
+        snap = self.snapshots.get((test_case, k))
+        if snap is not None:
+            self.snapshots.move_to_end((test_case, k))
+        return snap
+
+    def create(self, test_case, k: int, timeout: int) -> Optional[PrefixSnapshot]:
+        """发送前 k 条消息并建立快照（本身就是一次执行）"""
+        prefix = [bytearray(m) for m in test_case.messages[:k]]
+
+        pyafl.pre_run_target(timeout)
+        responses = [pyafl.get_response_buff()]
+        for msg in prefix:
+            pyafl.run_target(bytes(msg))
+            responses.append(pyafl.get_response_buff())
+
+        seq = np.frombuffer(pyafl.state_seq(), dtype="<u4")
+        state = int(seq[-2]) if len(seq) else 0
+
+        ctl = pyafl.prefix_snapshot()
+        if ctl < 0:
+            # 没有预加载 libprefixfork，或者服务器在前缀中就退出了
+            print("[!] prefix snapshot failed (is libprefixfork.so in AFL_PRELOAD?), sending whole sessions")
+            self.enabled = False
+            return None
+
+        snap = PrefixSnapshot(ctl, prefix, responses, state)
+        self.snapshots[(test_case, k)] = snap
+        while len(self.snapshots) > self.capacity:
+            _, old = self.snapshots.popitem(last=False)
+            pyafl.prefix_release(old.ctl)
+        return snap
+
+    def run(self, snap: PrefixSnapshot, messages: List[bytearray], timeout: int) -> Optional[Tuple[int, List[bytes]]]:
+        """
+        从快照执行 messages，返回 (fault, responses)。
+        前缀被改动过或快照进程已不可用时返回 None，由调用方发送完整会话。
+        """
+        k = len(snap.prefix)
+        if len(messages) <= k or messages[:k] != snap.prefix:
+            return None
+
+        if pyafl.prefix_pre_run_target(snap.ctl, k, snap.state, timeout):
+            self.evict(snap)
+            return None
+
+        responses = list(snap.responses)
+        for msg in messages[k:]:
+            pyafl.run_target(bytes(msg))
+            responses.append(pyafl.get_response_buff())
+        fault = pyafl.post_run_target(timeout)
+
+        if fault == FAULT_ERROR:
+            self.evict(snap)
+            return None
+
+        snap.runs += 1
+        self.hits += 1
+        return fault, responses
+
+    def evict(self, snap: PrefixSnapshot):
+        for key, value in list(self.snapshots.items()):
+            if value is snap:
+                del self.snapshots[key]
+        pyafl.prefix_release(snap.ctl)
+
+    def drop(self, test_case):
+        """用例被修剪后旧的前缀不再有效"""
+        for key in [key for key in self.snapshots if key[0] is test_case]:
+            pyafl.prefix_release(self.snapshots.pop(key).ctl)
+
+    def release_all(self):
+        for snap in self.snapshots.values():
+            pyafl.prefix_release(snap.ctl)
+        self.snapshots.clear()
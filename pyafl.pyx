@@ -7,6 +7,7 @@
 
 cimport cython
 from cpython.bytes cimport PyBytes_AsString, PyBytes_GET_SIZE
+from libc.stdlib cimport malloc, free
 
 # 引入 AFL 的 C 逻辑
 #include "afl-python.c"
@@ -86,9 +87,15 @@ def get_response_buff():
 cdef extern int __pre_run_target(unsigned int timeout) nogil
 cdef extern void __run_target()
 cdef extern int __post_run_target(unsigned int timeout)
+cdef extern int __prefix_snapshot()
+cdef extern int __prefix_pre_run_target(int ctl, int first_msg, unsigned int start_state, unsigned int timeout) nogil
+cdef extern void __prefix_release(int ctl)
 
 cdef extern void __get_test_case(const char *buf, size_t buf_len) 
 cdef extern void __get_test_case_and_run_target(const char *buf, size_t buf_len) nogil
+cdef extern void __run_target_batch(const char** bufs, unsigned int* lens, unsigned int cnt) nogil
+cdef extern int __stage_message(const char *buf, unsigned int buf_len) nogil
+cdef extern void __run_staged_target() nogil
 cdef extern unsigned int __get_exec_tmout()
 
 cdef extern unsigned int __trace_bytes_count()
@@ -103,6 +110,25 @@ cdef extern int __has_new_bit()
 
 cdef extern unsigned int __trace_min_hash32()
 
+cdef extern unsigned int __virgin_bytes_count()
+cdef extern unsigned int __map_size()
+cdef extern unsigned char* __trace_bits()
+cdef extern unsigned char __kill_signal()
+cdef extern int __last_msg_index()
+cdef extern void __save_first_trace()
+cdef extern unsigned int __update_var_bytes()
+cdef extern unsigned int* __new_edges(unsigned int* cnt)
+cdef extern unsigned char __state_new()
+cdef extern unsigned int __state_count()
+cdef extern unsigned int* __state_seq(unsigned int* cnt)
+cdef extern unsigned int* __state_codes()
+cdef extern unsigned long long* __state_execs()
+cdef extern unsigned int __path_freq(unsigned int cksum)
+cdef extern void __count_path()
+cdef extern unsigned char __could_be_bitflip(unsigned int xor_val)
+cdef extern unsigned char __could_be_arith(unsigned int old_val, unsigned int new_val, unsigned char blen)
+cdef extern unsigned char __could_be_interest(unsigned int old_val, unsigned int new_val, unsigned char blen, unsigned char check_le)
+
 
 def trace_min_hash32():
     return __trace_min_hash32()
@@ -111,10 +137,10 @@ def tmout_has_new_bit():
     return __tmout_has_new_bit()
 
 def crash_has_new_bit():
-    return __tmout_has_new_bit()
+    return __crash_has_new_bit()
 
 def has_new_bit():
-    return __tmout_has_new_bit()
+    return __has_new_bit()
 
 def simplify_trace_bits():
     __simplify_trace_bits()
@@ -135,6 +161,93 @@ def var_bytes_count():
     return __var_bytes_count()
 
 
+def virgin_bytes_count():
+    return __virgin_bytes_count()
+
+
+def map_size():
+    return __map_size()
+
+
+def trace_bits():
+    # 当前 trace_bits 的拷贝（post_run_target 之后已经 classify_counts）
+    return (<char*>__trace_bits())[:__map_size()]
+
+
+def kill_signal():
+    return __kill_signal()
+
+
+def last_msg_index():
+    # 目标在第几条消息之后断开（崩溃）
+    return __last_msg_index()
+
+
+def save_first_trace():
+    __save_first_trace()
+
+
+def update_var_bytes():
+    return __update_var_bytes()
+
+
+def new_edges():
+    # 上一次 has_new_bit() 新命中的 bitmap 下标，小端 u32 数组
+    cdef unsigned int cnt = 0
+    cdef unsigned int* edges = __new_edges(&cnt)
+    return (<char*>edges)[:cnt * 4]
+
+
+def state_new():
+    # 上一次执行是否到达了新状态或新的状态转移
+    return __state_new()
+
+
+def state_count():
+    return __state_count()
+
+
+def state_seq():
+    # 上一次执行的 (状态 id, 消息下标) 序列，小端 u32 数组
+    cdef unsigned int cnt = 0
+    cdef unsigned int* seq = __state_seq(&cnt)
+    return (<char*>seq)[:cnt * 8]
+
+
+def state_codes():
+    # 状态 id 对应的响应码，小端 u32 数组
+    return (<char*>__state_codes())[:__state_count() * 4]
+
+
+def state_execs():
+    # 到达每个状态的执行次数，小端 u64 数组
+    return (<char*>__state_execs())[:__state_count() * 8]
+
+
+def path_freq(cksum):
+    # 覆盖率 hash 为 cksum（trace_hash32）的路径至今被执行的次数，仅 "schedule" 为 fast / coe 时统计
+    return __path_freq(cksum)
+
+
+def count_path():
+    # 把上一次执行计入它的路径（只在 fuzz 阶段调用，校准、trim 和重新执行不计）
+    __count_path()
+
+
+# 确定性阶段的去重判断（同 afl-fuzz），参数为按小端读出的整数：
+# 新值能否由前面的 bitflip / arith / 更短的 interesting 阶段得到，能则不必再执行
+def could_be_bitflip(xor_val):
+    return __could_be_bitflip(xor_val)
+
+
+def could_be_arith(old_val, new_val, blen):
+    return __could_be_arith(old_val, new_val, blen)
+
+
+def could_be_interest(old_val, new_val, blen, check_le):
+    return __could_be_interest(old_val, new_val, blen, check_le)
+
+
 
 def pre_run_target(timeout):
     cdef unsigned int c_timeout = timeout
@@ -152,6 +265,67 @@ def run_target(bytes buf):
 
     with nogil:
         __get_test_case_and_run_target(<const char*>&data_view[0], length)
+
+
+def run_session(messages):
+    """
+    依次发送会话中的每条消息，返回每条消息之后取到的响应列表。
+    消息直接从 bytes / bytearray / memoryview 的缓冲区读取，不再先拷贝成 bytes；
+    desock:// 目标的整个会话先一次写入共享内存环形缓冲区，之后每条消息只需推进写位置、按门铃。
+    """
+    cdef const unsigned char[::1] view
+    cdef const char* ptr
+    cdef unsigned int length, staged = 0, i
+    cdef unsigned int cnt = len(messages)
+
+    for msg in messages:
+        view = msg
+        length = view.shape[0]
+        ptr = <const char*>&view[0] if length else NULL
+        if __stage_message(ptr, length):
+            break
+        staged += 1
+
+    responses = []
+    for i in range(cnt):
+        if i < staged:
+            with nogil:
+                __run_staged_target()
+        else:
+            # 环形缓冲区放不下（或不是 desock:// 目标）的消息照常逐条发送
+            view = messages[i]
+            length = view.shape[0]
+            ptr = <const char*>&view[0] if length else NULL
+            with nogil:
+                __get_test_case_and_run_target(ptr, length)
+        responses.append(get_response_buff())
+    return responses
+
+
+def run_target_batch(messages):
+    """
+    一次发送整个会话：UDP 目标每条消息一个数据报，用 sendmmsg 发出；
+    TCP 目标用 writev 连续发出所有消息。之后统一收取响应，所有响应都累积在同一个响应缓冲区里。
+    """
+    bufs = [bytes(m) for m in messages]
+    cdef unsigned int cnt = len(bufs), i
+    if not cnt:
+        return
+    cdef const char** ptrs = <const char**>malloc(cnt * sizeof(char*))
+    cdef unsigned int* lens = <unsigned int*>malloc(cnt * sizeof(unsigned int))
+    if ptrs == NULL or lens == NULL:
+        free(ptrs)
+        free(lens)
+        raise MemoryError()
+    for i in range(cnt):
+        ptrs[i] = PyBytes_AsString(bufs[i])
+        lens[i] = PyBytes_GET_SIZE(bufs[i])
+    try:
+        with nogil:
+            __run_target_batch(ptrs, lens, cnt)
+    finally:
+        free(ptrs)
+        free(lens)
     
 
 
@@ -161,3 +335,86 @@ def run_target(bytes buf):
 def post_run_target(timeout):
 
     return __post_run_target(timeout)
+
+
+def prefix_snapshot():
+    # 把刚发送完前缀消息的目标进程变为快照（需要预加载 libprefixfork），返回控制连接，失败返回 -1
+    return __prefix_snapshot()
+
+
+def prefix_pre_run_target(ctl, first_msg, start_state, timeout):
+    # 从快照 fork 一个新进程代替 pre_run_target，之后只需发送第 first_msg 条及以后的消息；失败返回 1
+    cdef int c_ctl = ctl, c_first = first_msg
+    cdef unsigned int c_state = start_state, c_timeout = timeout
+    cdef int ret
+    with nogil:
+        ret = __prefix_pre_run_target(c_ctl, c_first, c_state, c_timeout)
+    return ret
+
+
+def prefix_release(ctl):
+    __prefix_release(ctl)
+
+
+
+cdef extern from "afl-python.c":
+    struct timing_hist:
+        unsigned long long count
+        unsigned long long total_us
+        unsigned long long min_us
+        unsigned long long max_us
+        unsigned long long buckets[128]
+
+    unsigned int __timing_count()
+    const char* __timing_name(unsigned int id)
+    timing_hist* __timing_hist(unsigned int id)
+    unsigned long long __timing_bucket_low(unsigned int idx)
+    unsigned long long __connect_retries()
+    void __reset_timing_stats()
+
+
+cdef unsigned long long _hist_percentile(timing_hist* h, double q):
+    cdef unsigned long long rank = <unsigned long long>(h.count * q)
+    cdef unsigned long long seen = 0
+    cdef unsigned int i
+    for i in range(128):
+        seen += h.buckets[i]
+        if seen > rank:
+            return min(max(__timing_bucket_low(i), h.min_us), h.max_us)
+    return h.max_us
+
+
+def get_timing_stats():
+    """
+    获取各执行阶段的耗时直方图
+
+    返回:
+        dict: 阶段名 -> {count, total_us, min_us, max_us, mean_us,
+              p50_us, p90_us, p99_us, buckets}
+              buckets 为 [(桶下界us, 次数), ...]，只包含非空桶；
+              connect 阶段额外包含 retries（connect 重试次数）
+    """
+    cdef timing_hist* h
+    cdef unsigned int i, j
+    stats = {}
+    for i in range(__timing_count()):
+        h = __timing_hist(i)
+        entry = {
+            "count": h.count,
+            "total_us": h.total_us,
+            "min_us": h.min_us,
+            "max_us": h.max_us,
+            "mean_us": h.total_us / h.count if h.count else 0,
+            "p50_us": _hist_percentile(h, 0.50) if h.count else 0,
+            "p90_us": _hist_percentile(h, 0.90) if h.count else 0,
+            "p99_us": _hist_percentile(h, 0.99) if h.count else 0,
+            "buckets": [(__timing_bucket_low(j), h.buckets[j])
+                        for j in range(128) if h.buckets[j]],
+        }
+        stats[__timing_name(i).decode()] = entry
+    stats["connect"]["retries"] = __connect_retries()
+    return stats
+
+
+def reset_timing_stats():
+    __reset_timing_stats()
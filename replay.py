@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+import time
+import socket
+import signal
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from splitters import split_messages
+
+
+def load_session(path) -> List[bytearray]:
+    """
+    读取 save_interesting_test_case 写出的 AFLNet 兼容 .raw 文件
+    格式: [4字节长度(小端)][数据][4字节长度][数据]...
+    末尾不完整的记录按剩余字节处理
+    """
+    with open(path, 'rb') as f:
+        buf = f.read()
+
+    messages = []
+    view = memoryview(buf)
+    pos = 0
+    while pos + 4 <= len(buf):
+        length = int.from_bytes(view[pos:pos + 4], byteorder='little', signed=False)
+        pos += 4
+        messages.append(bytearray(view[pos:pos + length]))
+        pos += length
+    return messages
+
+
+def save_session(messages, path):
+    """按 .raw 格式写出会话，与 Fuzzer.save_interesting_test_case 相同"""
+    with open(path, 'wb') as f:
+        for msg in messages:
+            f.write(len(msg).to_bytes(4, byteorder='little', signed=False))
+            f.write(msg)
+
+
+def server_cmd_for_port(server_cmd: List[str], port: int, naccept: Optional[int] = None) -> List[str]:
+    """
+    把端口代入服务器命令（"@@" 占位符，否则按 openssl 追加 -port），
+    并把 -naccept 改为本批次的会话数，让服务器在处理完后正常退出（写出 .gcda）
+    """
+    if "@@" in server_cmd:
+        cmd = [str(port) if arg == "@@" else arg for arg in server_cmd]
+    else:
+        cmd = server_cmd + ["-port", str(port)]
+
+    if naccept is not None and "-naccept" in cmd:
+        idx = cmd.index("-naccept") + 1
+        if idx < len(cmd):
+            cmd[idx] = str(naccept)
+    return cmd
+
+
+class SessionReplayer:
+    """
+    进程内的会话回放器，替代每个测试用例启动一次的 aflnet-replay。
+
+    每条消息发送后不再固定 sleep，而是自适应等待响应：
+      - 首字节等待上限为 max(min_wait, 4 * 平均响应延迟)，不超过 max_wait
+      - 收到数据后，连续 idle_gap 内没有新数据即认为响应结束
+      - 对端关闭 / 复位时立即结束当前会话
+    平均响应延迟用 EWMA 在所有会话间累积，因此同一个服务器上回放越多越快。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 4433,
+                 connect_timeout: float = 3.0, min_wait: float = 0.002,
+                 max_wait: float = 0.1, idle_gap: float = 0.002, udp: bool = False,
+                 unix_path: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.udp = udp
+        self.unix_path = unix_path  # unix:// 目标：连接该路径而不是 host:port
+        self.connect_timeout = connect_timeout
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.idle_gap = idle_gap
+        self.latency = max_wait / 4
+        self.sessions = 0
+
+    def connect(self) -> Optional[socket.socket]:
+        """连接服务器；服务器可能刚启动，在 connect_timeout 内重试"""
+        if self.udp:
+            # 数据报 socket 的 connect 只设置对端地址，不需要等待服务器
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect((self.host, self.port))
+            return sock
+
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            if self.unix_path:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                sock.connect(self.unix_path or (self.host, self.port))
+                return sock
+            except OSError:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(0.001)
+
+    def _recv_response(self, sock: socket.socket, first_wait: float) -> Tuple[bytes, bool]:
+        """读取一次响应，返回 (数据, 连接是否仍然可用)"""
+        chunks = []
+        start = time.monotonic()
+        sock.settimeout(first_wait)
+        while True:
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                break
+            except OSError:
+                # UDP 下为 ICMP port unreachable：服务器没有（或不再）监听
+                return b"".join(chunks), False
+
+            if not data and not self.udp:
+                return b"".join(chunks), False
+
+            if not chunks:
+                delay = time.monotonic() - start
+                self.latency = 0.875 * self.latency + 0.125 * delay
+            chunks.append(data)
+            sock.settimeout(self.idle_gap)
+
+        return b"".join(chunks), True
+
+    def replay(self, messages: Iterable[bytes]) -> Optional[List[bytes]]:
+        """
+        回放一个会话，返回响应列表（第 0 项为发送前已收到的数据，如 banner）
+        无法连接时返回 None
+        """
+        sock = self.connect()
+        if sock is None:
+            return None
+
+        self.sessions += 1
+        responses = []
+        try:
+            response, alive = self._recv_response(sock, self.min_wait)
+            responses.append(response)
+
+            for msg in messages:
+                if not alive:
+                    break
+                try:
+                    if self.udp:
+                        sock.send(msg)  # 每条消息一个数据报，保留消息边界
+                    else:
+                        sock.sendall(msg)
+                except OSError:
+                    break
+                first_wait = min(self.max_wait, max(self.min_wait, 4 * self.latency))
+                response, alive = self._recv_response(sock, first_wait)
+                responses.append(response)
+        finally:
+            sock.close()
+        return responses
+
+
+def replay_batch(test_files: List[Path], port: int, server_cmd: Optional[List[str]] = None,
+                 env: Optional[Dict[str, str]] = None, server_timeout: float = 3.0,
+                 replayer: Optional[SessionReplayer] = None) -> int:
+    """
+    在同一个服务器实例上依次回放多个会话。
+    若给出 server_cmd，则以 -naccept len(test_files) 启动服务器，全部回放后等待其退出
+    （gcov 在正常退出时才写 .gcda）；服务器中途退出（崩溃）时为剩余会话重新启动。
+    返回成功回放的会话数。
+    """
+    replayer = replayer or SessionReplayer(port=port)
+    replayer.port = port
+    replayed = 0
+    server = None
+
+    def start_server(count):
+        return subprocess.Popen(
+            server_cmd_for_port(server_cmd, port, count),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env
+        )
+
+    try:
+        for i, test_file in enumerate(test_files):
+            if server_cmd and (server is None or server.poll() is not None):
+                server = start_server(len(test_files) - i)
+
+            messages = load_session(test_file)
+            responses = replayer.replay(messages)
+            if responses is None and server is not None and server.poll() is not None:
+                # 服务器在上一个会话结束后才退出，重启后重试一次
+                server = start_server(len(test_files) - i)
+                responses = replayer.replay(messages)
+
+            if responses is not None:
+                replayed += 1
+    finally:
+        if server is not None:
+            try:
+                server.wait(timeout=server_timeout)
+            except subprocess.TimeoutExpired:
+                server.terminate()
+                server.wait()
+
+    return replayed
+
+
+def describe_exit(returncode: Optional[int]) -> str:
+    if returncode is None:
+        return "still running"
+    if returncode < 0:
+        return f"killed by {signal.Signals(-returncode).name}"
+    return f"exited with {returncode}"
+
+
+# python3 replay.py ./out/crash_test_cases/id:000001.raw --port 4433 --server-cmd "/path/to/server @@"
+def main():
+    parser = argparse.ArgumentParser(description="Replay .raw sessions against a network server")
+    parser.add_argument("files", nargs="+", help=".raw session files, or seed files with --protocol")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4433)
+    parser.add_argument("--udp", action="store_true", help="Send every message as one UDP datagram")
+    parser.add_argument("--unix", metavar="PATH", help="Connect to a unix socket instead of --host/--port")
+    parser.add_argument("--server-cmd", help="Start this server for every session and report how it exits")
+    parser.add_argument("--protocol", help="Split non-.raw files into messages like the fuzzer does for seeds")
+    parser.add_argument("--max-wait", type=float, default=0.1, help="Max seconds to wait for a response")
+    args = parser.parse_args()
+
+    server_cmd = args.server_cmd.split() if args.server_cmd else None
+    replayer = SessionReplayer(args.host, args.port, max_wait=args.max_wait, udp=args.udp, unix_path=args.unix)
+
+    for path in args.files:
+        if args.protocol and not path.endswith(".raw"):
+            messages = split_messages(args.protocol, Path(path).read_bytes(), args.udp)
+        else:
+            messages = load_session(path)
+        server = None
+        if server_cmd:
+            server = subprocess.Popen(server_cmd_for_port(server_cmd, args.port, 1),
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        responses = replayer.replay(messages)
+        status = ""
+        if server is not None:
+            try:
+                server.wait(timeout=replayer.connect_timeout)
+            except subprocess.TimeoutExpired:
+                server.terminate()
+                server.wait()
+            status = f", server {describe_exit(server.returncode)}"
+
+        if responses is None:
+            print(f"{path}: connection failed{status}")
+            continue
+        print(f"{path}: {len(messages)} messages, {len(responses) - 1} sent{status}")
+        for i, response in enumerate(responses):
+            print(f"  [{i}] {len(response)} bytes")
+
+
+if __name__ == "__main__":
+    main()
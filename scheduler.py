@@ -0,0 +1,120 @@
+import math
+import random
+from typing import List, Optional
+
+import numpy as np
+
+
+class FenwickTree:
+    """
+    前缀和树（binary indexed tree）：追加、单点修改、按前缀和查找都是 O(log n)。
+    权重用整数保存，反复修改不会累积浮点误差。
+    """
+
+    def __init__(self):
+        self._tree = [0]      # 下标从 1 开始，_tree[i] 为 (i - lowbit(i), i] 区间的和
+        self._values = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def total(self) -> int:
+        return self.prefix(len(self._values))
+
+    def prefix(self, n: int) -> int:
+        """前 n 个值的和"""
+        s = 0
+        while n:
+            s += self._tree[n]
+            n -= n & -n
+        return s
+
+    def append(self, value: int) -> int:
+        i = len(self._tree)
+        low = i & -i
+        self._tree.append(value + self.prefix(i - 1) - self.prefix(i - low))
+        self._values.append(value)
+        return i - 1
+
+    def set(self, idx: int, value: int) -> None:
+        delta = value - self._values[idx]
+        if not delta:
+            return
+        self._values[idx] = value
+        i = idx + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def find(self, target: int) -> int:
+        """前缀和第一次超过 target 的下标（0 <= target < total()）"""
+        pos = 0
+        mask = 1 << (len(self._values).bit_length() - 1) if self._values else 0
+        while mask:
+            nxt = pos + mask
+            if nxt < len(self._tree) and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            mask >>= 1
+        return pos
+
+
+class SeedScheduler:
+    """
+    按权重随机选择种子（"scheduler": "weighted"），代替按队列顺序轮转、再在 fuzz_one 中按概率跳过。
+
+    每个用例的权重在它被加入队列、重新评估 favored 以及被 fuzz 之后重新计算（O(log n)），
+    选择时在前缀和树上二分，不会访问权重低的用例：
+      favored ×5，还没被 fuzz 过 ×2，带来新边（hub == 2）×2，
+      深度每 8 层 +1 倍（最多 ×4），执行耗时相对平均值（×0.25 ~ ×4），
+      到达的最稀有响应状态执行次数越少越高（×1 ~ ×4）。
+    """
+
+    SCALE = 1000  # 权重乘以该值后取整
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self._rng = rng or random.Random()
+        self._tree = FenwickTree()
+        self._entries: List = []
+        self._index = {}  # id(用例) -> 下标
+
+    def __contains__(self, test_case):
+        return id(test_case) in self._index
+
+    @staticmethod
+    def weight(test_case, avg_exec_us: float, state_execs: Optional[np.ndarray] = None) -> float:
+        w = 1.0
+        if test_case.favored:
+            w *= 5
+        if not test_case.was_fuzzed:
+            w *= 2
+        if test_case.has_new_cov:
+            w *= 2
+        w *= 1 + min(test_case.depth, 24) / 8
+
+        if avg_exec_us and test_case.exec_us:
+            w *= min(max(avg_exec_us / test_case.exec_us, 0.25), 4)
+
+        if state_execs is not None and test_case.state_first:
+            rarest = min(int(state_execs[s]) if s < len(state_execs) else 0
+                         for s in test_case.state_first)
+            w *= min(max(4 / math.log10(rarest + 10), 1), 4)
+
+        return w
+
+    def _scaled(self, test_case, avg_exec_us, state_execs) -> int:
+        execs = np.frombuffer(state_execs, dtype="<u8") if state_execs is not None else None
+        return max(1, int(self.weight(test_case, avg_exec_us, execs) * self.SCALE))
+
+    def add(self, test_case, avg_exec_us: float, state_execs: Optional[bytes] = None) -> None:
+        """state_execs 为 pyafl.state_execs() 返回的 u64 数组"""
+        self._index[id(test_case)] = self._tree.append(self._scaled(test_case, avg_exec_us, state_execs))
+        self._entries.append(test_case)
+
+    def update(self, test_case, avg_exec_us: float, state_execs: Optional[bytes] = None) -> None:
+        idx = self._index.get(id(test_case))
+        if idx is not None:
+            self._tree.set(idx, self._scaled(test_case, avg_exec_us, state_execs))
+
+    def choose(self):
+        return self._entries[self._tree.find(self._rng.randrange(self._tree.total()))]
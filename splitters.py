@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import re
+import time
+import argparse
+from typing import Callable, Dict, Iterator, List
+
+# 切分器接口: 输入任意 bytes-like 对象，逐条产出指向原缓冲区的 memoryview（不复制数据）。
+# 数据末尾不完整的消息作为最后一条产出，空输入不产出任何消息。
+Splitter = Callable[[memoryview], Iterator[memoryview]]
+
+SPLITTERS: Dict[str, Splitter] = {}
+# 在数据报传输（udp://）上分帧方式不同的协议：每个数据报就是一条消息，没有长度前缀
+DATAGRAM_SPLITTERS: Dict[str, Splitter] = {}
+# 每种协议的一条典型消息，供 benchmark 拼出测试数据
+SAMPLES: Dict[str, bytes] = {}
+
+
+def register(*names: str, sample: bytes):
+    def wrap(splitter: Splitter) -> Splitter:
+        for name in names:
+            SPLITTERS[name] = splitter
+            SAMPLES[name] = sample
+        return splitter
+    return wrap
+
+
+def split_raw(view: memoryview) -> Iterator[memoryview]:
+    """未知协议：整个文件作为一条消息（原来的默认行为）"""
+    if len(view):
+        yield view
+
+
+def delimited(delim: bytes) -> Splitter:
+    """以 delim 结尾的消息（FTP/SMTP 的 \\r\\n 命令行、逐行协议）"""
+    pattern = re.compile(re.escape(delim))
+
+    def split(view: memoryview) -> Iterator[memoryview]:
+        pos = 0
+        # re 直接在 memoryview 上查找，不需要先转成 bytes
+        for m in pattern.finditer(view):
+            yield view[pos:m.end()]
+            pos = m.end()
+        if pos < len(view):
+            yield view[pos:]
+    return split
+
+
+_HEADER_END = re.compile(rb"\r\n\r\n")
+_CONTENT_LENGTH = re.compile(rb"^(?:content-length|l)[ \t]*:[ \t]*(\d+)", re.IGNORECASE | re.MULTILINE)
+
+
+def header_body(with_body: bool) -> Splitter:
+    """
+    文本头部以 \\r\\n\\r\\n 结束的请求（RTSP/HTTP/SIP）。
+    with_body 时按 Content-Length（SIP 紧凑形式为 l:）把消息体并入同一条消息。
+    """
+    def split(view: memoryview) -> Iterator[memoryview]:
+        pos = 0
+        while pos < len(view):
+            m = _HEADER_END.search(view, pos)
+            if not m:
+                break
+            end = m.end()
+            if with_body:
+                length = _CONTENT_LENGTH.search(view, pos, m.start() + 2)
+                if length:
+                    end = min(end + int(length.group(1)), len(view))
+            yield view[pos:end]
+            pos = end
+        if pos < len(view):
+            yield view[pos:]
+    return split
+
+
+def length_prefixed(offset: int, size: int, header: int, byteorder: str = "big") -> Splitter:
+    """
+    定长头部中带长度字段的记录：长度字段位于 offset 处、占 size 字节，
+    表示头部（header 字节）之后的数据长度。TLS 记录为 (3, 2, 5)，TCP 上的 DNS 为 (0, 2, 2)。
+    """
+    def split(view: memoryview) -> Iterator[memoryview]:
+        pos = 0
+        while pos + header <= len(view):
+            length = int.from_bytes(view[pos + offset:pos + offset + size], byteorder)
+            end = pos + header + length
+            if end > len(view):
+                break
+            yield view[pos:end]
+            pos = end
+        if pos < len(view):
+            yield view[pos:]
+    return split
+
+
+def _dns_name_end(view: memoryview, pos: int) -> int:
+    """域名结束后的位置：标签序列以 0 结尾，或以 2 字节的压缩指针结尾"""
+    while pos < len(view):
+        n = view[pos]
+        if not n:
+            return pos + 1
+        if n & 0xC0 == 0xC0:
+            return pos + 2
+        pos += 1 + n
+    return pos + 1
+
+
+def split_dns_datagrams(view: memoryview) -> Iterator[memoryview]:
+    """
+    UDP 上的 DNS：数据报之间没有长度前缀，按头部的 QDCOUNT/ANCOUNT/NSCOUNT/ARCOUNT
+    逐个跳过问题和资源记录来确定每条消息的结尾。
+    """
+    pos = 0
+    while pos + 12 <= len(view):
+        qdcount, an, ns, ar = (int.from_bytes(view[pos + i:pos + i + 2], "big") for i in (4, 6, 8, 10))
+        end = pos + 12
+        for i in range(qdcount + an + ns + ar):
+            end = _dns_name_end(view, end)
+            if i < qdcount:
+                end += 4                   # QTYPE, QCLASS
+            elif end + 10 <= len(view):
+                end += 10 + int.from_bytes(view[end + 8:end + 10], "big")  # TYPE ... RDLENGTH, RDATA
+            else:
+                end += 10
+            if end > len(view):
+                break
+        if end > len(view):
+            break
+        yield view[pos:end]
+        pos = end
+    if pos < len(view):
+        yield view[pos:]
+
+
+register("RAW", sample=b"\x00" * 64)(split_raw)
+register("TLS", sample=bytes.fromhex("16030100") + b"\x2c" + b"\x01" * 44)(length_prefixed(3, 2, 5))
+register("DNS", sample=b"\x00\x1d" + bytes.fromhex("abcd01000001000000000000") +
+         b"\x07example\x03com\x00\x00\x01\x00\x01")(length_prefixed(0, 2, 2))
+DATAGRAM_SPLITTERS["DNS"] = split_dns_datagrams
+register("LEN16", sample=b"\x00\x10" + b"A" * 16)(length_prefixed(0, 2, 2))
+register("LEN32", sample=b"\x00\x00\x00\x20" + b"A" * 32)(length_prefixed(0, 4, 4))
+register("FTP", sample=b"USER anonymous\r\n")(delimited(b"\r\n"))
+register("SMTP", sample=b"MAIL FROM:<user@example.com>\r\n")(delimited(b"\r\n"))
+register("LINE", sample=b"GET /index\n")(delimited(b"\n"))
+register("RTSP", sample=b"OPTIONS rtsp://127.0.0.1:8554/wavAudioTest RTSP/1.0\r\nCSeq: 1\r\n\r\n")(
+    header_body(False))
+register("HTTP", sample=b"POST /form HTTP/1.1\r\nHost: localhost\r\nContent-Length: 7\r\n\r\na=1&b=2")(
+    header_body(True))
+register("SIP", sample=b"OPTIONS sip:user@127.0.0.1 SIP/2.0\r\nCSeq: 1 OPTIONS\r\nl: 4\r\n\r\nv=0\n")(
+    header_body(True))
+
+
+def get_splitter(protocol: str, datagram: bool = False) -> Splitter:
+    """
+    按配置中的 protocol 选择切分器，不认识的协议整体作为一条消息。
+    datagram 为 True（use_net 为 udp://）时优先使用 DATAGRAM_SPLITTERS 中的分帧方式。
+    """
+    name = str(protocol).upper()
+    if datagram and name in DATAGRAM_SPLITTERS:
+        return DATAGRAM_SPLITTERS[name]
+    return SPLITTERS.get(name, split_raw)
+
+
+def split_messages(protocol: str, buf, datagram: bool = False) -> List[bytearray]:
+    """切分并复制为可变异的 bytearray 列表"""
+    return [bytearray(m) for m in get_splitter(protocol, datagram)(memoryview(buf))]
+
+
+def bench(names: List[str], size_mb: float = 16.0, rounds: int = 3):
+    print(f"{'protocol':<8} {'messages':>10} {'MB/s':>10} {'msgs/s':>14}")
+    for name in names:
+        splitter, sample = SPLITTERS[name], SAMPLES[name]
+        buf = sample * max(1, int(size_mb * 1024 * 1024) // len(sample))
+        best = float("inf")
+        count = 0
+        for _ in range(rounds):
+            start = time.perf_counter()
+            count = sum(1 for _ in splitter(memoryview(buf)))
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:<8} {count:>10} {len(buf) / best / 1e6:>10.1f} {count / best:>14.0f}")
+
+
+# python3 splitters.py --bench
+# python3 splitters.py HTTP ./in/seed.txt
+def main():
+    parser = argparse.ArgumentParser(description="Split seed files into protocol messages")
+    parser.add_argument("protocol", nargs="?", help=f"One of: {', '.join(SPLITTERS)}")
+    parser.add_argument("files", nargs="*", help="Seed files to split")
+    parser.add_argument("--udp", action="store_true", help="Split as datagrams (use_net is udp://)")
+    parser.add_argument("--bench", action="store_true", help="Measure splitter throughput on synthetic streams")
+    parser.add_argument("--size", type=float, default=16.0, help="Benchmark stream size in MB")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench([args.protocol.upper()] if args.protocol else list(SPLITTERS), args.size)
+        return
+
+    for path in args.files:
+        with open(path, 'rb') as f:
+            messages = split_messages(args.protocol, f.read(), args.udp)
+        print(f"{path}: {len(messages)} messages")
+        for i, msg in enumerate(messages):
+            print(f"  [{i}] {len(msg)} bytes  {bytes(msg[:32])!r}")
+
+
+if __name__ == "__main__":
+    main()
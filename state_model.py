@@ -0,0 +1,89 @@
+import math
+import random
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class StateModel:
+    """
+    基于响应码的协议状态模型（对应 AFLNet 的 state-aware 模式）。
+
+    响应码的提取、状态 id 的分配和每个状态的执行次数都在 C 侧完成（见 state_extract），
+    这里只在保存新用例时读取一次状态序列，按到达的状态索引队列中的用例；
+    调度时偏向执行次数少、被选中次数少、但曾经带来新路径的状态，
+    并把变异窗口限制在到达该状态之后的消息上。
+    """
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self._rng = rng or random.Random()
+        self.seeds: Dict[int, List] = defaultdict(list)   # 状态 id -> 到达该状态的用例
+        self.selected: Dict[int, int] = defaultdict(int)  # 状态被选为目标的次数
+        self.paths: Dict[int, int] = defaultdict(int)     # 以该状态为目标时发现的新用例数
+        self._next_seed: Dict[int, int] = defaultdict(int)
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def add(self, test_case, seq: bytes):
+        """
+        seq 为 pyafl.state_seq() 返回的 (状态 id, 消息下标) 序列。
+        记录每个状态第一次出现在哪条消息的响应里，初始状态 0 视为在第一条消息之前到达。
+        对已经加入过的用例（如 trim 之后）重新建立它的索引。
+        """
+        pairs = np.frombuffer(seq, dtype="<u4").reshape(-1, 2)
+        first = {0: -1}
+        for state, msg in pairs.tolist():
+            first.setdefault(state, msg)
+
+        old = test_case.state_first
+        test_case.state_first = first
+        for state in first:
+            if state not in old:
+                self.seeds[state].append(test_case)
+        for state in old:
+            if state not in first:
+                self.seeds[state].remove(test_case)
+                if not self.seeds[state]:
+                    del self.seeds[state]
+
+    def state_score(self, state: int, execs: int) -> float:
+        """与 AFLNet 的 FAVOR 打分相同：执行/选中越少、发现的路径越多，分数越高"""
+        selected = self.selected[state]
+        return (1000 * 2 ** (-math.log10(math.log10(execs + 1) * selected + 1))
+                * 2 ** math.log(self.paths[state] + 1))
+
+    def choose_state(self, state_execs: bytes) -> Optional[int]:
+        """state_execs 为 pyafl.state_execs() 返回的 u64 数组"""
+        if not self.seeds:
+            return None
+        execs = np.frombuffer(state_execs, dtype="<u8")
+        states = list(self.seeds)
+        weights = [self.state_score(s, int(execs[s]) if s < len(execs) else 0) for s in states]
+        state = self._rng.choices(states, weights)[0]
+        self.selected[state] += 1
+        return state
+
+    def choose_seed(self, state: int):
+        """到达该状态的用例中轮流选择，优先 favored 用例"""
+        seeds = self.seeds[state]
+        favored = [tc for tc in seeds if tc.favored]
+        pool = favored or seeds
+        idx = self._next_seed[state] % len(pool)
+        self._next_seed[state] = idx + 1
+        return pool[idx]
+
+    def window(self, test_case, state: int) -> Tuple[int, int]:
+        """
+        变异的消息范围 [start, end)：从到达目标状态后发送的第一条消息开始，
+        保留到达该状态的前缀不变。
+        """
+        n = len(test_case.messages)
+        start = min(test_case.state_first.get(state, -1) + 1, n - 1)
+        end = self._rng.randint(start + 1, n)
+        return start, end
+
+    def record_path(self, state: Optional[int]):
+        if state is not None:
+            self.paths[state] += 1
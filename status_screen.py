@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+
+from rich.console import Console, Group
+from rich.live import Live
+from rich.panel import Panel
+from rich.table import Table
+from rich.box import ROUNDED
+import humanize
+
+import pyafl
+
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values) -> str:
+    """把一组数值渲染成单行 sparkline"""
+    if not values:
+        return ""
+    top = max(values) or 1
+    return "".join(SPARK_CHARS[min(int(v / top * (len(SPARK_CHARS) - 1)), len(SPARK_CHARS) - 1)]
+                   for v in values)
+
+
+def fmt_since(now, ts) -> str:
+    if not ts:
+        return "none seen yet"
+    return humanize.precisedelta(now - ts, minimum_unit="seconds", format="%0.0f")
+
+
+class StatusSnapshot:
+    """
+    状态界面使用的只读快照。
+    由界面线程直接读取 fuzzer 上的计数器生成，fuzz 循环不需要做任何额外工作。
+    """
+
+    def __init__(self, fuzzer):
+        stats = fuzzer.stats
+        self.time = time.time()
+        self.start_time = fuzzer.start_time
+        self.total_exec = stats.total_exec
+        self.queue_cycle = stats.queue_cycle
+        self.queue_len = len(fuzzer.queue)
+        self.cur_path = fuzzer.current_queue_idx
+        self.favor_paths = stats.favor_paths
+        self.pending_favored = fuzzer.pending_favored
+        self.unique_crashes = stats.unique_crashes
+        self.unique_hangs = stats.unique_hangs
+        self.last_path_time = stats.last_path_time
+        self.last_crash_time = stats.last_crash_time
+        self.last_hang_time = stats.last_hang_time
+        self.max_depth = stats.max_depth
+        self.stage_name = stats.stage_name
+        self.stage_finds = dict(stats.stage_finds)
+        self.stage_cycles = dict(stats.stage_cycles)
+        self.bitmap_cvg, self.stability = fuzzer.get_bitmap_stats()
+        self.timing = pyafl.get_timing_stats()
+
+
+class StatusScreen:
+    """
+    类似 AFL show_stats 的实时状态界面（基于 rich.live）。
+
+    渲染在独立的守护线程中进行，刷新频率不超过 refresh_hz（默认 4 Hz），
+    终端 I/O 不会阻塞或拖慢 fuzz 循环。
+    """
+
+    def __init__(self, fuzzer, refresh_hz: float = 4, history: int = 60):
+        self.fuzzer = fuzzer
+        self.interval = 1.0 / min(refresh_hz, 4)
+        self.eps_history = deque(maxlen=history)
+        self.console = Console()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="pyafl-status", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        with Live(console=self.console, auto_refresh=False, transient=False) as live:
+            while not self._stop.is_set():
+                live.update(self.render(StatusSnapshot(self.fuzzer)), refresh=True)
+                self._stop.wait(self.interval)
+
+    def _update_speed(self, snap: StatusSnapshot) -> float:
+        eps = 0.0
+        if self._last:
+            elapsed = snap.time - self._last.time
+            if elapsed > 0:
+                eps = (snap.total_exec - self._last.total_exec) / elapsed
+        self._last = snap
+        self.eps_history.append(eps)
+        return eps
+
+    def render(self, snap: StatusSnapshot):
+        eps = self._update_speed(snap)
+        avg_eps = sum(self.eps_history) / len(self.eps_history)
+
+        overview = Table.grid(padding=(0, 2))
+        overview.add_column(style="bold cyan", justify="right")
+        overview.add_column()
+        overview.add_column(style="bold cyan", justify="right")
+        overview.add_column()
+        overview.add_row("run time", fmt_since(snap.time, snap.start_time),
+                         "cycles done", str(snap.queue_cycle))
+        overview.add_row("last new path", fmt_since(snap.time, snap.last_path_time),
+                         "total paths", str(snap.queue_len))
+        overview.add_row("last uniq crash", fmt_since(snap.time, snap.last_crash_time),
+                         "uniq crashes", f"[red]{snap.unique_crashes}[/red]" if snap.unique_crashes else "0")
+        overview.add_row("last uniq hang", fmt_since(snap.time, snap.last_hang_time),
+                         "uniq hangs", str(snap.unique_hangs))
+        overview.add_row("now processing", f"{snap.cur_path} ({snap.stage_name})",
+                         "favored paths", str(snap.favor_paths))
+        overview.add_row("map density", f"{snap.bitmap_cvg:0.02f}%",
+                         "pending favs", str(snap.pending_favored))
+        overview.add_row("stability", f"{snap.stability:0.02f}%",
+                         "levels", str(snap.max_depth))
+        overview.add_row("exec speed", f"{eps:0.1f}/sec (avg {avg_eps:0.1f})",
+                         "total execs", humanize.intcomma(snap.total_exec))
+        overview.add_row("", f"[green]{sparkline(list(self.eps_history))}[/green]", "", "")
+
+        stages = Table(box=ROUNDED, header_style="bold magenta", title="stage yields")
+        stages.add_column("stage")
+        stages.add_column("finds", justify="right")
+        stages.add_column("execs", justify="right")
+        for stage in sorted(snap.stage_cycles):
+            stages.add_row(str(stage), str(snap.stage_finds.get(stage, 0)),
+                           humanize.intcomma(snap.stage_cycles[stage]))
+
+        timing = Table(box=ROUNDED, header_style="bold magenta", title="exec time breakdown")
+        timing.add_column("phase")
+        timing.add_column("mean", justify="right")
+        timing.add_column("p90", justify="right")
+        timing.add_column("share", justify="right")
+        total_us = sum(h["total_us"] for h in snap.timing.values()) or 1
+        for phase, h in snap.timing.items():
+            timing.add_row(phase, f"{h['mean_us'] / 1000:0.2f} ms", f"{h['p90_us'] / 1000:0.2f} ms",
+                           f"{h['total_us'] * 100 / total_us:0.1f}%")
+
+        detail = Table.grid(padding=(0, 2))
+        detail.add_row(stages, timing)
+
+        return Panel(Group(overview, detail),
+                     title=f"[bold]pyafl ({self.fuzzer.config.get('name', '')})[/bold]",
+                     border_style="blue")
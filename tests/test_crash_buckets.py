@@ -0,0 +1,47 @@
+import json
+
+from crash_buckets import CrashBuckets
+
+
+def _index(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_buckets_by_hash_signal_and_message(tmp_path):
+    path = str(tmp_path / "crash_index.json")
+    buckets = CrashBuckets(path)
+    assert buckets.hit(0xabc, 11, 2) is None
+
+    first = buckets.add("crashes/id:000000", 0xabc, 11, 2, 100)
+    assert not buckets.dirty
+    index = _index(path)
+    assert index["buckets"] == 1 and index["crashes"] == 1
+    assert index["entries"][0] == dict(index["entries"][0], file="id:000000", trace_hash="00000abc",
+                                       signal=11, last_msg=2, count=1, first_exec=100)
+
+    assert buckets.hit(0xabc, 11, 2) is first
+    assert buckets.hit(0xabc, 11, 2) is first
+    assert first.count == 3 and buckets.dirty
+    # 信号或消息下标不同的是新的桶
+    assert buckets.hit(0xabc, 6, 2) is None
+    assert buckets.hit(0xabc, 11, 3) is None
+    assert buckets.hit(0xabd, 11, 2) is None
+    assert len(buckets) == 1
+
+
+def test_write_index_flushes_counts(tmp_path):
+    path = str(tmp_path / "crash_index.json")
+    buckets = CrashBuckets(path)
+    buckets.add("crashes/a", 1, 11, 0, 5)
+    buckets.add("crashes/b", 2, 6, 1, 9)
+    buckets.hit(1, 11, 0)
+
+    # 计数只在 write_index 时写入
+    assert _index(path)["crashes"] == 2
+    buckets.write_index()
+    assert not buckets.dirty
+    index = _index(path)
+    assert index["buckets"] == 2 and index["crashes"] == 3
+    assert [e["count"] for e in index["entries"]] == [2, 1]
+    assert not (tmp_path / "crash_index.json.tmp").exists()
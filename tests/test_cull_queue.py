@@ -0,0 +1,74 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyafl")
+
+from Fuzzer import Fuzzer
+from scheduler import SeedScheduler
+
+
+def _case(mini_hash, exec_us, was_fuzzed=0):
+    return SimpleNamespace(trace_mini_hash=mini_hash, exec_us=exec_us, messages_len=10, favored=0,
+                           was_fuzzed=was_fuzzed, has_new_cov=0, depth=0, state_first={})
+
+
+def _fuzzer():
+    fuzzer = SimpleNamespace(top_rated={}, pending_favored=0, stats=SimpleNamespace(favor_paths=0),
+                             scheduler=SeedScheduler(random.Random(0)), total_cal_us=0, cal_cycles=0)
+    fuzzer.update_weight = lambda tc: Fuzzer.update_weight(fuzzer, tc)
+    return fuzzer
+
+
+@pytest.fixture(autouse=True)
+def _state_execs(monkeypatch):
+    monkeypatch.setattr("Fuzzer.pyafl.state_execs", lambda: None, raising=False)
+
+
+def _cull(fuzzer, tc):
+    flags = Fuzzer.cull_queue(fuzzer, tc)
+    fuzzer.update_weight(tc)
+    return flags
+
+
+def test_displaced_entry_is_unfavored():
+    fuzzer = _fuzzer()
+    slow, fast = _case(1, 200), _case(1, 100)
+    assert _cull(fuzzer, slow)
+    assert slow.favored and fuzzer.pending_favored == 1
+    slow_weight = SeedScheduler.weight(slow, 0)
+
+    assert _cull(fuzzer, fast)
+    assert fuzzer.top_rated[1] is fast
+    assert fast.favored and not slow.favored
+    assert fuzzer.pending_favored == 1 and fuzzer.stats.favor_paths == 1
+    # 被替换的用例按新的 favored 重新计算了权重
+    idx = fuzzer.scheduler._index[id(slow)]
+    assert fuzzer.scheduler._tree._values[idx] == int(slow_weight / 5 * SeedScheduler.SCALE)
+
+
+def test_slower_entry_does_not_displace():
+    fuzzer = _fuzzer()
+    fast, slow = _case(1, 100, was_fuzzed=1), _case(1, 200)
+    _cull(fuzzer, fast)
+    assert not _cull(fuzzer, slow)
+    assert fast.favored and not slow.favored
+    assert fuzzer.pending_favored == 0 and fuzzer.stats.favor_paths == 1
+
+
+def test_recull_after_hash_change():
+    fuzzer = _fuzzer()
+    a = _case(1, 200)
+    _cull(fuzzer, a)
+
+    # 重新校准后 a 的 hash 变为 2，并成为 2 的 top_rated：已经 favored，不重复计数
+    a.trace_mini_hash = 2
+    assert _cull(fuzzer, a)
+    assert fuzzer.pending_favored == 1 and fuzzer.stats.favor_paths == 1
+
+    # 在旧 key 上被替换时，a 仍是 2 的 top_rated，保持 favored
+    b = _case(1, 100)
+    _cull(fuzzer, b)
+    assert a.favored and b.favored
+    assert fuzzer.pending_favored == 2 and fuzzer.stats.favor_paths == 2
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from utils import Extra, ExtrasStore, load_extras_file, parse_extra_line
+
+DICT = b"""# comment
+
+kw_user="USER"
+kw_pass = "PASS \\x00\\x7f"
+"\\"quoted\\" \\\\"
+deep@2="LEVEL2"
+shallow@1="LEVEL1"
+"""
+
+
+def _load(tmp_path, buf=DICT, **kwargs):
+    path = tmp_path / "test.dict"
+    path.write_bytes(buf)
+    return [e.data for e in load_extras_file(str(path), cache_dir=str(tmp_path / "cache"), **kwargs)]
+
+
+def test_parse_line():
+    assert parse_extra_line('name="a\\x41\\\\"', 0) == b"aA\\"
+    assert parse_extra_line('  "x y"  ', 0) == b"x y"
+    assert parse_extra_line("# nope", 0) is None
+    assert parse_extra_line("n@3=\"v\"", 2) is None
+    assert parse_extra_line("n@3=\"v\"", 3) == b"v"
+
+
+@pytest.mark.parametrize("line", ['name=value', 'name="unterminated', '"a\\q"', '"tab\there"', '1abc="x"'])
+def test_parse_line_errors(line):
+    with pytest.raises(ValueError):
+        parse_extra_line(line, 0)
+
+
+def test_load_levels_and_sorted_by_length(tmp_path):
+    assert _load(tmp_path) == [b"USER", b"PASS \x00\x7f", b'"quoted" \\']
+    assert sorted(_load(tmp_path, dict_level=2)) == sorted(
+        [b"USER", b"PASS \x00\x7f", b'"quoted" \\', b"LEVEL2", b"LEVEL1"])
+
+
+def test_load_reports_line_number(tmp_path):
+    with pytest.raises(ValueError, match="line 3"):
+        _load(tmp_path, b'"a"\n\nbad\n')
+    with pytest.raises(ValueError, match="too big"):
+        _load(tmp_path, b'"abcdef"\n', max_dict_file=4)
+
+
+def test_cache_is_used_and_keyed_by_content(tmp_path):
+    first = _load(tmp_path)
+    cached = list((tmp_path / "cache").iterdir())
+    assert len(cached) == 1
+    assert _load(tmp_path) == first
+
+    # 不同的 dict_level 和不同的内容各自使用新的缓存
+    _load(tmp_path, dict_level=2)
+    assert _load(tmp_path, b'"new"\n') == [b"new"]
+    assert len(list((tmp_path / "cache").iterdir())) == 3
+
+
+@pytest.mark.parametrize("junk", [b"", b"PYAFLDX1", b"PYAFLDX1\xff\xff\xff\xff", b"PYAFLDX1\x01\x00\x00\x00\x05\x00\x00\x00ab"])
+def test_corrupt_cache_is_reparsed(tmp_path, junk):
+    first = _load(tmp_path)
+    (cache_file,) = (tmp_path / "cache").iterdir()
+    cache_file.write_bytes(junk)
+    assert _load(tmp_path) == first
+
+
+def test_without_cache_dir(tmp_path):
+    path = tmp_path / "test.dict"
+    path.write_bytes(DICT)
+    assert len(load_extras_file(str(path), cache_dir=None)) == 3
+
+
+def test_store_count_fits():
+    store = ExtrasStore(Extra(b"x" * n) for n in (5, 1, 3, 3, 8))
+    assert [e.len for e in store] == [1, 3, 3, 5, 8]
+    assert [store.count_fits(n) for n in (-1, 0, 1, 2, 3, 4, 5, 7, 8, 100)] == [0, 0, 1, 1, 3, 3, 4, 4, 5, 5]
+
+
+def test_store_choose_respects_max_len():
+    store = ExtrasStore(Extra(b"x" * n) for n in (2, 4, 6))
+    rng = random.Random(0)
+    assert store.choose(rng, 1) is None
+    assert {store.choose(rng, 5).len for _ in range(200)} == {2, 4}
+    assert ExtrasStore().choose(rng) is None
+
+
+def test_store_choose_prefers_hits():
+    a, b = Extra(b"aaaa"), Extra(b"bbbb")
+    a.hit = 10
+    store = ExtrasStore([a, b])
+    rng = random.Random(1)
+    draws = 4000
+    # 两个候选中保留 hit 较高的：b 只有两次都抽到 b 时才会被选中
+    share = sum(store.choose(rng) is a for _ in range(draws)) / draws
+    assert abs(share - 0.75) < 0.03
@@ -0,0 +1,106 @@
+import http.client
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyafl")
+
+import metrics
+from metrics import MetricsExporter
+
+
+# 各阶段的直方图：样本 3us、4us ×2、8us、12us（C 端桶下界分别为 3、4、8、12）
+TIMING = {
+    phase: {
+        "count": 5,
+        "total_us": 31,
+        "buckets": [(3, 1), (4, 2), (8, 1), (12, 1)],
+    }
+    for phase in ("fork", "connect", "send")
+}
+TIMING["connect"]["retries"] = 7
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+def _fuzzer():
+    stats = SimpleNamespace(total_exec=1234, queue_len=5, queue_cycle=2, favor_paths=3,
+                            unique_crashes=1, unique_hangs=0, total_crashes=4, total_tmouts=6)
+    return SimpleNamespace(stats=stats, queue=[object()] * 5, pending_favored=1,
+                           last_eps=99.5, start_time=time.time())
+
+
+def _scrape(conn):
+    conn.request("GET", "/metrics")
+    resp = conn.getresponse()
+    assert resp.status == 200
+    assert resp.getheader("Content-Type").startswith("text/plain; version=0.0.4")
+    body = resp.read().decode()
+    conn.close()
+    return dict(line.rsplit(" ", 1) for line in body.splitlines() if not line.startswith("#"))
+
+
+def _check(samples):
+    assert samples["pyafl_execs_total"] == "1234"
+    assert samples["pyafl_queue_cycle"] == "2"
+    assert samples["pyafl_crashes_total"] == "4"
+    assert samples["pyafl_paths_total"] == "5"
+    assert samples["pyafl_connect_retries_total"] == "7"
+
+    # le 为 2^k - 1 us 且包含边界：le=3us 含 3us 的样本，le=7us 再加上两个 4us 的样本
+    bucket = 'pyafl_exec_phase_seconds_bucket{phase="fork",le="%s"}'
+    assert samples[bucket % "1e-06"] == "0"
+    assert samples[bucket % "3e-06"] == "1"
+    assert samples[bucket % "7e-06"] == "3"
+    assert samples[bucket % "1.5e-05"] == "5"
+    assert samples[bucket % "+Inf"] == "5"
+    assert samples['pyafl_exec_phase_seconds_count{phase="send"}'] == "5"
+    assert samples['pyafl_exec_phase_seconds_sum{phase="send"}'] == "3.1e-05"
+
+
+@pytest.fixture(autouse=True)
+def _timing(monkeypatch):
+    monkeypatch.setattr(metrics.pyafl, "get_timing_stats", lambda: TIMING)
+
+
+def test_scrape_tcp():
+    exporter = MetricsExporter(_fuzzer(), "tcp://127.0.0.1/0")
+    exporter.start()
+    try:
+        port = exporter.server.server_address[1]
+        _check(_scrape(http.client.HTTPConnection("127.0.0.1", port, timeout=5)))
+    finally:
+        exporter.stop()
+
+
+def test_scrape_unix(tmp_path):
+    path = str(tmp_path / "pyafl.sock")
+    exporter = MetricsExporter(_fuzzer(), "unix://" + path)
+    exporter.start()
+    try:
+        _check(_scrape(_UnixHTTPConnection(path)))
+    finally:
+        exporter.stop()
+
+
+def test_unknown_path():
+    exporter = MetricsExporter(_fuzzer(), "tcp://127.0.0.1/0")
+    exporter.start()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", exporter.server.server_address[1], timeout=5)
+        conn.request("GET", "/nope")
+        assert conn.getresponse().status == 404
+        conn.close()
+    finally:
+        exporter.stop()
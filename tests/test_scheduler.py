@@ -0,0 +1,83 @@
+import itertools
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+from scheduler import FenwickTree, SeedScheduler
+
+
+def _case(**kwargs):
+    fields = dict(favored=0, was_fuzzed=1, has_new_cov=0, depth=0, exec_us=100, state_first={})
+    fields.update(kwargs)
+    return SimpleNamespace(**fields)
+
+
+def test_fenwick_against_prefix_sums():
+    rng = random.Random(1)
+    tree = FenwickTree()
+    values = []
+
+    for step in range(600):
+        value = rng.randint(0, 50)
+        assert tree.append(value) == len(values)
+        values.append(value)
+        if step % 3 == 0:
+            idx = rng.randrange(len(values))
+            values[idx] = rng.randint(0, 20)
+            tree.set(idx, values[idx])
+
+        if step % 50 == 0 or step == 599:
+            acc = list(itertools.accumulate(values))
+            assert len(tree) == len(values)
+            assert tree.total() == acc[-1]
+            for n in range(len(values) + 1):
+                assert tree.prefix(n) == (acc[n - 1] if n else 0)
+            for target in range(tree.total()):
+                idx = tree.find(target)
+                assert acc[idx] > target
+                assert idx == 0 or acc[idx - 1] <= target
+
+
+def test_fenwick_find_skips_zero_weights():
+    tree = FenwickTree()
+    for value in (0, 3, 0, 0, 2, 0):
+        tree.append(value)
+    assert [tree.find(t) for t in range(tree.total())] == [1, 1, 1, 4, 4]
+
+
+def test_choose_is_proportional_to_weight():
+    favored, plain, new_cov = _case(favored=1), _case(), _case(has_new_cov=1)
+    sched = SeedScheduler(random.Random(7))
+    for case in (favored, plain, new_cov):
+        sched.add(case, 100)
+
+    draws = 40000
+    counts = Counter(id(sched.choose()) for _ in range(draws))
+    # 权重 5 : 1 : 2
+    for case, share in ((favored, 5 / 8), (plain, 1 / 8), (new_cov, 2 / 8)):
+        assert abs(counts[id(case)] / draws - share) < 0.02
+
+
+def test_update_changes_share():
+    a, b = _case(favored=1), _case()
+    sched = SeedScheduler(random.Random(3))
+    sched.add(a, 100)
+    sched.add(b, 100)
+
+    a.favored = 0
+    sched.update(a, 100)
+
+    draws = 20000
+    hits = sum(sched.choose() is a for _ in range(draws))
+    assert abs(hits / draws - 0.5) < 0.02
+
+
+def test_weight_factors():
+    assert SeedScheduler.weight(_case(), 100) == 1
+    assert SeedScheduler.weight(_case(was_fuzzed=0), 100) == 2
+    assert SeedScheduler.weight(_case(depth=8), 100) == 2
+    # 比平均快 / 慢的用例，系数限制在 [0.25, 4]
+    assert SeedScheduler.weight(_case(exec_us=10), 100) == 4
+    assert SeedScheduler.weight(_case(exec_us=200), 100) == 0.5
+    # 到达从未执行过的状态
+    assert SeedScheduler.weight(_case(state_first={3: 0}), 100, [5, 5, 5, 0]) == 4
@@ -0,0 +1,107 @@
+import pytest
+
+from splitters import get_splitter, split_messages
+
+
+def _split(protocol, buf):
+    return [bytes(m) for m in split_messages(protocol, buf)]
+
+
+@pytest.mark.parametrize("protocol", ["TLS", "DNS", "LEN16", "LEN32", "FTP", "HTTP", "SIP", "RAW"])
+def test_empty_input(protocol):
+    assert _split(protocol, b"") == []
+
+
+def test_unknown_protocol_is_one_message():
+    assert _split("nope", b"a\r\nb\r\n") == [b"a\r\nb\r\n"]
+
+
+def test_delimited_keeps_delimiter_and_tail():
+    assert _split("FTP", b"USER a\r\nPASS b\r\nQUI") == [b"USER a\r\n", b"PASS b\r\n", b"QUI"]
+
+
+def test_length_prefixed_records():
+    rec1 = b"\x16\x03\x01\x00\x03abc"
+    rec2 = b"\x17\x03\x03\x00\x01z"
+    assert _split("TLS", rec1 + rec2) == [rec1, rec2]
+
+
+def test_length_prefixed_zero_length_record():
+    empty = b"\x00\x00"
+    rec = b"\x00\x02hi"
+    assert _split("LEN16", empty + rec + empty) == [empty, rec, empty]
+
+
+def test_length_prefixed_truncated_record():
+    rec = b"\x00\x02hi"
+    # 长度字段超出剩余数据：剩余部分整体作为最后一条
+    assert _split("LEN16", rec + b"\x00\x09abc") == [rec, b"\x00\x09abc"]
+    # 剩余数据不足一个头部
+    assert _split("LEN32", b"\x00\x00\x00\x01x" + b"\x00\x00") == [b"\x00\x00\x00\x01x", b"\x00\x00"]
+    assert _split("TLS", b"\x16\x03") == [b"\x16\x03"]
+
+
+def test_header_without_body():
+    req = b"OPTIONS rtsp://h/ RTSP/1.0\r\nCSeq: 1\r\n\r\n"
+    assert _split("RTSP", req * 2 + b"PLAY") == [req, req, b"PLAY"]
+
+
+def test_content_length_body_spans_header_end():
+    body = b"a\r\n\r\nb"
+    req = b"POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+    nxt = b"GET / HTTP/1.1\r\n\r\n"
+    assert _split("HTTP", req + nxt) == [req, nxt]
+
+
+def test_sip_compact_length():
+    body = b"v=0\r\n\r\n"
+    msg = b"INVITE sip:u@h SIP/2.0\r\nl: %d\r\n\r\n" % len(body) + body
+    assert _split("SIP", msg + msg) == [msg, msg]
+
+
+def test_content_length_only_read_from_own_header():
+    # 消息体里的 Content-Length 不影响下一条消息的切分
+    first = b"POST / HTTP/1.1\r\nContent-Length: 19\r\n\r\nContent-Length: 99\n"
+    second = b"GET / HTTP/1.1\r\n\r\n"
+    assert _split("HTTP", first + second) == [first, second]
+
+
+def test_content_length_past_end_is_clamped():
+    req = b"POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\nshort"
+    assert _split("HTTP", req) == [req]
+
+
+def test_splitter_returns_views_into_buffer():
+    buf = bytearray(b"A\nB\n")
+    views = list(get_splitter("LINE")(memoryview(buf)))
+    buf[0] = ord("Z")
+    assert [bytes(v) for v in views] == [b"Z\n", b"B\n"]
+
+
+QUERY = bytes.fromhex("abcd01000001000000000000") + b"\x07example\x03com\x00\x00\x01\x00\x01"
+ANSWER = (bytes.fromhex("abcd81800001000100000000") + b"\x07example\x03com\x00\x00\x01\x00\x01"
+          + b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x7f\x00\x00\x01")
+
+
+def test_dns_over_tcp_uses_length_prefix():
+    framed = len(QUERY).to_bytes(2, "big") + QUERY
+    assert _split("DNS", framed * 2) == [framed, framed]
+
+
+def test_dns_datagrams():
+    assert split_messages("dns", QUERY + ANSWER + QUERY, datagram=True) == [QUERY, ANSWER, QUERY]
+    # 只有头部的消息
+    header = bytes(12)
+    assert split_messages("DNS", header + QUERY, datagram=True) == [header, QUERY]
+
+
+def test_dns_datagram_truncated():
+    assert split_messages("DNS", QUERY + ANSWER[:-3], datagram=True) == [QUERY, ANSWER[:-3]]
+    assert split_messages("DNS", QUERY + b"\xab\xcd", datagram=True) == [QUERY, b"\xab\xcd"]
+    # 记录数远大于实际数据
+    bogus = b"\x00\x00\x00\x00\xff\xff" + bytes(6) + b"\x01a\x00"
+    assert split_messages("DNS", bogus, datagram=True) == [bogus]
+
+
+def test_datagram_without_own_framing_falls_back():
+    assert split_messages("FTP", b"A\r\nB\r\n", datagram=True) == [b"A\r\n", b"B\r\n"]
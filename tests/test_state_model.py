@@ -0,0 +1,106 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+
+from state_model import StateModel
+
+
+def _case(n_msgs=4, favored=0):
+    return SimpleNamespace(state_first={}, favored=favored, messages=[b""] * n_msgs)
+
+
+def _seq(*pairs):
+    return np.array(pairs, dtype="<u4").tobytes()
+
+
+def _execs(*counts):
+    return np.array(counts, dtype="<u8").tobytes()
+
+
+def test_add_records_first_message_per_state():
+    model = StateModel()
+    tc = _case()
+    model.add(tc, _seq((3, 0), (5, 1), (3, 2), (7, 2)))
+    assert tc.state_first == {0: -1, 3: 0, 5: 1, 7: 2}
+    assert {s: model.seeds[s] for s in (0, 3, 5, 7)} == {0: [tc], 3: [tc], 5: [tc], 7: [tc]}
+    assert len(model) == 4
+
+
+def test_add_empty_sequence_reaches_initial_state():
+    model = StateModel()
+    tc = _case()
+    model.add(tc, b"")
+    assert tc.state_first == {0: -1}
+    assert model.seeds[0] == [tc]
+
+
+def test_readd_reindexes_without_duplicates():
+    model = StateModel()
+    a, b = _case(), _case()
+    model.add(a, _seq((3, 0), (5, 1)))
+    model.add(b, _seq((5, 0)))
+
+    # trim 之后 a 不再到达 5，改为到达 9
+    model.add(a, _seq((3, 0), (9, 1)))
+    assert a.state_first == {0: -1, 3: 0, 9: 1}
+    assert model.seeds[0] == [a, b]
+    assert model.seeds[3] == [a]
+    assert model.seeds[5] == [b]
+    assert model.seeds[9] == [a]
+
+    model.add(a, _seq((3, 0), (9, 1)))
+    assert model.seeds[3] == [a] and model.seeds[9] == [a]
+
+    # 只有 a 到达的状态在 a 不再到达后被删除
+    model.add(a, b"")
+    assert 3 not in model.seeds and 9 not in model.seeds
+    assert set(model.seeds) == {0, 5}
+
+
+def test_choose_state_prefers_rare_states():
+    model = StateModel(random.Random(5))
+    tc = _case()
+    model.add(tc, _seq((1, 0), (2, 1)))
+    execs = _execs(10 ** 6, 10 ** 6, 1)
+    picks = [model.choose_state(execs) for _ in range(300)]
+    assert picks.count(2) > picks.count(1)
+    assert sum(model.selected.values()) == 300
+
+
+def test_choose_state_empty():
+    assert StateModel().choose_state(_execs()) is None
+
+
+def test_state_score():
+    model = StateModel()
+    assert model.state_score(1, 0) == 1000
+    model.selected[1] = 3
+    rare, common = model.state_score(1, 10), model.state_score(1, 10 ** 6)
+    assert rare > common
+    model.record_path(1)
+    assert model.state_score(1, 10) > rare
+    model.record_path(None)
+    assert dict(model.paths) == {1: 1}
+
+
+def test_choose_seed_round_robin_favored_first():
+    model = StateModel()
+    a, b, c = _case(), _case(favored=1), _case(favored=1)
+    for tc in (a, b, c):
+        model.add(tc, _seq((4, 0)))
+    assert [model.choose_seed(4) for _ in range(4)] == [b, c, b, c]
+    b.favored = c.favored = 0
+    assert len({id(model.choose_seed(4)) for _ in range(3)}) == 3
+
+
+def test_window_starts_after_state_is_reached():
+    model = StateModel(random.Random(2))
+    tc = _case(n_msgs=5)
+    model.add(tc, _seq((6, 1), (8, 4)))
+    for _ in range(50):
+        start, end = model.window(tc, 6)
+        assert start == 2 and start < end <= 5
+        assert model.window(tc, 0)[0] == 0
+        # 在最后一条消息才到达的状态仍至少保留一条可变异的消息
+        assert model.window(tc, 8) == (4, 5)
@@ -0,0 +1,148 @@
+import json
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Sequence, Tuple
+
+import pyafl
+from cmin import worker_config
+from replay import load_session, save_session
+
+
+# 与 FaultCode 一致
+FAULT_NONE = 0
+FAULT_TMOUT = 1
+FAULT_CRASH = 2
+
+
+_exec_tmout = 0
+
+
+def _init_worker(worker_configs):
+    """每个进程启动自己的 fork server（端口 / AFL 工作目录按 worker 编号区分）"""
+    global _exec_tmout
+    pyafl.parse_args(json.dumps(worker_configs.get()))
+    pyafl.set_up()
+    _exec_tmout = pyafl.get_exec_tmout()
+
+
+def _reproduce(messages: List[bytes]) -> Tuple[int, int]:
+    """执行一次会话，返回 (fault, 简化后的 trace hash)"""
+    pyafl.pre_run_target(_exec_tmout)
+    pyafl.get_response_buff()
+    for msg in messages:
+        pyafl.run_target(bytes(msg))
+        pyafl.get_response_buff()
+    fault = pyafl.post_run_target(_exec_tmout)
+
+    pyafl.simplify_trace_bits()
+    return fault, pyafl.trace_hash32()
+
+
+class SessionMinimizer:
+    """
+    网络会话版的 afl-tmin：先按消息、再按字节做块删除（delta debugging），
+    只保留仍能复现相同 fault（可选：相同简化 trace hash）的修改。
+
+    候选会话在 jobs 个 fork server 上并行执行：每轮同时尝试 jobs 个删除位置，
+    采用位置最靠前的成功结果，其余结果丢弃。
+    """
+
+    def __init__(self, config: dict, jobs: int = 1, exact_trace: bool = False):
+        self.jobs = max(1, jobs)
+        self.exact_trace = exact_trace
+        self.execs = 0
+
+        ctx = multiprocessing.get_context("spawn")
+        self.worker_configs = [worker_config(config, w) for w in range(self.jobs)]
+        queue = ctx.Queue()
+        for worker_conf in self.worker_configs:
+            queue.put(worker_conf)
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, mp_context=ctx,
+                                        initializer=_init_worker, initargs=(queue,))
+        self.fault = None
+        self.cksum = None
+
+    def close(self):
+        self.pool.shutdown()
+        for worker_conf in self.worker_configs:
+            shutil.rmtree(worker_conf["afl_dir"], ignore_errors=True)
+
+    def _first_reproducing(self, sessions: List[List[bytearray]]) -> int:
+        results = list(self.pool.map(_reproduce, sessions))
+        self.execs += len(sessions)
+        for idx, (fault, cksum) in enumerate(results):
+            if fault == self.fault and (not self.exact_trace or cksum == self.cksum):
+                return idx
+        return -1
+
+    def _delete_blocks(self, seq: Sequence, to_session: Callable[[Sequence], List[bytearray]],
+                       min_len: int) -> Sequence:
+        """对 seq（消息列表或单条消息的字节）做块删除，块大小从 len/2 逐次减半到 1"""
+        block = max(len(seq) // 2, 1)
+        while block >= 1:
+            pos = 0
+            while pos < len(seq):
+                positions = list(range(pos, len(seq), block))[:self.jobs]
+                candidates = [seq[:p] + seq[p + block:] for p in positions]
+                if len(candidates[0]) < min_len:
+                    break
+
+                idx = self._first_reproducing([to_session(c) for c in candidates])
+                if idx < 0:
+                    pos = positions[-1] + block
+                else:
+                    # 删除成功后后面的内容前移，从同一位置继续尝试
+                    seq = candidates[idx]
+                    pos = positions[idx]
+            block //= 2
+        return seq
+
+    def minimize(self, messages: List[bytearray]) -> List[bytearray]:
+        self.fault, self.cksum = self.pool.submit(_reproduce, messages).result()
+        self.execs += 1
+        if self.fault not in (FAULT_CRASH, FAULT_TMOUT):
+            raise ValueError("Session does not crash or hang; nothing to minimize")
+
+        # 1. 消息级
+        messages = self._delete_blocks(messages, list, 1)
+
+        # 2. 字节级，逐条消息
+        for i in range(len(messages)):
+            def to_session(data, i=i):
+                return messages[:i] + [data] + messages[i + 1:]
+            messages[i] = self._delete_blocks(messages[i], to_session, 1)
+
+        return messages
+
+
+# python3 main.py tmin ./configs/openssl.json ./out/crash_test_cases/id:000000.raw -o min.raw -j 4
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py tmin",
+                                     description="Minimize a crashing or hanging .raw session")
+    parser.add_argument("config", help="Path to the configuration JSON file")
+    parser.add_argument("input", help=".raw session that crashes or hangs the target")
+    parser.add_argument("-o", "--output", help="Minimized session (default: <input>.min)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Parallel fork servers (worker w uses use_net port + w)")
+    parser.add_argument("--exact-trace", action="store_true",
+                        help="Also require the same simplified trace hash as the original run")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    messages = load_session(args.input)
+    before = sum(len(m) for m in messages), len(messages)
+
+    minimizer = SessionMinimizer(config, args.jobs, args.exact_trace)
+    try:
+        messages = minimizer.minimize(messages)
+    finally:
+        minimizer.close()
+
+    output = args.output or args.input + ".min"
+    save_session(messages, output)
+    print(f"{before[1]} messages / {before[0]} bytes -> {len(messages)} messages / "
+          f"{sum(len(m) for m in messages)} bytes in {minimizer.execs} execs, saved to {output}")
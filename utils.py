@@ -4,8 +4,10 @@ import time
 from datetime import datetime
 
 
+import os
 import re,struct
-from typing import List, Tuple, Optional
+import hashlib
+from typing import Iterable, List, Tuple, Optional
 
 class PcapGenerator:
     def __init__(self, src_ip='192.168.1.100', dst_ip='192.168.1.101',
@@ -155,100 +157,175 @@ class Extra:
         self.hit = 0
 
 
+class ExtrasStore:
+    """
+    按长度排序的 extras。
+
+    fits[n] 记录长度 <= n 的条目个数，排序后这些条目正好是前 fits[n] 个，
+    因此“能放进长度为 n 的消息”的抽取是 O(1) 的，不会再抽到过长的条目后白白返回。
+    抽取时随机取两个候选，保留 hit 较高的一个，让带来过新路径的条目更常被使用。
+    """
 
+    def __init__(self, extras: Iterable[Extra] = ()):
+        self.extras = sorted(extras, key=lambda e: e.len)
+        self.max_len = self.extras[-1].len if self.extras else 0
 
+        self.fits = [0] * (self.max_len + 1)
+        for extra in self.extras:
+            self.fits[extra.len] += 1
+        for n in range(1, self.max_len + 1):
+            self.fits[n] += self.fits[n - 1]
 
+    def __len__(self):
+        return len(self.extras)
 
-import re
-from typing import Optional
+    def __iter__(self):
+        return iter(self.extras)
 
-def parse_extra_line(line: str, dict_level: int) -> Optional[bytes]:
+    def count_fits(self, max_len: int) -> int:
+        """长度不超过 max_len 的条目个数"""
+        if max_len >= self.max_len:
+            return len(self.extras)
+        return self.fits[max_len] if max_len >= 0 else 0
+
+    def choose(self, rng, max_len: Optional[int] = None) -> Optional[Extra]:
+        n = len(self.extras) if max_len is None else self.count_fits(max_len)
+        if not n:
+            return None
+        a = self.extras[rng.randrange(n)]
+        b = self.extras[rng.randrange(n)]
+        return a if a.hit >= b.hit else b
+
+
+# 一行一个条目: [name][@level][=]"value"，name 可省略（与 afl-fuzz 的 load_extras_file 一致）
+_EXTRA_LINE = re.compile(
+    rb'([a-zA-Z_][a-zA-Z0-9_\-]*)?'   # 可选的标签名
+    rb'(@\d+)?'                       # 可选的 @level 部分
+    rb'[ \t]*=?[ \t]*'                # 等号，前后允许空格
+    rb'"((?:[^"\\]|\\.)*)"'           # 引号内的值，支持转义
+)
+_EXTRA_ESCAPE = re.compile(rb'\\(x[0-9a-fA-F]{2}|.)')
+_EXTRA_BAD_CHAR = re.compile(rb'[^\x20-\x7f]')
+
+# 缓存: magic, 条目数, 各条目长度 (u32)，随后是拼接的数据
+_EXTRAS_CACHE_MAGIC = b"PYAFLDX1"
+_EXTRAS_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "pyafl")
+
+
+def _unescape_extra(m) -> bytes:
+    esc = m.group(1)
+    if esc == b'\\' or esc == b'"':
+        return esc
+    if len(esc) == 3:
+        return bytes((int(esc[1:], 16),))
+    raise ValueError(f"Unsupported escape: \\{esc.decode('latin-1')}")
+
+
+def _parse_extra(line: bytes, dict_level: int) -> Optional[bytes]:
     line = line.strip()
-    if not line or line.startswith('#'):
+    if not line or line.startswith(b'#'):
         return None
 
-    # 匹配 name[@level]="value" 格式
-    match = re.match(
-        r'^'                          # 行首
-        r'([a-zA-Z_][a-zA-Z0-9_\-]*)' # 标签名：以字母或下划线开头，后跟字母、数字、下划线、短横线
-        r'(@\d+)?'                    # 可选的 @level 部分
-        r'\s*=\s*'                    # 等号，前后允许空格
-        r'"((?:[^"\\]|\\.)*)"'        # 引号内的值，支持转义
-        r'$',
-        line
-    )
-
+    match = _EXTRA_LINE.fullmatch(line)
     if not match:
-        raise ValueError(f"Malformed line: {line}")
+        raise ValueError(f"Malformed line: {line.decode('latin-1')}")
 
     label, level_str, value = match.groups()
 
     # 如果有 level 限制，并且当前等级不够，则跳过该条目
-    if level_str:
-        level = int(level_str[1:])  # 去掉 '@'
-        if level > dict_level:
-            return None
+    if level_str and int(level_str[1:]) > dict_level:
+        return None
+
+    if _EXTRA_BAD_CHAR.search(value):
+        raise ValueError(f"Non-printable character in line: {line.decode('latin-1')}")
+
+    # 只有含反斜杠的值才需要处理转义
+    if b'\\' in value:
+        value = _EXTRA_ESCAPE.sub(_unescape_extra, value)
+    return value
+
+
+def parse_extra_line(line: str, dict_level: int) -> Optional[bytes]:
+    return _parse_extra(line.encode('latin-1'), dict_level)
 
-    # 处理转义字符
-    result = bytearray()
-    i = 0
-    while i < len(value):
-        c = value[i]
-        if c == '\\':
-            i += 1
-            if i >= len(value):
-                raise ValueError(f"Invalid escape at end of line: {line}")
-            next_c = value[i]
-            if next_c == '\\':
-                result.append(ord('\\'))
-            elif next_c == '"':
-                result.append(ord('"'))
-            elif next_c == 'x' and i + 2 < len(value):
-                hex_str = value[i+1:i+3]
-                if all(c in '0123456789abcdefABCDEF' for c in hex_str):
-                    result.append(int(hex_str, 16))
-                    i += 2
-                else:
-                    raise ValueError(f"Invalid hex escape in line: {line}")
-            else:
-                raise ValueError(f"Unsupported escape: \\{next_c} in line: {line}")
-        else:
-            if ord(c) < 32 or ord(c) >= 128:
-                raise ValueError(f"Non-printable character in line: {line}")
-            result.append(ord(c))
-        i += 1
 
-    return bytes(result)
+def _parse_extras(buf: bytes, dict_level: int, max_dict_file: int) -> List[bytes]:
+    extras = []
+    for line_num, line in enumerate(buf.split(b'\n'), start=1):
+        try:
+            parsed = _parse_extra(line, dict_level)
+        except ValueError as e:
+            raise ValueError(f"Error parsing line {line_num}: {e}")
+        if parsed is None:
+            continue
+        if len(parsed) > max_dict_file:
+            raise ValueError(f"Error parsing line {line_num}: Keyword too big, limit is {max_dict_file}")
+        extras.append(parsed)
+    return extras
+
+
+def _read_extras_cache(path: str) -> Optional[List[bytes]]:
+    try:
+        with open(path, 'rb') as f:
+            blob = f.read()
+    except OSError:
+        return None
 
+    if blob[:8] != _EXTRAS_CACHE_MAGIC or len(blob) < 12:
+        return None
+    count, = struct.unpack_from("<I", blob, 8)
+    pos = 12 + 4 * count
+    if pos > len(blob):
+        return None
+    lens = struct.unpack_from(f"<{count}I", blob, 12)
+    if pos + sum(lens) != len(blob):
+        return None
 
-def load_extras_file(fname: str, dict_level: int = 0, max_dict_file: int = 1024) -> List[Extra]:
+    extras = []
+    for n in lens:
+        extras.append(blob[pos:pos + n])
+        pos += n
+    return extras
+
+
+def _write_extras_cache(path: str, extras: List[bytes]):
+    blob = b"".join([_EXTRAS_CACHE_MAGIC, struct.pack(f"<I{len(extras)}I", len(extras), *map(len, extras))]
+                    + extras)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # 缓存目录不可写时每次重新解析
+
+
+def load_extras_file(fname: str, dict_level: int = 0, max_dict_file: int = 1024,
+                     cache_dir: Optional[str] = _EXTRAS_CACHE_DIR) -> ExtrasStore:
     """
     从指定文件中加载 extras 字典。
 
+    解析结果以二进制形式缓存在 cache_dir 下，以文件内容和解析参数的哈希为 key，
+    字典未改动时直接读取缓存；cache_dir 为 None 时不使用缓存。
+
     :param fname: 字典文件路径
     :param dict_level: 字典等级，用于筛选 @level 条目
     :param max_dict_file: 单个关键字最大长度限制
-    :return: 解析后的 extras 列表
+    :return: 按长度索引的 extras
     """
-    extras = []
+    with open(fname, 'rb') as f:
+        buf = f.read()
+
+    extras = None
+    if cache_dir:
+        key = hashlib.sha1(buf + f"\0{dict_level}\0{max_dict_file}".encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{key}.dict")
+        extras = _read_extras_cache(cache_path)
+
+    if extras is None:
+        extras = _parse_extras(buf, dict_level, max_dict_file)
+        if cache_dir:
+            _write_extras_cache(cache_path, extras)
 
-    with open(fname, "r", encoding="utf-8") as f:
-        for line_num, line in enumerate(f, start=1):
-            line = line.rstrip('\n')
-
-            # 去除前后空白 & 注释行
-            stripped = line.strip()
-            if not stripped or stripped.startswith('#'):
-                continue
-
-            try:
-                parsed = parse_extra_line(stripped, dict_level)
-                if parsed is None:
-                    continue
-                if len(parsed) > max_dict_file:
-                    raise ValueError(f"Keyword too big in line {line_num}, limit is {max_dict_file}")
-                extras.append(Extra(parsed))
-            except Exception as e:
-                raise ValueError(f"Error parsing line {line_num}: {e}")
-
-    return extras
\ No newline at end of file
+    return ExtrasStore(Extra(data) for data in extras)